@@ -1,11 +1,20 @@
 import streamlit as st
-import whisper
 import tempfile
 import os
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
 import numpy as np
-import json
+import pipeline
+import media_service
+import media_server
+import session_bundle
+import session_store
+import shadowing_ui
+import stats_ui
+import uploads
+import waveform
+from asr import get_model
+from review_scheduler import ReviewScheduler, item_id, score_dictation, quality_from_score, word_misses
+from stats_ui import get_practice_stats, log_play
+import random
 import time
 
 # 页面配置
@@ -58,10 +67,76 @@ if 'sentences' not in st.session_state:
     st.session_state.sentences = []
 if 'current_sentence' not in st.session_state:
     st.session_state.current_sentence = 0
-if 'audio_data' not in st.session_state:
-    st.session_state.audio_data = None
+if 'audio_info' not in st.session_state:
+    st.session_state.audio_info = None
 if 'transcripts' not in st.session_state:
     st.session_state.transcripts = []
+if 'source_path' not in st.session_state:
+    st.session_state.source_path = None
+if 'source_key' not in st.session_state:
+    st.session_state.source_key = None
+if 'cache_key' not in st.session_state:
+    st.session_state.cache_key = None
+if 'audio_name' not in st.session_state:
+    st.session_state.audio_name = ""
+if 'split_params' not in st.session_state:
+    st.session_state.split_params = None
+if 'imported_bundle' not in st.session_state:
+    st.session_state.imported_bundle = None
+if 'peaks' not in st.session_state:
+    st.session_state.peaks = None
+if 'review_skipped' not in st.session_state:
+    st.session_state.review_skipped = set()
+if 'audio_key' not in st.session_state:
+    st.session_state.audio_key = None
+if 'stats_session' not in st.session_state:
+    st.session_state.stats_session = session_store.new_session_id()  # 练习统计里区分不同会话
+if 'last_played' not in st.session_state:
+    st.session_state.last_played = None
+if 'scored_attempts' not in st.session_state:
+    st.session_state.scored_attempts = set()
+
+@st.cache_resource
+def get_whisper_model(name):
+    # 模型在所有会话间共享，只加载一次；用 warmup.py 启动时已在启动阶段加载好
+    return get_model(name)
+
+@st.cache_resource
+def get_review_scheduler():
+    # 所有会话共用一个实例（内部加锁），卡片按学习者（会话 id）区分
+    return ReviewScheduler()
+
+@st.cache_resource
+def get_session_store():
+    # 多进程部署时的外部会话存储，未配置 SHADOWING_SESSION_STORE 时为 None
+    return session_store.open_store()
+
+# 地址栏里的会话 id 区分学习者：复习队列按它保存，刷新或收藏地址后下次再来仍是同一份
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = session_store.resolve_session_id(st.query_params.get(session_store.QUERY_PARAM))
+    st.query_params[session_store.QUERY_PARAM] = st.session_state.session_id
+
+# 多进程部署：页面刷新或重连到另一个进程时，按会话 id 恢复会话
+store = get_session_store()
+if store is not None and 'saved_session' not in st.session_state:
+    saved = store.load(st.session_state.session_id)
+    if saved and saved["cache_key"]:
+        # 句子片段、原文、分析结果都按内容哈希从共享缓存读取，不重新计算
+        key = saved["cache_key"]
+        st.session_state.cache_key = key
+        st.session_state.audio_name = saved["audio_name"]
+        st.session_state.split_params = saved["split_params"]
+        st.session_state.sentences = pipeline.restore_sentences(key, saved["spans"], saved["codec"])
+        st.session_state.transcripts = saved["transcripts"]
+        st.session_state.current_sentence = saved["current_sentence"]
+        st.session_state.sentence_selector = saved["current_sentence"]
+        source = pipeline.find_source(key)
+        if source is not None:
+            st.session_state.source_path = source
+            st.session_state.source_key = key
+            st.session_state.audio_info, _ = pipeline.analyze(source, key)
+            st.session_state.peaks = pipeline.load_peaks(source, key)
+    st.session_state.saved_session = saved
 
 # 侧边栏 - 功能选择
 with st.sidebar:
@@ -69,16 +144,39 @@ with st.sidebar:
     
     # 断句设置
     st.subheader("断句参数")
+    segmenter = st.selectbox(
+        "断句方法",
+        list(pipeline.SEGMENTERS),
+        format_func=lambda name: pipeline.SEGMENTERS[name].label,
+        help="有背景音乐或环境噪声、按音量切不开句子时选语音活动检测"
+    )
     min_silence_len = st.slider("最小静音长度(ms)", 300, 1500, 500, 50)
-    silence_thresh = st.slider("静音阈值(dBFS)", -60, -20, -40, 5)
+    # 句子两端保留100ms静音
+    params = {"segmenter": segmenter, "min_silence_len": min_silence_len, "keep_silence": 100}
+    if segmenter == "vad":
+        params["speech_thresh"] = st.slider("语音判定阈值", 0.2, 0.8, 0.5, 0.05, help="越高越容易判为停顿，句子切得越碎")
+    else:
+        params["silence_thresh"] = st.slider("静音阈值(dBFS)", -60, -20, -40, 5)
+    
+    # 识别设置
+    st.subheader("原文识别")
+    use_asr = st.checkbox("断句后自动识别原文", value=False)
+    whisper_model = st.selectbox("Whisper 模型", ["tiny", "base", "small"], index=1, disabled=not use_asr)
     
     # 播放设置
     st.subheader("播放设置")
     repeat_count = st.selectbox("单句重复次数", [1, 2, 3, 5, 8], index=0)
     auto_pause = st.checkbox("句末自动暂停", value=True)
+    delivery_codec = st.selectbox(
+        "音频格式",
+        list(pipeline.DELIVERY_CODECS),
+        format_func=lambda codec: pipeline.DELIVERY_CODECS[codec]["label"],
+        help="Opus 体积约为 MP3 的四分之一，网络慢时推荐；旧版 Safari 请选 MP3"
+    )
     
     # 功能按钮
     st.subheader("功能操作")
+    include_clips = st.checkbox("导出时包含音频片段", value=False)
     col1, col2 = st.columns(2)
     with col1:
         if st.button("🎵 重置", use_container_width=True):
@@ -90,22 +188,66 @@ with st.sidebar:
     with col2:
         if st.button("💾 导出", use_container_width=True):
             if st.session_state.sentences:
-                # 创建导出数据
-                export_data = {
-                    "sentences": st.session_state.sentences,
-                    "transcripts": st.session_state.transcripts
-                }
+                # 会话包：句子起止、原文、听写内容（可选附带音频片段）
+                bundle = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+                session_bundle.write_bundle(
+                    bundle,
+                    st.session_state.sentences,
+                    st.session_state.transcripts,
+                    audio_name=st.session_state.audio_name,
+                    cache_key=st.session_state.cache_key,
+                    params=st.session_state.split_params,
+                    include_clips=include_clips
+                )
+                bundle.seek(0)
                 st.download_button(
-                    label="下载JSON",
-                    data=json.dumps(export_data, indent=2, ensure_ascii=False),
-                    file_name="listening_data.json",
-                    mime="application/json"
+                    label="下载会话",
+                    data=bundle.read(),
+                    file_name="listening_session.zip",
+                    mime="application/zip"
                 )
             else:
                 st.warning("没有可导出的数据")
+    
+    # 导入之前导出的会话，无需重新上传和断句
+    session_file = st.file_uploader("📥 导入会话", type=["zip"])
+    if session_file is not None and st.session_state.imported_bundle != session_file.file_id:
+        try:
+            restored = session_bundle.read_bundle(session_file)
+            st.session_state.sentences = restored["sentences"]
+            st.session_state.transcripts = restored["dictations"]
+            st.session_state.current_sentence = 0
+            st.session_state.cache_key = restored["cache_key"]
+            st.session_state.audio_name = restored["audio_name"]
+            st.session_state.split_params = restored["params"]
+            st.session_state.imported_bundle = session_file.file_id
+            st.session_state.peaks = None
+            st.success(f"✅ 已导入 {len(restored['sentences'])} 个句子")
+        except session_bundle.BundleError as e:
+            st.error(f"导入失败: {str(e)}")
+    
+    # ffmpeg 解码/编码队列状态
+    with st.expander("📈 服务状态"):
+        stats = media_service.get_service().stats()
+        st.caption(f"ffmpeg 任务: {stats['queued']} 排队 · {stats['running']}/{stats['max_workers']} 运行中 · 已完成 {stats['completed']}")
+        st.caption(f"等待 p50/p95: {stats['wait_p50_ms']:.0f}/{stats['wait_p95_ms']:.0f} ms")
+        st.caption(f"执行 p50/p95: {stats['run_p50_ms']:.0f}/{stats['run_p95_ms']:.0f} ms")
+
+# 切换音频格式后补导出当前句子的片段（每个片段每种格式只编码一次）
+if (st.session_state.sentences and st.session_state.split_params
+        and st.session_state.source_key == st.session_state.cache_key
+        and st.session_state.sentences[0].get("codec") != delivery_codec):
+    with st.spinner("正在转换音频格式..."):
+        st.session_state.sentences = pipeline.build_sentences(
+            st.session_state.cache_key,
+            st.session_state.source_path,
+            [(round(s['start_time'] * 1000), round(s['end_time'] * 1000)) for s in st.session_state.sentences],
+            st.session_state.split_params,
+            codec=delivery_codec
+        )
 
 # 主界面 - 两个标签页
-tab1, tab2 = st.tabs(["📁 上传与断句", "🎵 听写练习"])
+tab1, tab2, tab3, tab4 = st.tabs(["📁 上传与断句", "🎵 听写练习", "🎤 跟读练习", "📊 练习统计"])
 
 with tab1:
     col1, col2 = st.columns([1, 2])
@@ -124,33 +266,48 @@ with tab1:
             )
             
             if audio_file is not None:
-                # 保存临时文件
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-                    tmp_file.write(audio_file.getvalue())
-                    audio_path = tmp_file.name
+                # 同一文件只分析一次；批量预处理过的文件直接读缓存
+                if st.session_state.audio_key != audio_file.file_id:
+                    try:
+                        # 分块写入共享缓存并计算哈希，超出大小/时长上限的文件在解码前拒绝
+                        key, source = uploads.spool(audio_file)
+                        info, _ = pipeline.analyze(source, key, segmenter)
+                        
+                        st.session_state.source_path = source
+                        st.session_state.source_key = key
+                        st.session_state.cache_key = key
+                        st.session_state.audio_name = audio_file.name
+                        st.session_state.audio_info = info
+                        st.session_state.peaks = pipeline.load_peaks(source, key)
+                        st.session_state.audio_key = audio_file.file_id
+                        
+                        # 当前参数已有预处理结果时直接载入句子
+                        cached = pipeline.load_sentences(key, params, delivery_codec)
+                        if cached:
+                            st.session_state.sentences = cached
+                            st.session_state.transcripts = [""] * len(cached)
+                            st.session_state.current_sentence = 0
+                            st.session_state.split_params = params
+                    except Exception as e:
+                        st.error(f"音频加载失败: {str(e)}")
                 
-                try:
-                    # 加载音频
-                    audio = AudioSegment.from_file(audio_path)
-                    st.session_state.audio_data = audio
+                if st.session_state.audio_key == audio_file.file_id:
+                    info = st.session_state.audio_info
                     
                     # 显示音频信息
-                    duration = len(audio) / 1000  # 转换为秒
+                    duration = info["duration_ms"] / 1000  # 转换为秒
                     st.success(f"✅ 上传成功！")
                     st.info(f"**音频信息**: {audio_file.name}")
                     st.info(f"**时长**: {duration:.1f}秒")
-                    st.info(f"**采样率**: {audio.frame_rate}Hz")
-                    st.info(f"**声道**: {audio.channels}")
-                    
-                    # 播放完整音频
-                    st.audio(audio_file, format="audio/mp3")
+                    st.info(f"**采样率**: {info['frame_rate']}Hz")
+                    st.info(f"**声道**: {info['channels']}")
                     
-                except Exception as e:
-                    st.error(f"音频加载失败: {str(e)}")
-                finally:
-                    # 清理临时文件
-                    if os.path.exists(audio_path):
-                        os.unlink(audio_path)
+                    # 播放完整音频（opus 格式转码一次后缓存；页面里只放地址）
+                    with st.spinner("正在转码整段音频..."):
+                        full_path, full_mime = pipeline.delivery_file(
+                            st.session_state.source_key, st.session_state.source_path, delivery_codec
+                        )
+                    st.audio(media_server.url(full_path), format=full_mime)
         
         else:  # URL方式
             url = st.text_input("输入音频URL", placeholder="https://example.com/audio.mp3")
@@ -159,38 +316,35 @@ with tab1:
         
         # 断句按钮
         st.header("2. 智能断句")
-        if st.session_state.audio_data is not None:
+        if st.session_state.audio_info is not None:
+            # 在缓存的断句特征上预览断句结果，拖动参数即时更新
+            with st.spinner("正在分析音频..."):
+                info, features = pipeline.analyze(st.session_state.source_path, st.session_state.source_key, segmenter)
+            spans = pipeline.find_spans(info, features, params)
+            st.caption(f"按当前参数预计分割出 {len(spans)} 个句子")
+            
             if st.button("🔍 开始智能断句", use_container_width=True, type="primary"):
                 with st.spinner("正在分析音频并断句..."):
                     try:
-                        # 使用静音检测进行断句
-                        audio = st.session_state.audio_data
-                        chunks = split_on_silence(
-                            audio,
-                            min_silence_len=min_silence_len,
-                            silence_thresh=silence_thresh,
-                            keep_silence=100  # 保留100ms静音
-                        )
+                        model = get_whisper_model(whisper_model) if use_asr else None
                         
-                        # 保存断句结果
-                        st.session_state.sentences = []
-                        st.session_state.transcripts = []
-                        
-                        for i, chunk in enumerate(chunks):
-                            # 保存为临时文件用于播放
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-                                chunk.export(tmp.name, format="mp3")
-                                sentence_data = {
-                                    "id": i,
-                                    "audio_path": tmp.name,
-                                    "duration": len(chunk) / 1000,
-                                    "start_time": (chunk.start_time if hasattr(chunk, 'start_time') else 0),
-                                    "end_time": (chunk.end_time if hasattr(chunk, 'end_time') else 0)
-                                }
-                                st.session_state.sentences.append(sentence_data)
-                                st.session_state.transcripts.append("")  # 空白的听写区域
+                        # 片段导出到共享缓存，已导出过的句子直接复用；
+                        # 按上传文件自己的哈希存放，导入过别的会话时也不会写错条目
+                        st.session_state.sentences = pipeline.build_sentences(
+                            st.session_state.source_key,
+                            st.session_state.source_path,
+                            spans,
+                            params,
+                            model=model,
+                            codec=delivery_codec
+                        )
+                        st.session_state.cache_key = st.session_state.source_key
+                        st.session_state.peaks = pipeline.load_peaks(st.session_state.source_path, st.session_state.source_key)
+                        st.session_state.transcripts = [""] * len(spans)  # 空白的听写区域
+                        st.session_state.current_sentence = 0
+                        st.session_state.split_params = params
                         
-                        st.success(f"✅ 断句完成！共分割出 {len(chunks)} 个句子")
+                        st.success(f"✅ 断句完成！共分割出 {len(spans)} 个句子")
                         
                     except Exception as e:
                         st.error(f"断句失败: {str(e)}")
@@ -220,6 +374,19 @@ with tab1:
         if st.session_state.sentences:
             st.header("断句结果预览")
             
+            # 整段波形与句子边界，当前句子高亮
+            if st.session_state.peaks is not None:
+                st.vega_lite_chart(
+                    waveform.chart(
+                        st.session_state.peaks,
+                        0,
+                        st.session_state.audio_info["duration_ms"] / 1000,
+                        spans=[(s['start_time'], s['end_time']) for s in st.session_state.sentences],
+                        current=st.session_state.current_sentence
+                    ),
+                    use_container_width=True
+                )
+            
             # 句子导航
             cols = st.columns([2, 1, 1])
             with cols[0]:
@@ -253,14 +420,13 @@ with tab1:
             </div>
             """, unsafe_allow_html=True)
             
-            # 播放当前句子
+            # 播放当前句子（片段由媒体服务提供，浏览器会缓存）
             if os.path.exists(current['audio_path']):
-                with open(current['audio_path'], 'rb') as audio_file:
-                    audio_bytes = audio_file.read()
+                audio_url = media_server.url(current['audio_path'])
                 
                 # 重复播放控制
                 for i in range(repeat_count):
-                    st.audio(audio_bytes, format="audio/mp3")
+                    st.audio(audio_url, format=current.get('mime', "audio/mp3"))
                     if i < repeat_count - 1:
                         st.caption(f"重复播放 ({i+1}/{repeat_count})")
             
@@ -304,54 +470,118 @@ with tab1:
                     caption="高效英语精听练习")
 
 with tab2:
-    if st.session_state.sentences:
+    scheduler = get_review_scheduler()
+    # 难句复习的卡片自带文件哈希和起止时间，不需要先上传音频
+    if st.session_state.sentences or scheduler.count(st.session_state.session_id):
         st.header("🎯 听写练习模式")
+        total = len(st.session_state.sentences)
         
         # 练习设置
         col1, col2, col3 = st.columns(3)
         with col1:
-            practice_mode = st.selectbox("练习模式", ["顺序练习", "随机练习", "难句复习"])
+            modes = ["顺序练习", "随机练习", "难句复习"] if total else ["难句复习"]
+            practice_mode = st.selectbox("练习模式", modes)
         with col2:
             show_transcript = st.checkbox("显示原文", value=False)
         with col3:
             if st.button("开始练习", type="primary", use_container_width=True):
-                st.session_state.current_sentence = 0
+                st.session_state.current_sentence = random.randrange(total) if practice_mode == "随机练习" else 0
+                st.session_state.review_skipped = set()
         
-        # 练习界面
-        if st.session_state.sentences:
+        # 确定本次练习的句子：难句复习从全局复习队列里取最早到期的一句
+        review_info = None
+        if practice_mode == "难句复习":
+            card = scheduler.next_due(st.session_state.session_id, skip=st.session_state.review_skipped)
+            if card is None:
+                review_item = None
+                st.info(f"🎉 暂时没有到期的难句（复习库共 {scheduler.count(st.session_state.session_id)} 句），收藏难句或答错的句子会自动加入")
+            else:
+                review_item = card["item_id"]
+                audio_path, audio_mime = pipeline.find_clip(card["cache_key"], card["start_ms"], card["end_ms"], delivery_codec)
+                reference = card["reference"]
+                stats_info = card
+                st.caption(f"📚 {card['audio_name']} · {card['start_ms'] / 1000:.1f}s · 已复习 {card['repetitions']} 次")
+        else:
             current = st.session_state.sentences[st.session_state.current_sentence]
-            
+            start_ms = round(current['start_time'] * 1000)
+            end_ms = round(current['end_time'] * 1000)
+            review_item = item_id(st.session_state.cache_key, start_ms, end_ms)
+            audio_path = current['audio_path']
+            audio_mime = current.get('mime', "audio/mp3")
+            reference = current.get('transcript')
+            review_info = {
+                "cache_key": st.session_state.cache_key,
+                "start_ms": start_ms,
+                "end_ms": end_ms,
+                "audio_name": st.session_state.audio_name,
+                "reference": reference
+            }
+            stats_info = review_info
+        
+        # 练习界面
+        if review_item is not None:
             # 音频播放区域
-            st.audio(current['audio_path'], format="audio/mp3")
+            if audio_path is not None:
+                st.audio(media_server.url(audio_path), format=audio_mime)
+                log_play(review_item, stats_info)
+            else:
+                st.warning("这句的音频片段不在缓存里，重新上传原音频并断句后即可播放")
             
             # 听写输入
             user_input = st.text_area(
                 "听写内容",
                 height=100,
-                placeholder="在这里写下你听到的内容..."
+                placeholder="在这里写下你听到的内容...",
+                key=f"practice_{review_item}"
             )
             
+            # 没有原文时由用户自评
+            if not reference:
+                self_quality = st.select_slider(
+                    "自评掌握程度",
+                    options=[0, 1, 2, 3, 4, 5],
+                    value=3,
+                    help="0 完全没听出来，5 一字不差；低于 3 的句子会很快再次复习"
+                )
+            
             # 控制按钮
             col1, col2, col3 = st.columns(3)
             with col1:
                 if st.button("🔁 重新播放", use_container_width=True):
+                    get_practice_stats(st.session_state.session_id).record("play", st.session_state.stats_session, review_item, stats_info)
                     st.rerun()
             
             with col2:
                 if st.button("✅ 提交", type="primary", use_container_width=True):
-                    st.success("提交成功！")
-                    # 这里可以添加对比原文的功能
+                    if reference:
+                        score = score_dictation(reference, user_input)
+                        quality = quality_from_score(score)
+                        st.info(f"正确率: {score:.0%}")
+                    else:
+                        quality = self_quality
+                    card = scheduler.record(st.session_state.session_id, review_item, quality, review_info)
+                    stats = get_practice_stats(st.session_state.session_id)
+                    stats.record("submit", st.session_state.stats_session, review_item, stats_info, mode="dictation", quality=quality)
+                    if reference:
+                        words, missed = word_misses(reference, user_input)
+                        stats.record("score", st.session_state.stats_session, review_item, stats_info, score=round(score, 3), words=words, missed=missed)
+                    next_review = time.strftime("%m-%d %H:%M", time.localtime(card["due"]))
+                    st.success(f"提交成功！下次复习: {next_review}")
             
             with col3:
-                if st.button("➡️ 下一句", use_container_width=True):
-                    if st.session_state.current_sentence < len(st.session_state.sentences) - 1:
+                if st.button("➡️ 下一句", key="practice_next", use_container_width=True):
+                    if practice_mode == "难句复习":
+                        st.session_state.review_skipped.add(review_item)
+                    elif practice_mode == "随机练习":
+                        st.session_state.current_sentence = random.randrange(total)
+                    elif st.session_state.current_sentence < total - 1:
                         st.session_state.current_sentence += 1
                     st.rerun()
             
             # 显示原文（可选）
-            if show_transcript and 'transcript' in current:
+            if show_transcript and reference:
                 with st.expander("查看原文"):
-                    st.write(current.get('transcript', '暂无原文'))
+                    st.write(reference)
     
     else:
         st.info("请先上传音频并进行断句，然后开始听写练习")
@@ -364,6 +594,27 @@ with tab2:
         5. 重复练习难句
         """)
 
+with tab3:
+    shadowing_ui.render_shadowing_tab(get_practice_stats(st.session_state.session_id))
+
+with tab4:
+    stats_ui.render_stats_tab()
+
+# 保存会话数据供其他进程恢复，内容没变时不写
+if store is not None:
+    snapshot = {
+        "cache_key": st.session_state.cache_key,
+        "audio_name": st.session_state.audio_name,
+        "split_params": st.session_state.split_params,
+        "codec": st.session_state.sentences[0].get("codec", pipeline.DEFAULT_CODEC) if st.session_state.sentences else delivery_codec,
+        "spans": [[round(s['start_time'] * 1000), round(s['end_time'] * 1000)] for s in st.session_state.sentences],
+        "transcripts": list(st.session_state.transcripts),
+        "current_sentence": st.session_state.current_sentence
+    }
+    if snapshot != st.session_state.saved_session:
+        store.save(st.session_state.session_id, snapshot)
+        st.session_state.saved_session = snapshot
+
 # 底部信息
 st.markdown("---")
 st.markdown("""
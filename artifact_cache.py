@@ -0,0 +1,333 @@
+# artifact_cache.py - 按内容哈希存放的处理结果缓存
+#
+# 同一个音频文件（按 sha256 计）的分析音轨、能量包络、断句结果、句子片段和
+# 识别原文都放在 CACHE_DIR/<前两位>/<哈希>/ 目录下，批量预处理和网页端共用。
+#
+# get_or_create 保证同一产物在整台服务器上只计算一次：
+#   - 进程内：同一产物的并发请求排队等第一个计算完成（single-flight）
+#   - 进程间：用文件锁互斥，拿到锁后先检查其他进程是否已经写好
+# 最近用过的产物同时保存在进程内存里（按字节数做 LRU 淘汰）。
+#
+# 磁盘上的缓存默认放在 ~/.shadowing/cache（SHADOWING_CACHE_DIR 可改），重启后仍在。
+# 总大小超过 SHADOWING_CACHE_MAX_GB 时按最近使用时间整条淘汰：每次读写都会刷新条目
+# 目录的修改时间，新写入的数据累计到上限的 5% 时检查一次，删到上限的 90% 为止；
+# 一小时内用过的条目不删，避免删掉正在播放或处理的文件。
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只做进程内去重
+    fcntl = None
+
+CACHE_DIR = os.environ.get(
+    "SHADOWING_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".shadowing", "cache")
+)
+
+# 磁盘缓存上限(GB)，0 表示不限
+DISK_LIMIT = int(float(os.environ.get("SHADOWING_CACHE_MAX_GB", "20")) * 1024 ** 3)
+
+# 最近这么久(秒)用过的条目不淘汰
+EVICT_MIN_AGE = 60 * 60
+
+# 同一条目的使用时间最多每分钟刷新一次
+_TOUCH_INTERVAL = 60
+
+# 进程内缓存上限(MB)
+MEMORY_LIMIT = int(os.environ.get("SHADOWING_MEMORY_CACHE_MB", "512")) * 1024 * 1024
+
+_memory = OrderedDict()
+_memory_bytes = 0
+_memory_lock = threading.Lock()
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+_touched = {}
+_written = 0
+_disk_lock = threading.Lock()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """分块计算文件的 sha256，作为缓存键"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def entry_dir(key):
+    return os.path.join(CACHE_DIR, key[:2], key)
+
+
+def artifact_path(key, name):
+    return os.path.join(entry_dir(key), name)
+
+
+def has(key, name):
+    if os.path.exists(artifact_path(key, name)):
+        touch(key)
+        return True
+    return False
+
+
+def touch(key, now=None):
+    """记下条目刚被用过（刷新条目目录的修改时间），淘汰时最后才轮到它"""
+    now = time.time() if now is None else now
+    with _disk_lock:
+        if now - _touched.get(key, 0) < _TOUCH_INTERVAL:
+            return
+        if len(_touched) > 100000:
+            _touched.clear()
+        _touched[key] = now
+    try:
+        os.utime(entry_dir(key), (now, now))
+    except OSError:
+        pass
+
+
+def _entries():
+    """缓存里的所有条目 [(最近使用时间, 占用字节数, 目录), ...]"""
+    entries = []
+    for prefix in os.listdir(CACHE_DIR):
+        if len(prefix) != 2 or not os.path.isdir(os.path.join(CACHE_DIR, prefix)):
+            continue
+        for key in os.listdir(os.path.join(CACHE_DIR, prefix)):
+            directory = os.path.join(CACHE_DIR, prefix, key)
+            try:
+                used = os.stat(directory).st_mtime
+                size = sum(
+                    os.path.getsize(os.path.join(root, name))
+                    for root, _, names in os.walk(directory) for name in names
+                )
+            except OSError:  # 其他进程正在删除
+                continue
+            entries.append((used, size, directory))
+    return entries
+
+
+def evict(limit=None, min_age=None, now=None):
+    """缓存超过 limit 字节时，从最久没用过的条目开始删，直到不超过 limit 的 90%
+
+    返回删掉的字节数。多个进程同时检查时只有一个进程执行。
+    """
+    limit = DISK_LIMIT if limit is None else limit
+    min_age = EVICT_MIN_AGE if min_age is None else min_age
+    now = time.time() if now is None else now
+    if not limit or not os.path.isdir(CACHE_DIR):
+        return 0
+    with open(os.path.join(CACHE_DIR, ".evict.lock"), "a") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0
+        entries = sorted(_entries())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        if total <= limit:
+            return 0
+        for used, size, directory in entries:
+            if total - freed <= limit * 0.9 or now - used < min_age:
+                break
+            shutil.rmtree(directory, ignore_errors=True)
+            freed += size
+        return freed
+
+
+def account_write(nbytes):
+    """累计新写入缓存的字节数（不经 atomic_write 写入时由调用方报告），到上限的 5% 时检查一次是否需要淘汰"""
+    global _written
+    if not DISK_LIMIT:
+        return
+    with _disk_lock:
+        _written += nbytes
+        if _written < DISK_LIMIT // 20:
+            return
+        _written = 0
+    evict()
+
+
+def atomic_write(key, name, write):
+    """先写到同目录临时文件再改名，读者永远看不到写了一半的文件
+
+    write(tmp_path) 负责把内容写进临时文件。
+    """
+    directory = entry_dir(key)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(name)[1])
+    os.close(fd)
+    try:
+        write(tmp_path)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, artifact_path(key, name))
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    account_write(size)
+    return artifact_path(key, name)
+
+
+def read_json(key, name):
+    try:
+        with open(artifact_path(key, name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(key, name, data):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    return atomic_write(key, name, write)
+
+
+def read_array(key, name):
+    try:
+        return np.load(artifact_path(key, name), allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+
+
+def write_array(key, name, array):
+    def write(path):
+        with open(path, "wb") as f:
+            np.save(f, array, allow_pickle=False)
+    return atomic_write(key, name, write)
+
+
+def read_arrays(key, name):
+    """读取 write_arrays 保存的一组数组（.npz）"""
+    try:
+        with np.load(artifact_path(key, name), allow_pickle=False) as data:
+            return [data[f"arr_{i}"] for i in range(len(data.files))]
+    except (OSError, ValueError):
+        return None
+
+
+def write_arrays(key, name, arrays):
+    return atomic_write(key, name, lambda path: np.savez(path, *arrays))
+
+
+def _memory_get(ident):
+    with _memory_lock:
+        if ident not in _memory:
+            return None
+        _memory.move_to_end(ident)
+        return _memory[ident][0]
+
+
+def _memory_put(ident, value, size):
+    global _memory_bytes
+    if size > MEMORY_LIMIT:
+        return
+    with _memory_lock:
+        if ident in _memory:
+            _memory_bytes -= _memory.pop(ident)[1]
+        _memory[ident] = (value, size)
+        _memory_bytes += size
+        while _memory_bytes > MEMORY_LIMIT:
+            _, (_, evicted) = _memory.popitem(last=False)
+            _memory_bytes -= evicted
+
+
+@contextmanager
+def _single_flight(ident):
+    """同一产物在本进程内同时只允许一个线程计算"""
+    with _flights_lock:
+        flight = _flights.get(ident)
+        if flight is None:
+            flight = _flights[ident] = [threading.Lock(), 0]
+        flight[1] += 1
+    try:
+        with flight[0]:
+            yield
+    finally:
+        with _flights_lock:
+            flight[1] -= 1
+            if flight[1] == 0:
+                del _flights[ident]
+
+
+@contextmanager
+def _file_lock(key, name):
+    """跨进程互斥：多个 Streamlit/批处理进程共用同一缓存目录"""
+    directory = entry_dir(key)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f".{name}.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def exclusive(key, name):
+    """对某个产物名加进程内 + 跨进程的互斥锁，用于一次生成多个文件的场景"""
+    with _single_flight((key, name)), _file_lock(key, name):
+        yield
+
+
+def get_or_create(key, name, create, load, save, size=None):
+    """读取产物，不存在时调用 create() 计算并保存
+
+    load(key, name) 从磁盘读取（不存在返回 None），save(key, name, value) 写盘。
+    size(value) 返回占用字节数，用于内存缓存的淘汰。
+    """
+    ident = (key, name)
+    touch(key)
+    value = _memory_get(ident)
+    if value is not None:
+        return value
+
+    with _single_flight(ident):
+        # 排队期间可能已经有人算好了
+        value = _memory_get(ident)
+        if value is None:
+            value = load(key, name)
+        if value is None:
+            with _file_lock(key, name):
+                value = load(key, name)
+                if value is None:
+                    value = create()
+                    save(key, name, value)
+
+        if size is not None:
+            _memory_put(ident, value, size(value))
+        return value
+
+
+def get_json(key, name, create):
+    return get_or_create(
+        key, name, create, read_json, write_json,
+        size=lambda value: len(json.dumps(value))
+    )
+
+
+def get_array(key, name, create):
+    return get_or_create(
+        key, name, create, read_array, write_array,
+        size=lambda value: value.nbytes
+    )
+
+
+def get_arrays(key, name, create):
+    return get_or_create(
+        key, name, create, read_arrays, write_arrays,
+        size=lambda value: sum(array.nbytes for array in value)
+    )
@@ -0,0 +1,35 @@
+# asr.py - 基于 Whisper 的句子原文识别
+#
+# 直接把 16kHz 分析音轨的切片送入模型，省去 Whisper 自己调用 ffmpeg 重新解码。
+import threading
+
+import numpy as np
+
+from audio_io import track_slice
+
+DEFAULT_MODEL = "base"
+
+
+def load_model(name=DEFAULT_MODEL):
+    """加载 Whisper 模型（只在需要识别时才导入 whisper/torch）"""
+    import whisper
+    return whisper.load_model(name, device="cpu")
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(name=DEFAULT_MODEL):
+    """进程内共享的模型，同一模型只加载一次（启动预热和各个会话共用）"""
+    with _models_lock:
+        if name not in _models:
+            _models[name] = load_model(name)
+        return _models[name]
+
+
+def transcribe_span(model, track, start_ms, end_ms, language="en"):
+    """识别分析音轨中 [start_ms, end_ms) 这一段的文本"""
+    clip = track_slice(track, start_ms, end_ms).astype(np.float32) / 32768
+    result = model.transcribe(clip, language=language, fp16=False)
+    return result["text"].strip()
@@ -0,0 +1,12 @@
+# audio_io.py - 16kHz 单声道分析音轨
+#
+# 播放和导出片段用原始音质；断句、包络、语音识别只需要 16kHz 单声道，由 ffmpeg
+# 直接解码出 int16 分析音轨（见 media_service.decode_analysis），后续分析都在这条音轨上进行。
+
+# 分析音轨采样率（与 Whisper 输入一致）
+ANALYSIS_RATE = 16000
+
+
+def track_slice(track, start_ms, end_ms, sample_rate=ANALYSIS_RATE):
+    """按毫秒截取分析音轨"""
+    return track[start_ms * sample_rate // 1000:end_ms * sample_rate // 1000]
@@ -0,0 +1,107 @@
+# batch_ingest.py - 离线批量预处理整套课程音频
+#
+# 用法：
+#   python batch_ingest.py 课程目录/ [--jobs 8] [--transcribe --model base] [--codec opus-webm]
+#
+# 遍历目录下所有音频文件，多进程并行完成解码、断句（可选识别原文），
+# 结果写入 artifact_cache。之后学生在网页端上传同一文件即可直接拿到句子。
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import artifact_cache
+import pipeline
+from asr import DEFAULT_MODEL, load_model
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".m4a", ".ogg", ".flac"}
+
+# 每个工作进程各自加载一次模型
+_model = None
+
+
+def find_audio_files(root):
+    for directory, _, names in os.walk(root):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                yield os.path.join(directory, name)
+
+
+def _init_worker(model_name):
+    global _model
+    if model_name:
+        _model = load_model(model_name)
+
+
+def process_file(path, params, codec=pipeline.DEFAULT_CODEC):
+    """处理单个文件，返回 (路径, 句子数, 是否命中缓存, 耗时)"""
+    started = time.perf_counter()
+    key = artifact_cache.file_hash(path)
+
+    sentences = pipeline.load_sentences(key, params, codec)
+    needs_transcripts = _model is not None and sentences and any("transcript" not in s for s in sentences)
+    if sentences is not None and not needs_transcripts:
+        return path, len(sentences), True, time.perf_counter() - started
+
+    info, features = pipeline.analyze(path, key, params.get("segmenter", pipeline.DEFAULT_SEGMENTER))
+    spans = pipeline.find_spans(info, features, params)
+    sentences = pipeline.build_sentences(key, path, spans, params, model=_model, codec=codec)
+    return path, len(sentences), False, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量预处理课程音频，结果写入共享缓存")
+    parser.add_argument("root", help="课程音频所在目录")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="并行进程数（默认CPU核数）")
+    parser.add_argument("--segmenter", default=pipeline.DEFAULT_SEGMENTER, choices=list(pipeline.SEGMENTERS),
+                        help="断句方法：energy 能量静音检测，vad 语音活动检测（有背景音乐/噪声时用）")
+    parser.add_argument("--min-silence-len", type=int, default=pipeline.DEFAULT_PARAMS["min_silence_len"])
+    parser.add_argument("--silence-thresh", type=int, default=pipeline.DEFAULT_PARAMS["silence_thresh"])
+    parser.add_argument("--speech-thresh", type=float, default=0.5, help="vad 的语音判定阈值")
+    parser.add_argument("--keep-silence", type=int, default=pipeline.DEFAULT_PARAMS["keep_silence"])
+    parser.add_argument("--transcribe", action="store_true", help="同时用 Whisper 识别每句原文")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Whisper 模型名")
+    parser.add_argument("--codec", default=pipeline.DEFAULT_CODEC, choices=list(pipeline.DELIVERY_CODECS),
+                        help="句子片段的分发格式，应与网页端选择的一致")
+    args = parser.parse_args(argv)
+
+    params = {
+        "segmenter": args.segmenter,
+        "min_silence_len": args.min_silence_len,
+        "keep_silence": args.keep_silence,
+    }
+    if args.segmenter == "vad":
+        params["speech_thresh"] = args.speech_thresh
+    else:
+        params["silence_thresh"] = args.silence_thresh
+    paths = list(find_audio_files(args.root))
+    if not paths:
+        print(f"在 {args.root} 下没有找到音频文件")
+        return 1
+
+    print(f"共 {len(paths)} 个文件，{args.jobs} 个进程，缓存目录 {artifact_cache.CACHE_DIR}")
+    started = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(
+        max_workers=args.jobs,
+        initializer=_init_worker,
+        initargs=(args.model if args.transcribe else None,)
+    ) as executor:
+        futures = {executor.submit(process_file, path, params, args.codec): path for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                path, count, hit, elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(paths)}] ❌ {futures[future]}: {e}")
+                continue
+            status = "缓存" if hit else f"{elapsed:.1f}s"
+            print(f"[{done}/{len(paths)}] ✅ {path}: {count} 句 ({status})")
+
+    print(f"完成，用时 {time.perf_counter() - started:.1f}s，失败 {failed} 个")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
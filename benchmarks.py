@@ -0,0 +1,404 @@
+# benchmarks.py - 性能基准
+#
+# 用法：python benchmarks.py [名称 ...]，不带参数时运行全部基准。
+# python benchmarks.py fit 重新拟合 segmentation 里 VAD 分类器的权重。
+# 所有数据都是合成的，缓存写到临时目录，不影响真实的 artifact_cache。
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+# 基准使用独立的缓存目录
+os.environ["SHADOWING_CACHE_DIR"] = tempfile.mkdtemp(prefix="shadowing_bench_")
+
+import artifact_cache
+import media_service
+import pipeline
+import practice_stats
+import segmentation
+import session_bundle
+import shadowing
+
+
+def _timeit(func, repeat=5):
+    """返回多次运行中最快一次的耗时(ms)"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _write_random(path, rng, size):
+    with open(path, "wb") as f:
+        f.write(rng.bytes(size))
+
+
+def _fake_session(n_sentences, clip_bytes=16 * 1024):
+    """生成 n 个句子的会话，片段是随机字节（大小接近 3 秒 mp3）"""
+    rng = np.random.default_rng(0)
+    key = hashlib.sha256(b"bench").hexdigest()
+    sentences, start_ms = [], 0
+    for i in range(n_sentences):
+        end_ms = start_ms + int(rng.integers(1000, 6000))
+        clip = pipeline.clip_name(start_ms, end_ms)
+        if not artifact_cache.has(key, clip):
+            artifact_cache.atomic_write(key, clip, lambda tmp: _write_random(tmp, rng, clip_bytes))
+        sentences.append({
+            "id": i,
+            "clip": clip,
+            "audio_path": artifact_cache.artifact_path(key, clip),
+            "duration": (end_ms - start_ms) / 1000,
+            "start_time": start_ms / 1000,
+            "end_time": end_ms / 1000,
+            "transcript": f"reference sentence number {i} for the benchmark",
+        })
+        start_ms = end_ms + 300
+    dictations = [f"my dictation of sentence {i}" for i in range(n_sentences)]
+    starred = set(range(0, n_sentences, 7))
+    return key, sentences, dictations, starred
+
+
+def bench_bundle(n_sentences=2000):
+    """会话导出/导入：旧的 json.dumps(indent=2) 对比新的 zip 会话包"""
+    key, sentences, dictations, starred = _fake_session(n_sentences)
+    print(f"会话导出/导入（{n_sentences} 句）")
+
+    legacy = json.dumps({"sentences": sentences, "transcripts": dictations}, indent=2, ensure_ascii=False)
+    legacy_ms = _timeit(lambda: json.dumps(
+        {"sentences": sentences, "transcripts": dictations}, indent=2, ensure_ascii=False
+    ))
+    print(f"  旧 JSON 导出       {legacy_ms:8.1f} ms  {len(legacy.encode()) / 1024:8.1f} KB（无法导入）")
+
+    for include_clips in (False, True):
+        def export():
+            buffer = io.BytesIO()
+            session_bundle.write_bundle(
+                buffer, sentences, dictations, starred,
+                audio_name="bench.mp3", cache_key=key,
+                params=pipeline.DEFAULT_PARAMS, include_clips=include_clips
+            )
+            return buffer
+
+        data = export().getvalue()
+        export_ms = _timeit(export)
+        import_ms = _timeit(lambda: session_bundle.read_bundle(io.BytesIO(data)))
+        label = "含片段" if include_clips else "不含片段"
+        print(f"  会话包导出({label}) {export_ms:8.1f} ms  {len(data) / 1024:8.1f} KB")
+        print(f"  会话包导入({label}) {import_ms:8.1f} ms")
+
+
+def _write_speech_like(path, seconds, rate=44100, seed=0):
+    """合成类似语音的立体声 wav：基频起伏的谐波“音节”，中间夹着停顿"""
+    rng = np.random.default_rng(seed)
+    samples = np.zeros(int(seconds * rate), dtype=np.float32)
+    position = 0
+    while position < len(samples):
+        length = int(rate * rng.uniform(0.12, 0.35))
+        t = np.arange(length) / rate
+        pitch = rng.uniform(100, 240) * (1 + 0.1 * np.sin(2 * np.pi * 3 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / rate
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+        syllable = (voiced + 0.2 * rng.standard_normal(length)) * np.hanning(length)
+        end = min(len(samples), position + length)
+        samples[position:end] = 0.25 * syllable[:end - position]
+        # 音节之间偶尔有较长停顿（句间）
+        position = end + int(rate * (rng.uniform(0.5, 0.9) if rng.random() < 0.1 else rng.uniform(0.02, 0.08)))
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.repeat(pcm, 2).tobytes())
+
+
+def bench_codec(seconds=300, clip_seconds=3.0):
+    """句子片段分发格式：mp3 对比 opus 的编码耗时和传输体积"""
+    directory = tempfile.mkdtemp(prefix="shadowing_codec_")
+    source = os.path.join(directory, "source.wav")
+    _write_speech_like(source, seconds)
+    step = int(clip_seconds * 1000)
+    spans = [(start, start + step) for start in range(0, seconds * 1000 - step, step)]
+    print(f"句子片段格式（{len(spans)} 个 {clip_seconds:.0f}s 片段，源文件 {seconds}s 44.1kHz 立体声 wav）")
+
+    for codec, spec in pipeline.DELIVERY_CODECS.items():
+        outputs = [
+            (start_ms, end_ms, os.path.join(directory, pipeline.clip_name(start_ms, end_ms, codec)))
+            for start_ms, end_ms in spans
+        ]
+        encode_ms = _timeit(lambda: media_service.encode_clips(source, outputs, spec["format"], spec["args"]), repeat=3)
+        sizes = [os.path.getsize(output) for _, _, output in outputs]
+        clip_kb = sum(sizes) / len(sizes) / 1024
+        kbps = sum(sizes) * 8 / (len(spans) * clip_seconds) / 1000
+
+        full = os.path.join(directory, f"full.{spec['ext']}")
+        full_ms = _timeit(lambda: media_service.encode_file(source, full, spec["format"], spec["args"]), repeat=1)
+        full_mb = os.path.getsize(full) / 1024 / 1024
+        # 按 3G 网络约 400kbps 估算单句加载时间
+        print(f"  {codec:10s} 编码 {encode_ms / len(spans):6.1f} ms/句  {clip_kb:6.1f} KB/句  "
+              f"{kbps:6.1f} kbps  3G 加载 {clip_kb * 8 / 400 * 1000:5.0f} ms/句  "
+              f"整段 {full_mb:5.2f} MB（转码 {full_ms / 1000:.1f}s）")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def _syllable(rng, rate):
+    """一个合成音节：基频起伏、谐波强度随机的浊音加少量气声"""
+    length = int(rate * rng.uniform(0.12, 0.35))
+    t = np.arange(length) / rate
+    pitch = rng.uniform(100, 240) * (1 + 0.1 * np.sin(2 * np.pi * 3 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voiced = sum(np.sin(k * phase) * rng.uniform(0.3, 1.0) / k for k in range(1, 20))
+    return (voiced + 0.15 * rng.standard_normal(length)) * np.hanning(length) * rng.uniform(0.5, 1.0)
+
+
+def _background(kind, n, rng, rate):
+    """房间噪声（高通后的褐噪声）或背景音乐（每 0.5~2 秒换一个和弦，加鼓点）"""
+    if kind == "noise":
+        noise = np.cumsum(rng.standard_normal(n))
+        return (noise - np.convolve(noise, np.ones(64) / 64, "same")).astype(np.float32)
+    music = np.zeros(n, dtype=np.float32)
+    position = 0
+    while position < n:
+        t = np.arange(min(int(rate * rng.uniform(0.5, 2.0)), n - position)) / rate
+        root = 110 * 2 ** (rng.integers(0, 12) / 12)
+        for ratio in (1, 1.26, 1.5, 2):
+            for k in range(1, 6):
+                music[position:position + len(t)] += np.sin(2 * np.pi * root * ratio * k * t) / k
+        position += len(t)
+    decay = np.exp(-np.arange(800) / 150)
+    for beat in range(0, n, rate // 2):
+        end = min(n, beat + 800)
+        music[beat:end] += 2 * decay[:end - beat] * rng.standard_normal(end - beat)
+    return music
+
+
+def synthetic_lecture(seconds, background="clean", snr_db=10, seed=0, rate=16000):
+    """合成带标注的讲座音轨，返回 (16kHz int16 音轨, 真实句子 [(开始ms, 结束ms), ...])
+
+    每句 4~17 个音节，音节间隔 20~120ms，句间停顿 0.6~1.5 秒；
+    background 为 clean / noise / music，按 snr_db（相对语音段功率）混入。
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    speech = np.zeros(n, dtype=np.float32)
+    spans = []
+    position = int(rate * rng.uniform(0.5, 1.0))
+    while position < n - 2 * rate:
+        start = position
+        for _ in range(int(rng.integers(4, 18))):
+            if position >= n:
+                break
+            syllable = _syllable(rng, rate)
+            end = min(n, position + len(syllable))
+            speech[position:end] = 0.25 * syllable[:end - position]
+            position = end + int(rate * rng.uniform(0.02, 0.12))
+        spans.append((start * 1000 // rate, min(position, n) * 1000 // rate))
+        position += int(rate * rng.uniform(0.6, 1.5))
+
+    mixed = speech
+    if background != "clean":
+        noise = _background(background, n, rng, rate)
+        speech_power = np.mean(speech[speech != 0] ** 2)
+        mixed = speech + noise * np.sqrt(speech_power / np.mean(noise ** 2) / 10 ** (snr_db / 10))
+    return np.clip(mixed * 32767, -32768, 32767).astype(np.int16), spans
+
+
+def _boundary_f1(predicted, truth, tolerance_ms=150):
+    """句子边界（起点和终点）在容差内命中的 F1"""
+    predicted = np.array([bound for span in predicted for bound in span])
+    truth = np.array([bound for span in truth for bound in span])
+    if len(predicted) == 0 or len(truth) == 0:
+        return 0.0
+    distance = np.abs(predicted[:, None] - truth[None, :])
+    precision = (distance.min(axis=1) <= tolerance_ms).mean()
+    recall = (distance.min(axis=0) <= tolerance_ms).mean()
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+# 基准测试集（种子与拟合 VAD 权重时用的不同）
+SEGMENT_CASES = [("clean", None), ("noise", 15), ("noise", 5), ("music", 15), ("music", 5)]
+SEGMENT_SEEDS = range(100, 104)
+
+
+def bench_segment(seconds=120):
+    """断句后端：特征计算吞吐、参数调整后重新检测的耗时、边界准确率"""
+    params = {
+        "energy": dict(pipeline.DEFAULT_PARAMS, segmenter="energy"),
+        "vad": dict(pipeline.DEFAULT_PARAMS, segmenter="vad", speech_thresh=0.5),
+    }
+    print(f"断句后端（合成讲座 {seconds}s × {len(SEGMENT_SEEDS)} 段，边界容差 ±150ms，默认参数）")
+    for name, segmenter in segmentation.SEGMENTERS.items():
+        scores, feature_s, detect_ms, audio_s = [], 0.0, 0.0, 0.0
+        for background, snr_db in SEGMENT_CASES:
+            case_scores = []
+            for seed in SEGMENT_SEEDS:
+                track, truth = synthetic_lecture(seconds, background, snr_db or 10, seed)
+                started = time.perf_counter()
+                features = segmenter.features(track)
+                feature_s += time.perf_counter() - started
+                audio_s += seconds
+                total_ms = len(track) * 1000 // 16000
+                detect_ms += _timeit(lambda: segmenter.detect(features, params[name], total_ms), repeat=3)
+                spans = segmenter.detect(features, dict(params[name], keep_silence=0), total_ms)
+                case_scores.append(_boundary_f1(spans, truth))
+            scores.append(np.mean(case_scores))
+        runs = len(SEGMENT_CASES) * len(SEGMENT_SEEDS)
+        cases = "  ".join(
+            f"{background}{'' if snr_db is None else f'@{snr_db}dB'} {score:.2f}"
+            for (background, snr_db), score in zip(SEGMENT_CASES, scores)
+        )
+        print(f"  {name:6s} 特征 {audio_s / feature_s:6.0f}x 实时  重新检测 {detect_ms / runs:5.1f} ms  F1: {cases}")
+
+
+def _stretch(track, factor):
+    """线性插值把音轨拉长 factor 倍（同时降低音高，模拟放慢的跟读）"""
+    positions = np.arange(int(len(track) * factor)) / factor
+    return np.interp(positions, np.arange(len(track)), track.astype(np.float32))
+
+
+def bench_shadow(lengths=(5, 10), stretch=1.25, pause_ms=400):
+    """跟读对齐：5/10 秒句子的对齐耗时，以及估出的语速、停顿是否正确"""
+    track, spans = synthetic_lecture(240, "clean", seed=7)
+    print(f"跟读对齐（录音放慢 {stretch}x，句中插入 {pause_ms}ms 停顿，加噪声）")
+    for seconds in lengths:
+        start = spans[0][0]
+        end = start + seconds * 1000
+        reference = track[start * 16:end * 16]
+        slow = _stretch(reference, stretch)
+        middle = len(slow) // 2
+        attempt = np.concatenate((
+            np.zeros(4800), slow[:middle], np.zeros(pause_ms * 16), slow[middle:], np.zeros(3200)
+        ))
+        attempt += np.random.default_rng(0).standard_normal(len(attempt)) * 30
+        attempt = attempt.astype(np.int16)
+
+        report = shadowing.compare(reference, attempt)
+        elapsed = _timeit(lambda: shadowing.compare(reference, attempt), repeat=3)
+        expected = (len(slow) / 16 + pause_ms) / (len(reference) / 16)
+        print(f"  {(end - start) / 1000:5.1f}s 句子  对齐 {elapsed:6.1f} ms  语速 {report['tempo']:.2f}"
+              f"（实际约 {expected:.2f}）  停顿 {report['attempt_pauses']}（原句 {report['reference_pauses']}）  开口延迟 {report['start_delay_s']}s"
+              f"  相似度 {report['similarity']}")
+
+
+def bench_stats(n_events=50000, n_sentences=2000):
+    """练习统计：打开时只读汇总对比重放整个事件日志，以及记录一个事件的耗时"""
+    rng = np.random.default_rng(0)
+    vocabulary = [f"word{i}" for i in range(3000)]
+    directory = tempfile.mkdtemp(prefix="shadowing_stats_")
+    stats = practice_stats.PracticeStats(directory)
+    now = time.time() - n_events * 20
+    started = time.perf_counter()
+    for i in range(n_events):
+        item = f"bench:{rng.integers(n_sentences)}"
+        info = {"audio_name": "bench.mp3", "start_ms": 0, "end_ms": 3000}
+        session = f"s{i // 200}"
+        now += rng.integers(5, 60)
+        kind = ("play", "submit", "score")[i % 3]
+        if kind == "score":
+            words = list(rng.choice(vocabulary, 12))
+            stats.record(kind, session, item, info, now=now, score=float(rng.random()), words=words, missed=words[:3])
+        else:
+            stats.record(kind, session, item, info, now=now)
+    record_ms = (time.perf_counter() - started) * 1000 / n_events
+    log_mb = os.path.getsize(os.path.join(directory, "events.jsonl")) / 1024 / 1024
+
+    def open_summary():
+        practice_stats.PracticeStats(directory).overview()
+
+    def replay_log():
+        # 没有汇总时只能从头重放整个日志
+        replay = os.path.join(directory, "replay")
+        os.makedirs(replay, exist_ok=True)
+        shutil.copy(os.path.join(directory, "events.jsonl"), replay)
+        practice_stats.PracticeStats(replay).overview()
+        shutil.rmtree(replay)
+
+    summary_ms = _timeit(open_summary)
+    replay_ms = _timeit(replay_log, repeat=2)
+    print(f"练习统计（{n_events} 个事件，日志 {log_mb:.1f} MB，{n_sentences} 句）")
+    print(f"  记录一个事件 {record_ms:.3f} ms")
+    print(f"  打开统计：读汇总 {summary_ms:7.1f} ms  重放日志 {replay_ms:7.1f} ms")
+    shutil.rmtree(directory)
+
+
+# 拟合 VAD 权重用的训练集：背景种类与基准相同、信噪比更密，种子与基准的不重叠
+FIT_CASES = [("clean", None), ("noise", 20), ("noise", 10), ("noise", 5), ("music", 20), ("music", 10), ("music", 5)]
+FIT_SEEDS = range(0, 4)
+
+
+def _fit_logistic(features, labels, ridge=1e-4, iterations=25):
+    """带 L2 正则（不含偏置）的逻辑回归，牛顿法迭代，返回 (权重, 偏置)"""
+    x = np.hstack((features.astype(np.float64), np.ones((len(features), 1))))
+    y = labels.astype(np.float64)
+    penalty = np.eye(x.shape[1]) * ridge * len(x)
+    penalty[-1, -1] = 0
+    beta = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-(x @ beta)))
+        gradient = x.T @ (p - y) + penalty @ beta
+        hessian = (x * (p * (1 - p))[:, None]).T @ x + penalty
+        step = np.linalg.solve(hessian, gradient)
+        beta -= step
+        if np.abs(step).max() < 1e-6:
+            break
+    return beta[:-1], beta[-1]
+
+
+def fit_vad(seconds=120):
+    """在合成讲座上重新拟合 segmentation 里 VAD 分类器的权重，打印可直接替换的常量
+
+    每帧的标签取自合成时的真实句子区间（句内音节间的短停顿也算语音）。
+    """
+    features, labels = [], []
+    for background, snr_db in FIT_CASES:
+        for seed in FIT_SEEDS:
+            track, spans = synthetic_lecture(seconds, background, snr_db, seed=seed)
+            frames = segmentation.speech_features(segmentation.band_energies(track))
+            label = np.zeros(len(frames), dtype=np.float32)
+            for start, end in spans:
+                label[start // segmentation.FRAME_MS:end // segmentation.FRAME_MS] = 1
+            features.append(frames)
+            labels.append(label)
+    features, labels = np.concatenate(features), np.concatenate(labels)
+    weights, bias = _fit_logistic(features, labels)
+
+    def accuracy(w, b):
+        return (((features @ w + b) > 0) == (labels > 0.5)).mean()
+
+    print(f"VAD 权重拟合（{len(FIT_CASES)} 种背景 × {len(FIT_SEEDS)} 段 × {seconds}s，{len(labels)} 帧，语音帧占 {labels.mean():.0%}）")
+    print(f"  逐帧准确率：当前权重 {accuracy(segmentation._VAD_WEIGHTS, segmentation._VAD_BIAS):.3f}  拟合结果 {accuracy(weights, bias):.3f}")
+    print(f"  _VAD_WEIGHTS = np.array([{', '.join(f'{w:.3f}' for w in weights)}], dtype=np.float32)")
+    print(f"  _VAD_BIAS = {bias:.3f}")
+
+
+BENCHMARKS = {
+    "bundle": bench_bundle,
+    "codec": bench_codec,
+    "segment": bench_segment,
+    "shadow": bench_shadow,
+    "stats": bench_stats,
+    # 不是基准：重新拟合 VAD 权重，python benchmarks.py fit
+    "fit": fit_vad,
+}
+
+
+def main(argv):
+    names = argv or [name for name in BENCHMARKS if name != "fit"]
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"未知基准 {name}，可选：{', '.join(BENCHMARKS)}")
+            return 1
+        BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,502 @@
+# load_test.py - 多会话并发压测
+#
+# 用法：
+#   python load_test.py app.py --files 课程目录/ --sessions 20 [--steps 10] [--ramp 10]
+#   python load_test.py no_whisper.py --url http://服务器:8501 --pid 12345 --files a.mp3 b.mp3
+#
+# 默认在本机启动一个独立的 streamlit 服务（独立端口、临时目录和缓存目录）。
+# 每个模拟会话像浏览器一样经 websocket 驱动真实脚本：上传 → 断句 → 逐句“下一句”
+# 并提交听写，页面里的音频地址按浏览器缓存的方式各拉取一次。
+# 结束后报告每种操作的延迟分位数、吞吐、服务进程（含 ffmpeg 子进程）的 CPU
+# 和内存峰值、临时目录与缓存目录的占用；--json 把同样的结果写入文件，便于对比回归。
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Common_pb2 import FileURLs
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from batch_ingest import find_audio_files
+
+# 各页面上模拟操作对应的控件标签
+FLOWS = {
+    "app.py": {
+        "uploader": "上传音频文件",
+        "split": "🔍 开始智能断句",
+        "next": "➡️ 下一句",
+        "answer": "听写内容",
+        "submit": "✅ 提交",
+    },
+    "no_whisper.py": {
+        "uploader": "选择音频文件",
+        "split": "🔍 开始智能断句",
+        "next": "➡️ 下一句",
+        "answer": "你的答案",
+        "submit": "提交",
+    },
+}
+
+ACTIONS = ("connect", "upload", "split", "next", "submit", "media")
+
+# 单次操作的超时（断句包括解码和导出片段，长文件较慢）
+ACTION_TIMEOUT = 300
+
+_DONE = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR)
+
+# 任意十六进制串都可作为 tornado 的 xsrf token，cookie（streamlit 命名为 _streamlit_xsrf）和请求头一致即可
+_XSRF = uuid.uuid4().hex
+
+
+class LoadTestError(RuntimeError):
+    pass
+
+
+class Recorder:
+    """收集各操作耗时、错误和流量"""
+
+    def __init__(self):
+        self.latencies = {action: [] for action in ACTIONS}
+        self.errors = []
+        self.ws_bytes = 0
+        self.media_bytes = 0
+
+    def add(self, action, seconds):
+        self.latencies[action].append(seconds)
+
+    def summary(self, wall):
+        actions = {}
+        for action, values in self.latencies.items():
+            if not values:
+                continue
+            ms = np.array(values) * 1000
+            actions[action] = {
+                "count": len(values),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p90_ms": float(np.percentile(ms, 90)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        scripted = sum(len(self.latencies[a]) for a in ACTIONS if a != "media")
+        return {
+            "actions": actions,
+            "wall_s": wall,
+            "throughput_per_s": scripted / wall if wall else 0.0,
+            "errors": len(self.errors),
+            "ws_kb_per_action": self.ws_bytes / 1024 / max(scripted, 1),
+            "media_mb": self.media_bytes / 1024 / 1024,
+        }
+
+
+class Session:
+    """一个模拟的浏览器会话"""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.session_id = None
+        self.elements = {}  # delta_path -> Element，本次运行渲染的元素
+        self.widgets = {}  # 控件 id -> WidgetState，像前端一样每次重跑都带上
+        self.fetched = set()
+        self._cache = {}  # 可缓存消息 hash -> ForwardMsg
+        self._waiter = None
+        self._conn = None
+        self._reader = None
+        self._http = AsyncHTTPClient()
+
+    async def connect(self):
+        ws_url = self.base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self._conn = await websocket_connect(ws_url, subprotocols=["streamlit"], max_message_size=512 * 1024 * 1024)
+        self._reader = asyncio.ensure_future(self._read())
+        await self.rerun()
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def _resolve(self, msg):
+        if not msg.ref_hash:
+            if msg.metadata.cacheable:
+                self._cache[msg.hash] = msg
+            return msg
+        cached = self._cache.get(msg.ref_hash)
+        if cached is None:
+            response = await self._http.fetch(f"{self.base_url}/_stcore/message?hash={msg.ref_hash}")
+            cached = ForwardMsg()
+            cached.ParseFromString(response.body)
+            self._cache[msg.ref_hash] = cached
+        resolved = ForwardMsg()
+        resolved.CopyFrom(cached)
+        resolved.metadata.CopyFrom(msg.metadata)
+        return resolved
+
+    async def _read(self):
+        try:
+            while await self._handle(await self._conn.read_message()):
+                pass
+        except Exception as e:
+            self._fail(e)
+        self._fail(LoadTestError("websocket 连接已断开"))
+
+    async def _handle(self, payload):
+        if payload is None:
+            return False
+        self.recorder.ws_bytes += len(payload)
+        msg = ForwardMsg()
+        msg.ParseFromString(payload)
+        msg = await self._resolve(msg)
+        kind = msg.WhichOneof("type")
+
+        if kind == "new_session":
+            self.elements = {}
+            if msg.new_session.initialize.session_id:
+                self.session_id = msg.new_session.initialize.session_id
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            self.elements[tuple(msg.metadata.delta_path)] = element
+            if element.WhichOneof("type") == "exception":
+                where = element.exception.stack_trace[-1].strip() if element.exception.stack_trace else ""
+                self.recorder.errors.append(f"{element.exception.type}: {element.exception.message} {where}")
+        elif kind == "script_finished" and msg.script_finished in _DONE:
+            self._finish(None)
+        elif kind == "file_urls_response":
+            self._finish(msg.file_urls_response)
+        return True
+
+    def _finish(self, value):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(value)
+
+    def _fail(self, error):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(error)
+
+    async def _send(self, back_msg):
+        self._waiter = asyncio.get_event_loop().create_future()
+        await self._conn.write_message(back_msg.SerializeToString(), binary=True)
+        return await asyncio.wait_for(self._waiter, ACTION_TIMEOUT)
+
+    async def rerun(self, triggers=()):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.widget_states.widgets.extend(list(self.widgets.values()) + list(triggers))
+        await self._send(msg)
+
+    def find(self, kind, label):
+        for element in self.elements.values():
+            if element.WhichOneof("type") == kind and getattr(element, kind).label == label:
+                return getattr(element, kind)
+        raise LoadTestError(f"页面上没有找到 {kind} “{label}”")
+
+    async def click(self, label, **texts):
+        """填写文本框（标签 -> 内容）后点击按钮，等待脚本重跑结束"""
+        for text_label, text in texts.items():
+            state = WidgetState(id=self.find("text_area", text_label).id, string_value=text)
+            self.widgets[state.id] = state
+        await self.rerun([WidgetState(id=self.find("button", label).id, trigger_value=True)])
+
+    async def upload(self, label, path):
+        """按前端的流程上传：申请上传地址 → PUT 文件 → 带上上传控件状态重跑"""
+        uploader = self.find("file_uploader", label)
+        name = os.path.basename(path)
+        request = BackMsg()
+        request.file_urls_request.request_id = uuid.uuid4().hex
+        request.file_urls_request.file_names.append(name)
+        request.file_urls_request.session_id = self.session_id
+        response = await self._send(request)
+        urls = response.file_urls[0]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        boundary = uuid.uuid4().hex
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        await self._http.fetch(
+            self.base_url + urls.upload_url,
+            method="PUT",
+            body=body,
+            headers={
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+                "Cookie": f"_streamlit_xsrf={_XSRF}",
+                "X-Xsrftoken": _XSRF,
+            },
+            request_timeout=ACTION_TIMEOUT
+        )
+
+        state = WidgetState(id=uploader.id)
+        info = state.file_uploader_state_value.uploaded_file_info.add()
+        info.name = name
+        info.size = len(data)
+        info.file_id = urls.file_id
+        info.file_urls.CopyFrom(FileURLs(file_id=urls.file_id, upload_url=urls.upload_url, delete_url=urls.delete_url))
+        self.widgets[state.id] = state
+        await self.rerun()
+
+    async def fetch_media(self):
+        """拉取页面里还没请求过的音频（模拟浏览器缓存）"""
+        for element in list(self.elements.values()):
+            if element.WhichOneof("type") != "audio" or not element.audio.url:
+                continue
+            url = element.audio.url
+            if url in self.fetched:
+                continue
+            self.fetched.add(url)
+            started = time.perf_counter()
+            response = await self._http.fetch(url if url.startswith("http") else self.base_url + url)
+            self.recorder.add("media", time.perf_counter() - started)
+            self.recorder.media_bytes += len(response.body)
+
+
+async def _timed(recorder, action, session, coro):
+    started = time.perf_counter()
+    await coro
+    recorder.add(action, time.perf_counter() - started)
+    await session.fetch_media()
+
+
+async def run_session(index, base_url, flow, path, steps, delay, recorder):
+    await asyncio.sleep(delay)
+    session = Session(base_url, recorder)
+    try:
+        await _timed(recorder, "connect", session, session.connect())
+        await _timed(recorder, "upload", session, session.upload(flow["uploader"], path))
+        await _timed(recorder, "split", session, session.click(flow["split"]))
+        for step in range(steps):
+            await _timed(recorder, "next", session, session.click(flow["next"]))
+            await _timed(recorder, "submit", session, session.click(
+                flow["submit"], **{flow["answer"]: f"session {index} sentence {step} dictation"}
+            ))
+    except (LoadTestError, HTTPClientError, OSError, asyncio.TimeoutError) as e:
+        recorder.errors.append(f"会话 {index}: {type(e).__name__}: {e}")
+    finally:
+        await session.close()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _dir_size(path):
+    total = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _read_stat(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        # 进程名可能带空格，从最后一个右括号之后开始切分
+        return f.read().rsplit(")", 1)[1].split()
+
+
+def _process_tree(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                children.setdefault(int(_read_stat(entry)[1]), []).append(int(entry))
+            except (OSError, IndexError):
+                pass
+    tree, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        tree.append(current)
+        todo.extend(children.get(current, []))
+    return tree
+
+
+def _cpu_seconds(pid):
+    """进程自身加上已结束子进程（ffmpeg 等）的 CPU 时间"""
+    fields = _read_stat(pid)
+    return sum(int(v) for v in fields[11:15]) / os.sysconf("SC_CLK_TCK")
+
+
+def _rss_bytes(pid):
+    total = 0
+    for member in _process_tree(pid):
+        try:
+            with open(f"/proc/{member}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            pass
+    return total
+
+
+async def monitor(pid, directories, samples, stop, interval=0.5):
+    """定期采样服务进程树的 CPU、RSS 和目录占用"""
+    last_cpu, last_time = _cpu_seconds(pid), time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        cpu = _cpu_seconds(pid)
+        samples.append({
+            "cores": (cpu - last_cpu) / (now - last_time),
+            "rss": _rss_bytes(pid),
+            "disk": {name: _dir_size(path) for name, path in directories.items()},
+        })
+        last_cpu, last_time = cpu, now
+
+
+def launch_server(app, workdir, cache_dir):
+    """在独立端口和目录下启动 streamlit，返回 (进程, 地址)"""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        TMPDIR=os.path.join(workdir, "tmp"),
+        SHADOWING_CACHE_DIR=cache_dir,
+        SHADOWING_REVIEW_DB=os.path.join(workdir, "review.db"),
+        SHADOWING_STATS_DIR=os.path.join(workdir, "stats"),
+        SHADOWING_MEDIA_PORT=str(_free_port()),
+    )
+    os.makedirs(env["TMPDIR"], exist_ok=True)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app,
+         "--server.headless", "true", "--server.port", str(port),
+         "--browser.gatherUsageStats", "false"],
+        env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, "server.log"), "wb")
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(base_url, process=None, timeout=60):
+    client = AsyncHTTPClient()
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            raise LoadTestError("streamlit 服务启动失败")
+        try:
+            await client.fetch(f"{base_url}/_stcore/health")
+            return
+        except (HTTPClientError, OSError):
+            await asyncio.sleep(0.5)
+    raise LoadTestError("等待 streamlit 服务就绪超时")
+
+
+def print_report(result):
+    print(f"\n{'操作':8s}{'次数':>6s}{'p50':>9s}{'p90':>9s}{'p99':>9s}{'max':>9s}  (ms)")
+    for action, row in result["actions"].items():
+        print(f"{action:8s}{row['count']:6d}{row['p50_ms']:9.0f}{row['p90_ms']:9.0f}"
+              f"{row['p99_ms']:9.0f}{row['max_ms']:9.0f}")
+    print(f"\n吞吐 {result['throughput_per_s']:.1f} 操作/秒，用时 {result['wall_s']:.1f}s，错误 {result['errors']} 个")
+    print(f"websocket 下行 {result['ws_kb_per_action']:.1f} KB/操作，音频下载共 {result['media_mb']:.1f} MB")
+    server = result.get("server")
+    if server:
+        print(f"服务 CPU 平均 {server['cpu_cores_avg']:.2f} 核，峰值 {server['cpu_cores_peak']:.2f} 核；"
+              f"RSS 峰值 {server['rss_peak_mb']:.0f} MB（含子进程）")
+        for name, usage in server["disk_mb"].items():
+            print(f"{name} 占用峰值 {usage['peak']:.1f} MB，结束时 {usage['end']:.1f} MB")
+
+
+async def main_async(args):
+    paths = []
+    for item in args.files:
+        paths.extend(find_audio_files(item) if os.path.isdir(item) else [item])
+    if not paths:
+        print("没有找到用于上传的音频文件")
+        return 1
+    flow = FLOWS[os.path.basename(args.app)]
+
+    workdir = tempfile.mkdtemp(prefix="shadowing_load_")
+    process = None
+    directories = {}
+    if args.url:
+        base_url, pid = args.url, args.pid
+        if args.tmp_dir:
+            directories["临时目录"] = args.tmp_dir
+    else:
+        cache_dir = args.cache_dir or os.path.join(workdir, "cache")
+        process, base_url = launch_server(args.app, workdir, cache_dir)
+        pid = process.pid
+        directories = {"临时目录": os.path.join(workdir, "tmp"), "缓存目录": cache_dir}
+
+    try:
+        await wait_ready(base_url, process)
+        print(f"{args.sessions} 个会话，每个 {args.steps} 步，{len(paths)} 个文件，服务 {base_url}")
+
+        recorder = Recorder()
+        samples, stop = [], asyncio.Event()
+        watcher = asyncio.ensure_future(monitor(pid, directories, samples, stop)) if pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            run_session(
+                i, base_url, flow, paths[i % len(paths)], args.steps,
+                args.ramp * i / max(args.sessions, 1), recorder
+            )
+            for i in range(args.sessions)
+        ))
+        wall = time.perf_counter() - started
+        stop.set()
+        if watcher is not None:
+            await watcher
+
+        result = recorder.summary(wall)
+        result.update(app=args.app, sessions=args.sessions, steps=args.steps, files=paths)
+        if samples:
+            result["server"] = {
+                "cpu_cores_avg": float(np.mean([s["cores"] for s in samples])),
+                "cpu_cores_peak": float(np.max([s["cores"] for s in samples])),
+                "rss_peak_mb": max(s["rss"] for s in samples) / 1024 / 1024,
+                "disk_mb": {
+                    name: {
+                        "peak": max(s["disk"][name] for s in samples) / 1024 / 1024,
+                        "end": samples[-1]["disk"][name] / 1024 / 1024,
+                    }
+                    for name in directories
+                },
+            }
+        print_report(result)
+        for error in recorder.errors[:10]:
+            print(f"  ❌ {error}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        return 1 if recorder.errors else 0
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模拟多个学生同时使用网页端，测量延迟和资源占用")
+    parser.add_argument("app", choices=list(FLOWS), help="被测的页面脚本")
+    parser.add_argument("--files", nargs="+", required=True, help="上传用的音频文件或目录，各会话轮流选用")
+    parser.add_argument("--sessions", type=int, default=10, help="并发会话数")
+    parser.add_argument("--steps", type=int, default=5, help="每个会话“下一句 + 提交”的次数")
+    parser.add_argument("--ramp", type=float, default=5.0, help="在多少秒内陆续启动全部会话")
+    parser.add_argument("--url", help="压测已运行的服务，不再自行启动")
+    parser.add_argument("--pid", type=int, help="配合 --url：服务进程 pid，用于采集 CPU/内存")
+    parser.add_argument("--tmp-dir", help="配合 --url：服务的临时目录，用于统计占用")
+    parser.add_argument("--cache-dir", help="自行启动时使用的缓存目录（默认每次全新，测冷启动）")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# media_server.py - 句子片段和整段音频的静态媒体服务
+#
+# st.audio(音频字节) 每次重跑脚本都会把整段内容经 websocket 重新登记、发送一遍。
+# 这里在后台线程起一个 tornado 服务，直接按内容地址提供 artifact_cache 里的文件：
+#   /media/<key[:2]>/<key>/<文件名>
+# key 是源文件的内容哈希，文件名由起止时间和格式决定，同一地址的内容永远不变，
+# 所以响应带 ETag 和 Cache-Control: immutable，浏览器缓存后不再重复下载；
+# 支持 Range 请求，拖动进度条时只取需要的部分。页面里只放一个 URL。
+#
+# 服务默认只监听本机的 SHADOWING_MEDIA_PORT（8601），这时只有在本机打开的页面直接引用
+# 媒体地址，其他页面仍经 websocket 发送音频。要让其他机器访问，把
+# SHADOWING_MEDIA_ADDRESS 设为 0.0.0.0，或经反向代理发布并把 SHADOWING_MEDIA_URL
+# 设为对外的完整地址（如 https://example.com/media）。
+# <audio> 播放不需要跨域许可；其他页面要用脚本读取媒体时，把它们的 origin 写进
+# SHADOWING_MEDIA_ORIGINS（逗号分隔）。
+#
+# 多个进程共用一个端口：端口被占用时沿用已有的服务，并每隔几秒重试监听，
+# 占着端口的进程退出后由其他进程接手。
+#
+# /readyz 是就绪检查：经 warmup.py 启动时，启动预热完成前返回 503，完成后返回 200，
+# 响应内容是各预热阶段的耗时，负载均衡据此决定何时开始转发流量。
+import asyncio
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+
+import tornado.web
+from validators import url as _is_url
+
+import artifact_cache
+
+MEDIA_PORT = int(os.environ.get("SHADOWING_MEDIA_PORT", 8601))
+MEDIA_ADDRESS = os.environ.get("SHADOWING_MEDIA_ADDRESS", "127.0.0.1")
+MEDIA_URL = os.environ.get("SHADOWING_MEDIA_URL", "").rstrip("/")
+ALLOWED_ORIGINS = {origin.strip().rstrip("/") for origin in os.environ.get("SHADOWING_MEDIA_ORIGINS", "").split(",") if origin.strip()}
+
+# 端口被占用时每隔多少秒重试
+BIND_RETRY_SECONDS = 5
+
+_LOOPBACK = {"127.0.0.1", "localhost", "::1"}
+
+# 只对外提供音频产物，分析音轨、句子列表等不可访问
+_SERVED_NAME = re.compile(r"(clip_\d+_\d+|full|source)\.[a-z0-9]+")
+_ROUTE = r"/media/([0-9a-f]{2}/[0-9a-f]{64}/[^/]+)"
+
+# 内容不变，缓存一年
+CACHE_SECONDS = 365 * 24 * 60 * 60
+
+mimetypes.add_type("audio/mp4", ".m4a")
+mimetypes.add_type("audio/flac", ".flac")
+mimetypes.add_type("audio/webm", ".webm")
+mimetypes.add_type("audio/ogg", ".ogg")
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ArtifactHandler(tornado.web.StaticFileHandler):
+    """按内容地址读取缓存文件；ETag、304 和 Range 由 StaticFileHandler 处理"""
+
+    def set_default_headers(self):
+        # 只对配置过的页面开放跨域读取，录音等内容不让任意网站的脚本读到
+        origin = self.request.headers.get("Origin")
+        if origin in ALLOWED_ORIGINS:
+            self.set_header("Access-Control-Allow-Origin", origin)
+        self.set_header("Vary", "Origin")
+
+    def validate_absolute_path(self, root, absolute_path):
+        if not _SERVED_NAME.fullmatch(os.path.basename(absolute_path)):
+            raise tornado.web.HTTPError(404)
+        return super().validate_absolute_path(root, absolute_path)
+
+    def get_cache_time(self, path, modified, mime_type):
+        return CACHE_SECONDS
+
+    def set_extra_headers(self, path):
+        self.set_header("Cache-Control", f"public, max-age={CACHE_SECONDS}, immutable")
+
+
+class ReadinessHandler(tornado.web.RequestHandler):
+    """启动预热完成前返回 503"""
+
+    def get(self):
+        import warmup  # warmup 会启动本服务，这里用到时再导入
+        status = warmup.status()
+        self.set_status(200 if status["ready"] else 503)
+        self.set_header("Cache-Control", "no-store")
+        self.finish(status)
+
+
+def make_app():
+    return tornado.web.Application([
+        (_ROUTE, ArtifactHandler, {"path": artifact_cache.CACHE_DIR}),
+        (r"/readyz", ReadinessHandler),
+    ])
+
+
+def _serve(port, address, started):
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    app = make_app()
+    while True:
+        try:
+            app.listen(port, address=address)
+            break
+        except OSError as e:
+            # 同一台机器上另一个进程已经在这个端口提供同一缓存目录；它退出后由这里接手
+            if not started.is_set():
+                _LOGGER.warning("媒体服务端口 %s 已被占用，沿用已有服务并每 %s 秒重试: %s", port, BIND_RETRY_SECONDS, e)
+                started.set()
+            time.sleep(BIND_RETRY_SECONDS)
+    _LOGGER.info("媒体服务监听 %s:%s", address, port)
+    started.set()
+    asyncio.get_event_loop().run_forever()
+
+
+_thread = None
+_lock = threading.Lock()
+
+
+def start(port=MEDIA_PORT, address=MEDIA_ADDRESS):
+    """在后台线程启动服务，进程内只启动一次"""
+    global _thread
+    with _lock:
+        if _thread is None:
+            started = threading.Event()
+            _thread = threading.Thread(
+                target=_serve, args=(port, address, started), name="media-server", daemon=True
+            )
+            _thread.start()
+            started.wait()
+
+
+def _base_url():
+    """浏览器访问媒体服务的地址，无法确定时返回 None"""
+    if MEDIA_URL:
+        return MEDIA_URL
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        headers = _get_websocket_headers() or {}
+    except (ImportError, RuntimeError):
+        headers = {}
+    # https 页面里不能引用 http 地址，只能回退到经 websocket 发送
+    if headers.get("X-Forwarded-Proto") == "https":
+        return None
+    host = headers.get("Host", "localhost").rsplit(":", 1)[0]
+    # 只监听本机时，其他机器上的浏览器访问不到
+    if MEDIA_ADDRESS in _LOOPBACK and host not in _LOOPBACK:
+        return None
+    if host == "localhost":
+        host = "127.0.0.1"
+    return f"http://{host}:{MEDIA_PORT}/media"
+
+
+def url(path):
+    """缓存文件的访问地址
+
+    文件不在缓存里、或者得不到 st.audio 能识别的地址时原样返回路径，
+    由 st.audio 读取内容经 websocket 发送。
+    """
+    relative = os.path.relpath(path, artifact_cache.CACHE_DIR)
+    if relative.startswith("..") or not _SERVED_NAME.fullmatch(os.path.basename(path)):
+        return path
+    base = _base_url()
+    if base is None:
+        return path
+    address = f"{base}/{relative.replace(os.sep, '/')}"
+    # st.audio 用 validators 判断字符串是不是 URL（不认 localhost 等单段主机名）
+    if not _is_url(address):
+        return path
+    start()
+    return address
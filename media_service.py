@@ -0,0 +1,280 @@
+# media_service.py - ffmpeg 解码/编码服务
+#
+# 所有 ffmpeg 调用都经过这里排队执行：
+#   - 同时运行的 ffmpeg 进程数有上限，避免多人同时上传时把 CPU 挤爆
+#   - 每个会话一个队列，轮流取任务，一个人提交几百个任务也不会饿死别人
+#   - 分析音轨由一个 ffmpeg 进程直接混成 16kHz 单声道 PCM 输出，音频信息取自它打印的
+#     输入流信息，不另起 ffprobe，也不先解码出原始采样率的完整音频
+#   - 导出句子片段时一个 ffmpeg 进程只解码一次源文件，同时写出一批片段，
+#     而不是每个片段各起一个进程
+# stats() 返回队列深度和最近任务的等待/执行耗时，供页面展示。
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import numpy as np
+from pydub import AudioSegment
+
+from audio_io import ANALYSIS_RATE
+
+MAX_WORKERS = int(os.environ.get("SHADOWING_FFMPEG_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+# 一个 ffmpeg 进程最多同时写出的片段数（受命令行长度限制）
+CLIPS_PER_PROCESS = 64
+
+# 统计最近多少个任务的耗时
+_HISTORY = 500
+
+
+class FFmpegError(RuntimeError):
+    pass
+
+
+_local = threading.local()
+
+
+def current_session():
+    """提交任务的会话 id
+
+    session_scope 指定的会话优先，其次是当前 Streamlit 会话；批处理等非网页环境统一归为一个会话。
+    """
+    session = getattr(_local, "session", None)
+    if session is not None:
+        return session
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        # 预热、跟读对齐等后台线程没有会话，不必警告
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except ImportError:
+        ctx = None
+    return ctx.session_id if ctx is not None else "local"
+
+
+@contextmanager
+def session_scope(session):
+    """在后台线程里以某个会话的名义提交任务
+
+    后台线程没有 Streamlit 会话，交给它的工作要在页面线程里先记下 current_session()，
+    在线程里用 session_scope 包住，任务才会排进该会话自己的队列。
+    """
+    previous = getattr(_local, "session", None)
+    _local.session = session
+    try:
+        yield
+    finally:
+        _local.session = previous
+
+
+def _run_ffmpeg(args):
+    command = [AudioSegment.converter, "-nostdin", "-hide_banner", "-loglevel", "error", "-y"] + args
+    process = subprocess.run(command, capture_output=True)
+    if process.returncode != 0:
+        raise FFmpegError(process.stderr.decode("utf-8", "replace").strip() or "ffmpeg 执行失败")
+    return process.stdout
+
+
+# ffmpeg 打印的第一个输入音频流，如 "Stream #0:0: Audio: mp3, 44100 Hz, stereo, fltp"
+_INPUT_STREAM = re.compile(rb"Stream #\d+:\d+.*?: Audio: [^\n]*?, (\d+) Hz, ([^,\n]+)")
+_LAYOUT_CHANNELS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "5.0": 5, "5.1": 6, "6.1": 7, "7.1": 8}
+
+
+def _channels(layout):
+    layout = layout.split("(")[0].strip()
+    match = re.match(r"(\d+) channels", layout)
+    return int(match.group(1)) if match else _LAYOUT_CHANNELS.get(layout, 2)
+
+
+def decode_analysis_file(path, sample_rate=ANALYSIS_RATE):
+    """用 ffmpeg 直接输出单声道、sample_rate 采样率的 16bit PCM，返回 (int16 数组, 音频信息)
+
+    混音和重采样都在 ffmpeg 里流式完成，内存里只有最终的分析音轨（10 分钟约 19MB），
+    不再先解码出原始采样率的完整音频再派生。音频信息 {duration_ms, frame_rate, channels}
+    取自 ffmpeg 打印的输入流信息。
+    """
+    command = [
+        AudioSegment.converter, "-nostdin", "-hide_banner", "-nostats", "-i", path, "-vn",
+        "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"
+    ]
+    # 输出先落到临时文件再整块读入，不在管道读取时拼接一份份缓冲区
+    with tempfile.TemporaryFile() as output:
+        process = subprocess.run(command, stdout=output, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            lines = process.stderr.decode("utf-8", "replace").strip().splitlines()
+            raise FFmpegError(lines[-1] if lines else "ffmpeg 执行失败")
+        output.seek(0)
+        track = np.fromfile(output, dtype=np.int16)
+    match = _INPUT_STREAM.search(process.stderr.split(b"Output #")[0])
+    frame_rate, channels = (int(match.group(1)), _channels(match.group(2).decode())) if match else (sample_rate, 1)
+    return track, {
+        "duration_ms": len(track) * 1000 // sample_rate,
+        "frame_rate": frame_rate,
+        "channels": channels,
+    }
+
+
+_DURATION = re.compile(rb"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+
+def probe_duration(path):
+    """只读文件头估计时长（秒），不解码；格式不给出时长时返回 None
+
+    开销只有几毫秒，不经过队列，用于上传时尽早拒绝过长的文件。
+    """
+    command = [AudioSegment.converter, "-nostdin", "-hide_banner", "-i", path, "-t", "0", "-f", "null", "-"]
+    process = subprocess.run(command, capture_output=True)
+    if process.returncode != 0:
+        lines = process.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise FFmpegError(lines[-1] if lines else "无法识别的音频文件")
+    match = _DURATION.search(process.stderr)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def encode_clips(path, clips, format="mp3", codec_args=()):
+    """从源文件一次性导出多个片段
+
+    clips 为 [(start_ms, end_ms, 输出路径), ...]；源文件只解码一次，
+    用 atrim 滤镜分出各个片段分别编码。
+    """
+    for begin in range(0, len(clips), CLIPS_PER_PROCESS):
+        batch = clips[begin:begin + CLIPS_PER_PROCESS]
+        filters = [
+            f"[0:a]atrim=start={start_ms / 1000}:end={end_ms / 1000},asetpts=PTS-STARTPTS[c{i}]"
+            for i, (start_ms, end_ms, _) in enumerate(batch)
+        ]
+        args = ["-i", path, "-filter_complex", ";".join(filters)]
+        for i, (_, _, output) in enumerate(batch):
+            args += ["-map", f"[c{i}]", *codec_args, "-f", format, output]
+        _run_ffmpeg(args)
+
+
+def encode_file(path, output, format="mp3", codec_args=()):
+    """整个文件转码"""
+    _run_ffmpeg(["-i", path, "-vn", *codec_args, "-f", format, output])
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MediaService:
+    """有并发上限、按会话轮转的任务队列"""
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._queues = OrderedDict()  # 会话 -> deque[(任务, 提交时间)]
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._waits = deque(maxlen=_HISTORY)
+        self._runs = deque(maxlen=_HISTORY)
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._work, name=f"ffmpeg-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, *args, session=None):
+        """提交任务，返回 Future"""
+        future = Future()
+        session = session or current_session()
+        with self._cond:
+            self._ensure_workers()
+            self._queues.setdefault(session, deque()).append((future, fn, args, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def run(self, fn, *args, session=None):
+        """提交任务并等待结果"""
+        return self.submit(fn, *args, session=session).result()
+
+    def _next_job(self):
+        # 取队首会话的一个任务，该会话还有任务就排到末尾，实现轮转
+        session, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[session]
+        if queue:
+            self._queues[session] = queue
+        return job
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                future, fn, args, submitted = self._next_job()
+                self._running += 1
+
+            started = time.perf_counter()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            finished = time.perf_counter()
+
+            with self._cond:
+                self._running -= 1
+                if not future.cancelled() and future.exception() is None:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+                self._waits.append(started - submitted)
+                self._runs.append(finished - started)
+
+    def stats(self):
+        """队列深度、运行中任务数和最近任务的等待/执行耗时(ms)"""
+        with self._cond:
+            waits = list(self._waits)
+            runs = list(self._runs)
+            return {
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "sessions_waiting": len(self._queues),
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_p50_ms": _percentile(waits, 0.5) * 1000,
+                "wait_p95_ms": _percentile(waits, 0.95) * 1000,
+                "run_p50_ms": _percentile(runs, 0.5) * 1000,
+                "run_p95_ms": _percentile(runs, 0.95) * 1000,
+            }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """进程内共享的服务实例"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = MediaService()
+        return _service
+
+
+def decode_analysis(path):
+    return get_service().run(decode_analysis_file, path)
+
+
+def export_clips(path, clips, format="mp3", codec_args=()):
+    return get_service().run(encode_clips, path, clips, format, codec_args)
+
+
+def transcode(path, output, format="mp3", codec_args=()):
+    return get_service().run(encode_file, path, output, format, codec_args)
@@ -1,10 +1,19 @@
 # app.py - 英语听力精听助手（无whisper依赖）
 import streamlit as st
 import tempfile
+import time
 import os
-import json
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
+import pipeline
+import media_service
+import media_server
+import session_bundle
+import session_store
+import shadowing_ui
+import stats_ui
+import uploads
+import waveform
+from review_scheduler import ReviewScheduler, item_id, score_dictation, quality_from_score, word_misses
+from stats_ui import get_practice_stats, log_play
 
 # 页面配置
 st.set_page_config(
@@ -18,16 +27,42 @@ if 'sentences' not in st.session_state:
     st.session_state.sentences = []
 if 'current_sentence' not in st.session_state:
     st.session_state.current_sentence = 0
-if 'audio_data' not in st.session_state:
-    st.session_state.audio_data = None
+if 'audio_info' not in st.session_state:
+    st.session_state.audio_info = None
 if 'audio_file' not in st.session_state:
     st.session_state.audio_file = None
+if 'source_path' not in st.session_state:
+    st.session_state.source_path = None
+if 'source_key' not in st.session_state:
+    st.session_state.source_key = None
+if 'cache_key' not in st.session_state:
+    st.session_state.cache_key = None
+if 'split_params' not in st.session_state:
+    st.session_state.split_params = None
+if 'imported_bundle' not in st.session_state:
+    st.session_state.imported_bundle = None
+if 'peaks' not in st.session_state:
+    st.session_state.peaks = None
+if 'audio_key' not in st.session_state:
+    st.session_state.audio_key = None
 if 'transcripts' not in st.session_state:
     st.session_state.transcripts = []
 if 'difficult_sentences' not in st.session_state:
     st.session_state.difficult_sentences = set()
 if 'playback_speed' not in st.session_state:
     st.session_state.playback_speed = 1.0
+if 'audio_name' not in st.session_state:
+    st.session_state.audio_name = ""
+if 'completed' not in st.session_state:
+    st.session_state.completed = 0  # 已听写的句子数，随听写内容增量更新
+if 'stats_session' not in st.session_state:
+    st.session_state.stats_session = session_store.new_session_id()  # 练习统计里区分不同会话
+if 'last_played' not in st.session_state:
+    st.session_state.last_played = None
+if 'scored_attempts' not in st.session_state:
+    st.session_state.scored_attempts = set()
+if 'review_skipped' not in st.session_state:
+    st.session_state.review_skipped = set()  # 本轮难句复习中跳过的句子
 
 # 自定义CSS
 st.markdown("""
@@ -57,14 +92,119 @@ st.markdown("""
 st.markdown('<div class="main-title">🎧 英语听力精听助手</div>', unsafe_allow_html=True)
 st.markdown('<div class="sub-title">上传音频 · 智能断句 · 高效精听</div>', unsafe_allow_html=True)
 
+@st.cache_resource
+def get_review_scheduler():
+    # 收藏的难句持久化到复习库，所有会话共用一个实例，卡片按学习者（会话 id）区分
+    return ReviewScheduler()
+
+def review_item(sentence):
+    # 句子在复习库中的标识和基本信息
+    start_ms = round(sentence['start_time'] * 1000)
+    end_ms = round(sentence['end_time'] * 1000)
+    info = {
+        "cache_key": st.session_state.cache_key,
+        "start_ms": start_ms,
+        "end_ms": end_ms,
+        "audio_name": st.session_state.audio_name,
+        "reference": sentence.get('transcript')
+    }
+    return item_id(st.session_state.cache_key, start_ms, end_ms), info
+
+def set_transcripts(transcripts):
+    # 整体替换听写内容（断句、导入、恢复会话）时重新数一次完成数
+    st.session_state.transcripts = transcripts
+    st.session_state.completed = sum(1 for t in transcripts if t.strip())
+
+def set_transcript(index, text):
+    # 单句听写变化时只调整完成数，不必每次重跑都数一遍
+    was_done = bool(st.session_state.transcripts[index].strip())
+    st.session_state.transcripts[index] = text
+    st.session_state.completed += bool(text.strip()) - was_done
+
+def load_starred(sentences):
+    # 从复习库恢复当前文件里收藏过的句子
+    spans = get_review_scheduler().starred_spans(st.session_state.session_id, st.session_state.cache_key)
+    return {
+        i for i, s in enumerate(sentences)
+        if (round(s['start_time'] * 1000), round(s['end_time'] * 1000)) in spans
+    }
+
+@st.cache_resource
+def get_session_store():
+    # 多进程部署时的外部会话存储，未配置 SHADOWING_SESSION_STORE 时为 None
+    return session_store.open_store()
+
+def submit_dictation(item, info, user_input, self_quality=3):
+    # 记一次听写：有原文时按正确率评分，没有原文时用自评分，结果交给复习调度
+    stats = get_practice_stats(st.session_state.session_id)
+    score = None
+    if info["reference"]:
+        score = score_dictation(info["reference"], user_input)
+        quality = quality_from_score(score)
+    else:
+        quality = self_quality
+    stats.record("submit", st.session_state.stats_session, item, info, mode="dictation", quality=quality)
+    if score is not None:
+        words, missed = word_misses(info["reference"], user_input)
+        stats.record("score", st.session_state.stats_session, item, info, score=round(score, 3), words=words, missed=missed)
+    card = get_review_scheduler().record(st.session_state.session_id, item, quality, info)
+    return score, card
+
+def self_assessment():
+    # 没有原文时由用户自评
+    return st.select_slider(
+        "自评掌握程度",
+        options=[0, 1, 2, 3, 4, 5],
+        value=3,
+        help="0 完全没听出来，5 一字不差；低于 3 的句子会很快再次复习"
+    )
+
+# 地址栏里的会话 id 区分学习者：复习队列按它保存，刷新或收藏地址后下次再来仍是同一份
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = session_store.resolve_session_id(st.query_params.get(session_store.QUERY_PARAM))
+    st.query_params[session_store.QUERY_PARAM] = st.session_state.session_id
+
+# 多进程部署：页面刷新或重连到另一个进程时，按会话 id 恢复会话
+store = get_session_store()
+if store is not None and 'saved_session' not in st.session_state:
+    saved = store.load(st.session_state.session_id)
+    if saved and saved["cache_key"]:
+        # 句子片段、分析结果都按内容哈希从共享缓存读取，不重新计算
+        key = saved["cache_key"]
+        st.session_state.cache_key = key
+        st.session_state.audio_name = saved["audio_name"]
+        st.session_state.split_params = saved["split_params"]
+        st.session_state.sentences = pipeline.restore_sentences(key, saved["spans"], saved["codec"])
+        set_transcripts(saved["transcripts"])
+        st.session_state.difficult_sentences = set(saved["starred"])
+        st.session_state.current_sentence = saved["current_sentence"]
+        source = pipeline.find_source(key)
+        if source is not None:
+            st.session_state.source_path = source
+            st.session_state.source_key = key
+            st.session_state.audio_info, _ = pipeline.analyze(source, key)
+            st.session_state.peaks = pipeline.load_peaks(source, key)
+    st.session_state.saved_session = saved
+
 # 侧边栏
 with st.sidebar:
     st.header("⚙️ 设置")
     
     # 断句参数
     st.subheader("断句参数")
+    segmenter = st.selectbox(
+        "断句方法",
+        list(pipeline.SEGMENTERS),
+        format_func=lambda name: pipeline.SEGMENTERS[name].label,
+        help="有背景音乐或环境噪声、按音量切不开句子时选语音活动检测"
+    )
     min_silence_len = st.slider("最小静音长度(ms)", 300, 1500, 500, 50)
-    silence_thresh = st.slider("静音阈值(dBFS)", -60, -20, -40, 5)
+    # 句子两端保留100ms静音
+    params = {"segmenter": segmenter, "min_silence_len": min_silence_len, "keep_silence": 100}
+    if segmenter == "vad":
+        params["speech_thresh"] = st.slider("语音判定阈值", 0.2, 0.8, 0.5, 0.05, help="越高越容易判为停顿，句子切得越碎")
+    else:
+        params["silence_thresh"] = st.slider("静音阈值(dBFS)", -60, -20, -40, 5)
     
     # 播放设置
     st.subheader("播放设置")
@@ -73,19 +213,21 @@ with st.sidebar:
         options=[0.5, 0.75, 1.0, 1.25, 1.5, 2.0],
         value=1.0
     )
+    delivery_codec = st.selectbox(
+        "音频格式",
+        list(pipeline.DELIVERY_CODECS),
+        format_func=lambda codec: pipeline.DELIVERY_CODECS[codec]["label"],
+        help="Opus 体积约为 MP3 的四分之一，网络慢时推荐；旧版 Safari 请选 MP3"
+    )
     
     st.divider()
     
     # 工具按钮
     st.subheader("🛠️ 工具")
     if st.button("🔄 重置所有", use_container_width=True, type="secondary"):
-        # 清理临时文件
-        for sentence in st.session_state.sentences:
-            if 'audio_path' in sentence and os.path.exists(sentence['audio_path']):
-                try:
-                    os.unlink(sentence['audio_path'])
-                except:
-                    pass
+        # 原文件和句子片段在共享缓存里，不删除；外部存储里的会话数据一并清掉
+        if store is not None:
+            store.delete(st.session_state.session_id)
         
         # 重置session state
         keys = list(st.session_state.keys())
@@ -94,23 +236,72 @@ with st.sidebar:
         
         st.rerun()
     
+    include_clips = st.checkbox("导出时包含音频片段", value=False)
     if st.button("📊 导出数据", use_container_width=True):
         if st.session_state.sentences:
-            export_data = {
-                "audio_name": st.session_state.audio_file.name if st.session_state.audio_file else "unknown",
-                "total_sentences": len(st.session_state.sentences),
-                "sentences": []
-            }
+            bundle = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+            session_bundle.write_bundle(
+                bundle,
+                st.session_state.sentences,
+                st.session_state.transcripts,
+                starred=st.session_state.difficult_sentences,
+                audio_name=st.session_state.audio_name or "unknown",
+                cache_key=st.session_state.cache_key,
+                params=st.session_state.split_params,
+                include_clips=include_clips
+            )
+            bundle.seek(0)
             
             st.download_button(
-                "下载JSON",
-                json.dumps(export_data, indent=2),
-                "listening_data.json",
-                "application/json"
+                "下载会话",
+                bundle.read(),
+                "listening_session.zip",
+                "application/zip"
             )
+    
+    # 导入会话：恢复句子、听写内容和收藏
+    session_file = st.file_uploader("📥 导入会话", type=["zip"])
+    if session_file is not None and st.session_state.imported_bundle != session_file.file_id:
+        try:
+            restored = session_bundle.read_bundle(session_file)
+            st.session_state.sentences = restored["sentences"]
+            set_transcripts(restored["dictations"])
+            st.session_state.difficult_sentences = restored["starred"]
+            st.session_state.current_sentence = 0
+            st.session_state.cache_key = restored["cache_key"]
+            st.session_state.audio_name = restored["audio_name"]
+            for i in restored["starred"]:
+                item, info = review_item(restored["sentences"][i])
+                get_review_scheduler().set_starred(st.session_state.session_id, item, True, info)
+            st.session_state.split_params = restored["params"]
+            st.session_state.imported_bundle = session_file.file_id
+            st.session_state.peaks = None
+            st.success(f"✅ 已导入 {len(restored['sentences'])} 个句子")
+        except session_bundle.BundleError as e:
+            st.error(f"导入失败: {str(e)}")
+    
+    # ffmpeg 解码/编码队列状态
+    with st.expander("📈 服务状态"):
+        stats = media_service.get_service().stats()
+        st.caption(f"ffmpeg 任务: {stats['queued']} 排队 · {stats['running']}/{stats['max_workers']} 运行中 · 已完成 {stats['completed']}")
+        st.caption(f"等待 p50/p95: {stats['wait_p50_ms']:.0f}/{stats['wait_p95_ms']:.0f} ms")
+        st.caption(f"执行 p50/p95: {stats['run_p50_ms']:.0f}/{stats['run_p95_ms']:.0f} ms")
+
+# 切换音频格式后补导出当前句子的片段（每个片段每种格式只编码一次）
+if (st.session_state.sentences and st.session_state.split_params
+        and st.session_state.source_key == st.session_state.cache_key
+        and st.session_state.sentences[0].get("codec") != delivery_codec):
+    with st.spinner("正在转换音频格式..."):
+        st.session_state.sentences = pipeline.build_sentences(
+            st.session_state.cache_key,
+            st.session_state.source_path,
+            [(round(s['start_time'] * 1000), round(s['end_time'] * 1000)) for s in st.session_state.sentences],
+            st.session_state.split_params,
+            codec=delivery_codec
+        )
 
 # 主界面
-tab1, tab2 = st.tabs(["📁 上传与断句", "🎵 听写练习"])
+tab1, tab2, tab3, tab4 = st.tabs(["📁 上传与断句", "🎵 听写练习", "🎤 跟读练习", "📊 练习统计"])
 
 with tab1:
     col1, col2 = st.columns([1, 2])
@@ -130,51 +321,75 @@ with tab1:
             
             # 显示文件信息
             st.success(f"✅ {uploaded_file.name}")
-            st.audio(uploaded_file, format=f"audio/{uploaded_file.type.split('/')[-1]}")
+            # 整段播放：分析完成后从缓存按地址提供（opus 格式转码一次）
+            if st.session_state.audio_key != uploaded_file.file_id:
+                st.audio(uploaded_file, format=f"audio/{uploaded_file.type.split('/')[-1]}")
+            else:
+                with st.spinner("正在转码整段音频..."):
+                    full_path, full_mime = pipeline.delivery_file(
+                        st.session_state.source_key, st.session_state.source_path, delivery_codec
+                    )
+                st.audio(media_server.url(full_path), format=full_mime)
             
-            # 断句按钮
-            if st.button("🔍 开始智能断句", type="primary", use_container_width=True):
+            # 新文件上传后分析一次；批量预处理过的文件直接读缓存
+            if st.session_state.audio_key != uploaded_file.file_id:
                 with st.spinner("正在分析音频..."):
                     try:
-                        # 保存临时文件
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-                            tmp.write(uploaded_file.getvalue())
-                            tmp_path = tmp.name
+                        # 分块写入共享缓存并计算哈希，超出大小/时长上限的文件在解码前拒绝
+                        key, source = uploads.spool(uploaded_file)
+                        info, _ = pipeline.analyze(source, key, segmenter)
                         
-                        # 加载音频
-                        audio = AudioSegment.from_file(tmp_path)
+                        st.session_state.source_path = source
+                        st.session_state.source_key = key
+                        st.session_state.cache_key = key
+                        st.session_state.audio_name = uploaded_file.name
+                        st.session_state.audio_info = info
+                        st.session_state.peaks = pipeline.load_peaks(source, key)
+                        st.session_state.audio_key = uploaded_file.file_id
                         
-                        # 断句
-                        chunks = split_on_silence(
-                            audio,
-                            min_silence_len=min_silence_len,
-                            silence_thresh=silence_thresh,
-                            keep_silence=100
-                        )
-                        
-                        # 保存句子
-                        st.session_state.sentences = []
-                        for i, chunk in enumerate(chunks):
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as chunk_file:
-                                chunk.export(chunk_file.name, format="mp3")
-                                
-                                sentence_data = {
-                                    "id": i,
-                                    "path": chunk_file.name,
-                                    "duration": len(chunk) / 1000
-                                }
-                                st.session_state.sentences.append(sentence_data)
-                        
-                        st.session_state.transcripts = [""] * len(chunks)
-                        st.session_state.current_sentence = 0
-                        
-                        st.success(f"✅ 断句完成！共 {len(chunks)} 个句子")
-                        
-                        # 清理主临时文件
-                        os.unlink(tmp_path)
+                        # 当前参数已有预处理结果时直接载入句子
+                        cached = pipeline.load_sentences(key, params, delivery_codec)
+                        if cached:
+                            st.session_state.sentences = cached
+                            set_transcripts([""] * len(cached))
+                            st.session_state.difficult_sentences = load_starred(cached)
+                            st.session_state.current_sentence = 0
+                            st.session_state.split_params = params
                         
                     except Exception as e:
                         st.error(f"处理失败: {str(e)}")
+            
+            if st.session_state.audio_key == uploaded_file.file_id:
+                # 参数变化时即时预览句子数
+                with st.spinner("正在分析音频..."):
+                    info, features = pipeline.analyze(st.session_state.source_path, st.session_state.source_key, segmenter)
+                spans = pipeline.find_spans(info, features, params)
+                st.caption(f"按当前参数预计 {len(spans)} 个句子")
+                
+                # 断句按钮
+                if st.button("🔍 开始智能断句", type="primary", use_container_width=True):
+                    with st.spinner("正在导出句子..."):
+                        try:
+                            # 保存句子（片段按上传文件自己的哈希导出到共享缓存）
+                            st.session_state.sentences = pipeline.build_sentences(
+                                st.session_state.source_key,
+                                st.session_state.source_path,
+                                spans,
+                                params,
+                                codec=delivery_codec
+                            )
+                            st.session_state.cache_key = st.session_state.source_key
+                            st.session_state.peaks = pipeline.load_peaks(st.session_state.source_path, st.session_state.source_key)
+                            st.session_state.audio_name = uploaded_file.name
+                            set_transcripts([""] * len(spans))
+                            st.session_state.difficult_sentences = load_starred(st.session_state.sentences)
+                            st.session_state.current_sentence = 0
+                            st.session_state.split_params = params
+                            
+                            st.success(f"✅ 断句完成！共 {len(spans)} 个句子")
+                            
+                        except Exception as e:
+                            st.error(f"处理失败: {str(e)}")
         
         # 使用说明
         with st.expander("📖 使用说明"):
@@ -189,6 +404,19 @@ with tab1:
         if st.session_state.sentences:
             st.header("断句结果")
             
+            # 整段波形与句子边界，当前句子高亮
+            if st.session_state.peaks is not None:
+                st.vega_lite_chart(
+                    waveform.chart(
+                        st.session_state.peaks,
+                        0,
+                        st.session_state.audio_info["duration_ms"] / 1000,
+                        spans=[(s['start_time'], s['end_time']) for s in st.session_state.sentences],
+                        current=st.session_state.current_sentence
+                    ),
+                    use_container_width=True
+                )
+            
             # 导航
             total = len(st.session_state.sentences)
             current = st.session_state.current_sentence
@@ -226,10 +454,9 @@ with tab1:
             """, unsafe_allow_html=True)
             
             # 播放音频
-            if os.path.exists(sentence['path']):
-                with open(sentence['path'], 'rb') as f:
-                    audio_bytes = f.read()
-                st.audio(audio_bytes, format="audio/mp3")
+            if os.path.exists(sentence['audio_path']):
+                st.audio(media_server.url(sentence['audio_path']), format=sentence.get('mime', "audio/mp3"))
+                log_play(*review_item(sentence))
             
             # 听写区域
             transcript = st.text_area(
@@ -240,7 +467,7 @@ with tab1:
             )
             
             if transcript != st.session_state.transcripts[current]:
-                st.session_state.transcripts[current] = transcript
+                set_transcript(current, transcript)
             
             # 收藏按钮
             col_fav1, col_fav2 = st.columns([3, 1])
@@ -248,73 +475,145 @@ with tab1:
                 if current in st.session_state.difficult_sentences:
                     if st.button("⭐ 已收藏", type="secondary"):
                         st.session_state.difficult_sentences.remove(current)
+                        item, info = review_item(sentence)
+                        get_review_scheduler().set_starred(st.session_state.session_id, item, False, info)
+                        get_practice_stats(st.session_state.session_id).record("star", st.session_state.stats_session, item, info, starred=False)
                         st.rerun()
                 else:
                     if st.button("☆ 收藏"):
                         st.session_state.difficult_sentences.add(current)
+                        item, info = review_item(sentence)
+                        get_review_scheduler().set_starred(st.session_state.session_id, item, True, info)
+                        get_practice_stats(st.session_state.session_id).record("star", st.session_state.stats_session, item, info, starred=True)
                         st.rerun()
         
         else:
             st.info("👈 请先上传音频并进行断句")
 
 with tab2:
-    if st.session_state.sentences:
+    scheduler = get_review_scheduler()
+    # 难句复习的卡片自带文件哈希和起止时间，不需要先上传音频
+    if st.session_state.sentences or scheduler.count(st.session_state.session_id):
         st.header("听写练习")
+        modes = ["逐句练习", "难句复习"] if st.session_state.sentences else ["难句复习"]
+        practice_mode = st.radio("练习模式", modes, horizontal=True)
         
-        # 练习控制
-        current = st.session_state.current_sentence
-        sentence = st.session_state.sentences[current]
-        
-        # 播放控制
-        col_play1, col_play2 = st.columns([4, 1])
-        with col_play1:
-            if os.path.exists(sentence['path']):
-                with open(sentence['path'], 'rb') as f:
-                    audio_bytes = f.read()
-                st.audio(audio_bytes, format="audio/mp3")
-        
-        with col_play2:
-            if st.button("🔁 重播"):
-                pass
-        
-        # 听写输入
-        user_input = st.text_area(
-            "你的答案",
-            height=100,
-            key=f"practice_{current}"
-        )
-        
-        # 控制按钮
-        col_btn1, col_btn2, col_btn3 = st.columns(3)
-        with col_btn1:
-            if st.button("提交", type="primary"):
-                if user_input:
-                    st.session_state.transcripts[current] = user_input
-                    st.success("已保存！")
-        
-        with col_btn2:
-            if st.button("下一句") and current < total - 1:
-                st.session_state.current_sentence += 1
-                st.rerun()
-        
-        with col_btn3:
-            if st.button("完成练习"):
-                st.balloons()
-                st.success("练习完成！")
+        if practice_mode == "难句复习":
+            # 从复习队列里取最早到期的一句（收藏的难句和听错的句子）
+            card = scheduler.next_due(st.session_state.session_id, skip=st.session_state.review_skipped)
+            if card is None:
+                st.info(f"🎉 暂时没有到期的难句（复习库共 {scheduler.count(st.session_state.session_id)} 句），收藏难句或听错的句子会自动加入")
+                if st.session_state.review_skipped and st.button("重新复习跳过的句子"):
+                    st.session_state.review_skipped = set()
+                    st.rerun()
+            else:
+                item = card["item_id"]
+                st.caption(f"📚 {card['audio_name']} · {card['start_ms'] / 1000:.1f}s · 已复习 {card['repetitions']} 次")
+                audio_path, audio_mime = pipeline.find_clip(card["cache_key"], card["start_ms"], card["end_ms"], delivery_codec)
+                if audio_path is not None:
+                    st.audio(media_server.url(audio_path), format=audio_mime)
+                    log_play(item, card)
+                else:
+                    st.warning("这句的音频片段不在缓存里，重新上传原音频并断句后即可播放")
+                
+                user_input = st.text_area("你的答案", height=100, key=f"review_{item}")
+                self_quality = self_assessment() if not card["reference"] else None
+                
+                col_btn1, col_btn2 = st.columns(2)
+                with col_btn1:
+                    if st.button("提交", type="primary", key="review_submit"):
+                        score, card = submit_dictation(item, card, user_input, self_quality)
+                        if score is not None:
+                            st.info(f"正确率: {score:.0%}")
+                        st.success(f"已保存！下次复习: {time.strftime('%m-%d %H:%M', time.localtime(card['due']))}")
+                with col_btn2:
+                    if st.button("下一句", key="review_next"):
+                        st.session_state.review_skipped.add(item)
+                        st.rerun()
         
-        # 进度
-        completed = sum(1 for t in st.session_state.transcripts if t.strip())
-        total = len(st.session_state.transcripts)
-        st.progress(completed / total if total > 0 else 0)
-        st.caption(f"进度: {completed}/{total}")
+        else:
+            # 练习控制
+            current = st.session_state.current_sentence
+            sentence = st.session_state.sentences[current]
+            total = len(st.session_state.sentences)
+            
+            # 播放控制
+            col_play1, col_play2 = st.columns([4, 1])
+            with col_play1:
+                if os.path.exists(sentence['audio_path']):
+                    st.audio(media_server.url(sentence['audio_path']), format=sentence.get('mime', "audio/mp3"))
+            
+            with col_play2:
+                if st.button("🔁 重播"):
+                    get_practice_stats(st.session_state.session_id).record("play", st.session_state.stats_session, *review_item(sentence))
+            
+            # 听写输入
+            user_input = st.text_area(
+                "你的答案",
+                height=100,
+                key=f"practice_{current}"
+            )
+            item, info = review_item(sentence)
+            self_quality = self_assessment() if not info["reference"] else None
+            
+            # 控制按钮
+            col_btn1, col_btn2, col_btn3 = st.columns(3)
+            with col_btn1:
+                if st.button("提交", type="primary"):
+                    if user_input:
+                        set_transcript(current, user_input)
+                        # 导入的会话带原文时顺便评分；听写结果进入复习队列
+                        score, card = submit_dictation(item, info, user_input, self_quality)
+                        if score is not None:
+                            st.info(f"正确率: {score:.0%}")
+                        st.success("已保存！")
+            
+            with col_btn2:
+                if st.button("下一句") and current < total - 1:
+                    st.session_state.current_sentence += 1
+                    st.rerun()
+            
+            with col_btn3:
+                if st.button("完成练习"):
+                    st.balloons()
+                    st.success("练习完成！")
+            
+            # 进度
+            completed = st.session_state.completed
+            total = len(st.session_state.transcripts)
+            st.progress(completed / total if total > 0 else 0)
+            st.caption(f"进度: {completed}/{total}")
     
     else:
         st.info("请先上传音频并进行断句")
 
+with tab3:
+    shadowing_ui.render_shadowing_tab(get_practice_stats(st.session_state.session_id))
+
+with tab4:
+    stats_ui.render_stats_tab()
+
+# 保存会话数据供其他进程恢复，内容没变时不写
+if store is not None:
+    snapshot = {
+        "cache_key": st.session_state.cache_key,
+        "audio_name": st.session_state.audio_name,
+        "split_params": st.session_state.split_params,
+        "codec": st.session_state.sentences[0].get("codec", pipeline.DEFAULT_CODEC) if st.session_state.sentences else delivery_codec,
+        "spans": [[round(s['start_time'] * 1000), round(s['end_time'] * 1000)] for s in st.session_state.sentences],
+        "transcripts": list(st.session_state.transcripts),
+        "starred": sorted(st.session_state.difficult_sentences),
+        "current_sentence": st.session_state.current_sentence
+    }
+    if snapshot != st.session_state.saved_session:
+        store.save(st.session_state.session_id, snapshot)
+        st.session_state.saved_session = snapshot
+
 # 底部信息
 st.divider()
 st.markdown("""
 <div style="text-align: center; color: #666;">
-    <p>英语听力精听助手 | Streamlit 版本 | 本地运行，保护隐私</p>
+    <p>英语听力精听助手 | Streamlit 版本</p>
+    <p>💡 提示：上传的音频、跟读录音和练习记录会保存在服务器上；请勿上传不希望保存的录音</p>
 </div>
 """, unsafe_allow_html=True)
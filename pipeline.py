@@ -0,0 +1,246 @@
+# pipeline.py - 解码 → 包络 → 断句 → 导出片段/识别原文
+#
+# 网页端和 batch_ingest.py 共用这套流程，所有中间结果都经 artifact_cache
+# 按内容哈希缓存：同一文件无论被多少个会话/进程同时打开，每一步只算一次。
+import mimetypes
+import os
+import shutil
+import tempfile
+
+from segmentation import SEGMENTERS, DEFAULT_SEGMENTER, get_segmenter
+from waveform import build_pyramid
+from asr import transcribe_span
+import artifact_cache
+import media_service
+
+# 与网页端侧边栏默认值一致
+DEFAULT_PARAMS = {
+    "min_silence_len": 500,
+    "silence_thresh": -40,
+    "keep_silence": 100,
+}
+
+# 句子片段和整段播放的分发格式。mp3 兼容性最好；opus 在语音码率下
+# 体积只有 mp3 的几分之一，适合手机流量。ext 同时区分缓存里的文件名。
+OPUS_BITRATE = os.environ.get("SHADOWING_OPUS_BITRATE", "32k")
+_OPUS_ARGS = ("-c:a", "libopus", "-b:a", OPUS_BITRATE, "-ac", "1", "-application", "voip")
+DELIVERY_CODECS = {
+    "mp3": {"label": "MP3（兼容性最好）", "ext": "mp3", "format": "mp3", "mime": "audio/mpeg", "args": ()},
+    "opus-webm": {"label": "Opus/WebM（省流量）", "ext": "webm", "format": "webm", "mime": "audio/webm", "args": _OPUS_ARGS},
+    "opus-ogg": {"label": "Opus/Ogg（省流量）", "ext": "ogg", "format": "ogg", "mime": "audio/ogg", "args": _OPUS_ARGS},
+}
+DEFAULT_CODEC = "mp3"
+
+
+def load_track(path, key):
+    """16kHz 单声道分析音轨，由 ffmpeg 直接解码出来后存盘，所有会话共享"""
+    def create():
+        track, info = media_service.decode_analysis(path)
+        artifact_cache.write_json(key, "info.json", info)
+        return track
+
+    return artifact_cache.get_array(key, "track.npy", create)
+
+
+def analyze(path, key, segmenter=DEFAULT_SEGMENTER):
+    """读取或计算音频信息与断句特征（能量法为能量包络），返回 (info, features)"""
+    backend = SEGMENTERS[segmenter]
+    features = artifact_cache.get_array(
+        key, backend.features_name,
+        lambda: backend.features(load_track(path, key))
+    )
+
+    def create_info():
+        # 音频信息在解码出分析音轨时一并写入
+        load_track(path, key)
+        return artifact_cache.read_json(key, "info.json")
+
+    info = artifact_cache.get_json(key, "info.json", create_info)
+    return info, features
+
+
+def load_peaks(path, key):
+    """波形峰值金字塔，每个文件只计算一次"""
+    return artifact_cache.get_arrays(
+        key, "peaks.npz",
+        lambda: build_pyramid(load_track(path, key))
+    )
+
+
+def find_spans(info, features, params):
+    return get_segmenter(params).detect(features, params, info["duration_ms"])
+
+
+def sentences_name(params):
+    backend = get_segmenter(params)
+    # 能量法沿用原来的文件名，已有的缓存继续有效
+    prefix = "sentences" if backend.name == DEFAULT_SEGMENTER else f"sentences_{backend.name}"
+    return "_".join([prefix] + [str(params[name]) for name in backend.param_names]) + ".json"
+
+
+def transcript_name(start_ms, end_ms):
+    return f"transcript_{start_ms}_{end_ms}.json"
+
+
+def clip_name(start_ms, end_ms, codec=DEFAULT_CODEC):
+    return f"clip_{start_ms}_{end_ms}.{DELIVERY_CODECS[codec]['ext']}"
+
+
+def find_clip(key, start_ms, end_ms, codec=DEFAULT_CODEC):
+    """已导出的句子片段 (路径, MIME)，优先指定格式，没有则用其他已导出的格式"""
+    for name in (codec, *DELIVERY_CODECS):
+        path = artifact_cache.artifact_path(key, clip_name(start_ms, end_ms, name))
+        if os.path.exists(path):
+            return path, DELIVERY_CODECS[name]["mime"]
+    return None, None
+
+
+def load_sentences(key, params, codec=DEFAULT_CODEC):
+    """读取某组断句参数下已导出的句子列表
+
+    没有断句结果或片段还没导出为指定格式时返回 None。
+    """
+    sentences = artifact_cache.read_json(key, sentences_name(params))
+    if sentences is None:
+        return None
+    for sentence in sentences:
+        clip = clip_name(round(sentence["start_time"] * 1000), round(sentence["end_time"] * 1000), codec)
+        if not artifact_cache.has(key, clip):
+            return None
+        sentence["clip"] = clip
+        sentence["codec"] = codec
+        sentence["mime"] = DELIVERY_CODECS[codec]["mime"]
+        sentence["audio_path"] = artifact_cache.artifact_path(key, clip)
+    return sentences
+
+
+def export_clips(key, path, spans, codec=DEFAULT_CODEC):
+    """把缓存里还没有的句子片段一次性导出（一个 ffmpeg 进程处理一批）"""
+    def missing():
+        return [
+            (start_ms, end_ms) for start_ms, end_ms in spans
+            if not artifact_cache.has(key, clip_name(start_ms, end_ms, codec))
+        ]
+
+    if not missing():
+        return
+    spec = DELIVERY_CODECS[codec]
+    with artifact_cache.exclusive(key, f"clips.{codec}"):
+        todo = missing()
+        if not todo:
+            return
+        # 先写到临时目录，全部成功后再逐个改名进缓存
+        tmp_dir = tempfile.mkdtemp(dir=artifact_cache.entry_dir(key), prefix=".tmp-")
+        try:
+            outputs = [
+                (start_ms, end_ms, os.path.join(tmp_dir, clip_name(start_ms, end_ms, codec)))
+                for start_ms, end_ms in todo
+            ]
+            media_service.export_clips(path, outputs, spec["format"], spec["args"])
+            written = sum(os.path.getsize(output) for _, _, output in outputs)
+            for start_ms, end_ms, output in outputs:
+                os.replace(output, artifact_cache.artifact_path(key, clip_name(start_ms, end_ms, codec)))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    artifact_cache.account_write(written)
+
+
+def build_sentences(key, path, spans, params, model=None, codec=DEFAULT_CODEC):
+    """按指定格式导出每个句子的片段（可选识别原文），写入缓存并返回句子列表
+
+    片段和原文按起止时间命名，不同参数切出的相同句子只处理一次；
+    句子列表与格式无关，换格式只需补导出片段。
+    """
+    export_clips(key, path, spans, codec)
+
+    sentences = []
+    for i, (start_ms, end_ms) in enumerate(spans):
+        sentence = {
+            "id": i,
+            "duration": (end_ms - start_ms) / 1000,
+            "start_time": start_ms / 1000,
+            "end_time": end_ms / 1000
+        }
+        if model is not None:
+            transcript = artifact_cache.get_json(
+                key, transcript_name(start_ms, end_ms),
+                lambda: transcribe_span(model, load_track(path, key), start_ms, end_ms)
+            )
+        else:
+            transcript = artifact_cache.read_json(key, transcript_name(start_ms, end_ms))
+        if transcript is not None:
+            sentence["transcript"] = transcript
+        sentences.append(sentence)
+
+    artifact_cache.write_json(key, sentences_name(params), sentences)
+    return load_sentences(key, params, codec)
+
+
+def restore_sentences(key, spans, codec=DEFAULT_CODEC):
+    """由句子起止时间和缓存里已有的片段、原文恢复句子列表，不导出也不识别"""
+    sentences = []
+    for i, (start_ms, end_ms) in enumerate(spans):
+        audio_path, mime = find_clip(key, start_ms, end_ms, codec)
+        sentence = {
+            "id": i,
+            "clip": os.path.basename(audio_path) if audio_path else clip_name(start_ms, end_ms, codec),
+            "codec": codec,
+            "mime": mime or DELIVERY_CODECS[codec]["mime"],
+            "audio_path": audio_path or artifact_cache.artifact_path(key, clip_name(start_ms, end_ms, codec)),
+            "duration": (end_ms - start_ms) / 1000,
+            "start_time": start_ms / 1000,
+            "end_time": end_ms / 1000
+        }
+        transcript = artifact_cache.read_json(key, transcript_name(start_ms, end_ms))
+        if transcript is not None:
+            sentence["transcript"] = transcript
+        sentences.append(sentence)
+    return sentences
+
+
+def _ensure(key, name, write):
+    if not artifact_cache.has(key, name):
+        with artifact_cache.exclusive(key, name):
+            if not artifact_cache.has(key, name):
+                artifact_cache.atomic_write(key, name, write)
+    return artifact_cache.artifact_path(key, name)
+
+
+def store_source(key, path, move=False):
+    """把上传的原文件放进缓存（source.<扩展名>），返回缓存内路径
+
+    之后导出片段、转码都从这里读，任何进程都能找到，不依赖某个进程的临时文件。
+    move=True 时直接把文件改名进缓存（须与缓存在同一文件系统）。
+    """
+    ext = os.path.splitext(path)[1].lower() or ".mp3"
+    place = os.replace if move else shutil.copyfile
+    return _ensure(key, f"source{ext}", lambda tmp: place(path, tmp))
+
+
+def find_source(key):
+    """缓存里的原文件路径，没有则返回 None"""
+    try:
+        names = os.listdir(artifact_cache.entry_dir(key))
+    except FileNotFoundError:
+        return None
+    for name in names:
+        if name.startswith("source."):
+            artifact_cache.touch(key)
+            return artifact_cache.artifact_path(key, name)
+    return None
+
+
+def delivery_file(key, path, codec=DEFAULT_CODEC):
+    """整段播放用的音频 (缓存内路径, MIME)
+
+    mp3 播放上传的原文件；opus 转码一次后缓存，之后所有会话共用。
+    """
+    if codec == DEFAULT_CODEC:
+        source = store_source(key, path)
+        return source, mimetypes.guess_type(source)[0] or "audio/mpeg"
+    spec = DELIVERY_CODECS[codec]
+    full = _ensure(
+        key, f"full.{spec['ext']}",
+        lambda tmp: media_service.transcode(path, tmp, spec["format"], spec["args"])
+    )
+    return full, spec["mime"]
@@ -0,0 +1,315 @@
+# practice_stats.py - 练习统计
+#
+# 练习事件（播放、提交、评分、收藏）逐行追加到本地事件日志 events.jsonl，同时在内存里
+# 增量更新汇总：每句的练习次数、最近几次得分、用时，按天的练习量和正确率，每个单词
+# 听写的次数和漏掉的次数。汇总定期写到 stats.json，里面记下已计入的日志字节偏移。
+# 打开统计只读 stats.json，再补上偏移之后的少量日志，不会扫描整个日志；
+# 多个进程共用同一目录时，各自追加日志，写汇总前先补齐其他进程追加的事件。
+#
+# 统计保存在 SHADOWING_STATS_DIR（默认 ~/.shadowing/stats）下，每个学习者（页面地址里的
+# 会话 id）一个子目录，不同学习者的练习互不混在一起。
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只做进程内互斥
+    fcntl = None
+
+STATS_DIR = os.environ.get(
+    "SHADOWING_STATS_DIR",
+    os.path.join(os.path.expanduser("~"), ".shadowing", "stats")
+)
+
+EVENTS = ("play", "submit", "score", "star")
+
+# 同一会话两次事件间隔超过这么久(秒)算中途离开，不计入练习时间
+IDLE_GAP = 5 * 60
+
+# 每句保留最近几次得分，用于看走势
+TREND_LENGTH = 10
+
+# 汇总之后追加的日志超过这么多字节、并且超过汇总本身的大小时，写一次汇总：
+# 写汇总的开销按日志量摊薄，打开时补读的日志也不会比汇总本身还大
+CHECKPOINT_BYTES = 64 * 1024
+
+
+def user_directory(user, root=STATS_DIR):
+    """学习者的统计目录；user 来自页面地址，只接受十六进制 id，不能拼出目录外的路径"""
+    if not re.fullmatch(r"[0-9a-f]{1,64}", user or ""):
+        raise ValueError(f"无效的学习者 id {user!r}")
+    return os.path.join(root, user)
+
+
+def _empty():
+    return {
+        "offset": 0,
+        "events": 0,
+        "totals": {"plays": 0, "attempts": 0, "scored": 0, "score_sum": 0.0, "time_s": 0.0},
+        "days": {},
+        "sentences": {},
+        "words": {},
+        "sessions": {},
+    }
+
+
+def _day(ts):
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+
+class PracticeStats:
+    """事件日志 + 增量汇总，统计页只读汇总"""
+
+    def __init__(self, directory=STATS_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self._log_path = os.path.join(directory, "events.jsonl")
+        self._summary_path = os.path.join(directory, "stats.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.Lock()
+        self._data = _empty()
+        self._stamp = None
+        self._unsaved = 0  # 已计入内存汇总、还没写进 stats.json 的日志字节数
+        with self._lock:
+            self._refresh()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """读入其他进程写过的汇总，再补上汇总之后追加的事件"""
+        try:
+            stat = os.stat(self._summary_path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if stamp is not None and stamp != self._stamp:
+            try:
+                with open(self._summary_path, encoding="utf-8") as f:
+                    loaded = json.load(f)
+            except (OSError, ValueError):
+                loaded = None
+            if loaded and loaded["offset"] > self._data["offset"]:
+                self._data = loaded
+                self._unsaved = 0
+            self._stamp = stamp
+
+        try:
+            size = os.path.getsize(self._log_path)
+        except OSError:
+            size = 0
+        if size < self._data["offset"]:
+            # 日志被清空或替换过，汇总作废
+            self._data = _empty()
+        if size == self._data["offset"]:
+            return
+        with open(self._log_path, "rb") as f:
+            f.seek(self._data["offset"])
+            tail = f.read(size - self._data["offset"])
+        # 只处理完整的行，另一个进程正在写的半行留到下次
+        end = tail.rfind(b"\n") + 1
+        for line in tail[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue
+        self._data["offset"] += end
+        self._unsaved += end
+
+    def _apply(self, event):
+        data = self._data
+        totals = data["totals"]
+        ts = event["ts"]
+        day = data["days"].setdefault(_day(ts), {"attempts": 0, "scored": 0, "score_sum": 0.0, "time_s": 0.0})
+        data["events"] += 1
+
+        # 练习时间：同一会话里与上一个事件的间隔，算在这个事件的句子上
+        session = event.get("session")
+        spent = 0.0
+        if session:
+            last = data["sessions"].get(session)
+            if last is not None and 0 <= ts - last <= IDLE_GAP:
+                spent = ts - last
+            data["sessions"][session] = ts
+        totals["time_s"] += spent
+        day["time_s"] += spent
+
+        sentence = None
+        item = event.get("item")
+        if item:
+            sentence = data["sentences"].setdefault(item, {
+                "audio_name": "", "start_ms": None, "end_ms": None, "reference": None,
+                "plays": 0, "attempts": 0, "scores": [], "time_s": 0.0, "starred": False, "last": ts,
+            })
+            for field in ("audio_name", "start_ms", "end_ms", "reference"):
+                if event.get(field) is not None:
+                    sentence[field] = event[field]
+            sentence["time_s"] += spent
+            sentence["last"] = ts
+
+        kind = event["type"]
+        if kind == "play":
+            totals["plays"] += 1
+            if sentence is not None:
+                sentence["plays"] += 1
+        elif kind == "submit":
+            totals["attempts"] += 1
+            day["attempts"] += 1
+            if sentence is not None:
+                sentence["attempts"] += 1
+        elif kind == "score":
+            score = float(event["score"])
+            totals["scored"] += 1
+            totals["score_sum"] += score
+            day["scored"] += 1
+            day["score_sum"] += score
+            if sentence is not None:
+                sentence["scores"] = (sentence["scores"] + [round(score, 2)])[-TREND_LENGTH:]
+            # 单词计数为 [出现次数, 漏掉次数]
+            for word in event.get("words", []):
+                data["words"].setdefault(word, [0, 0])[0] += 1
+            for word in event.get("missed", []):
+                data["words"].setdefault(word, [0, 0])[1] += 1
+        elif kind == "star" and sentence is not None:
+            sentence["starred"] = bool(event.get("starred"))
+
+    def _checkpoint(self):
+        data = self._data
+        # 早已结束的会话不必再记
+        newest = max(data["sessions"].values(), default=0)
+        data["sessions"] = {s: ts for s, ts in data["sessions"].items() if newest - ts <= IDLE_GAP}
+        directory = os.path.dirname(self._summary_path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                # json.dumps 走 C 编码器，比 json.dump 逐块写快一个数量级
+                f.write(json.dumps(data, ensure_ascii=False))
+            os.replace(tmp_path, self._summary_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        stat = os.stat(self._summary_path)
+        self._stamp = (stat.st_mtime_ns, stat.st_size)
+        self._unsaved = 0
+
+    def record(self, kind, session, item=None, info=None, now=None, **fields):
+        """追加一个事件并更新汇总
+
+        kind 为 play/submit/score/star；info 是复习库里的句子信息（audio_name、start_ms、
+        end_ms、reference），fields 是事件自己的字段，如 score 的 score/words/missed，
+        star 的 starred。
+        """
+        if kind not in EVENTS:
+            raise ValueError(f"未知事件 {kind}")
+        event = {"ts": time.time() if now is None else now, "type": kind, "session": session}
+        if item is not None:
+            event["item"] = item
+        if info:
+            event.update({field: info[field] for field in ("audio_name", "start_ms", "end_ms", "reference") if info.get(field) is not None})
+        event.update(fields)
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock, self._file_lock():
+            self._refresh()
+            with open(self._log_path, "ab") as f:
+                f.write(line)
+            self._apply(event)
+            self._data["offset"] += len(line)
+            self._unsaved += len(line)
+            if self._unsaved >= max(CHECKPOINT_BYTES, self._stamp[1] if self._stamp else 0):
+                self._checkpoint()
+
+    def flush(self):
+        """立即写出汇总"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._unsaved:
+                self._checkpoint()
+
+    def overview(self):
+        """总体数字：练习时间、提交次数、平均正确率、练过的句子数、练习天数"""
+        with self._lock:
+            self._refresh()
+            totals = self._data["totals"]
+            return {
+                "time_s": round(totals["time_s"]),
+                "plays": totals["plays"],
+                "attempts": totals["attempts"],
+                "accuracy": totals["score_sum"] / totals["scored"] if totals["scored"] else None,
+                "sentences": len(self._data["sentences"]),
+                "days": len(self._data["days"]),
+            }
+
+    def daily(self, days=30):
+        """最近若干个练习日的 [{day, attempts, accuracy, minutes}, ...]，按日期升序"""
+        with self._lock:
+            self._refresh()
+            recent = sorted(self._data["days"].items())[-days:]
+            return [
+                {
+                    "day": day,
+                    "attempts": counts["attempts"],
+                    "accuracy": counts["score_sum"] / counts["scored"] if counts["scored"] else None,
+                    "minutes": round(counts["time_s"] / 60, 1),
+                }
+                for day, counts in recent
+            ]
+
+    def weakest_sentences(self, limit=10):
+        """最近几次平均得分最低的句子，附带得分走势"""
+        with self._lock:
+            self._refresh()
+            scored = [
+                dict(sentence, item=item, scores=list(sentence["scores"]),
+                     average=sum(sentence["scores"]) / len(sentence["scores"]))
+                for item, sentence in self._data["sentences"].items() if sentence["scores"]
+            ]
+        scored.sort(key=lambda sentence: (sentence["average"], -sentence["attempts"]))
+        return scored[:limit]
+
+    def weakest_words(self, limit=10, min_seen=2):
+        """听写时最常漏掉的单词 [(单词, 漏掉次数, 出现次数), ...]"""
+        with self._lock:
+            self._refresh()
+            words = [(word, missed, seen) for word, (seen, missed) in self._data["words"].items()
+                     if seen >= min_seen and missed]
+        words.sort(key=lambda entry: (-entry[1] / entry[2], -entry[1]))
+        return words[:limit]
+
+
+def trend_chart(daily, height=180):
+    """按天的正确率折线和练习时长柱（交给 st.vega_lite_chart 的 vega-lite 描述）"""
+    values = [
+        {"day": d["day"], "accuracy": None if d["accuracy"] is None else round(d["accuracy"] * 100),
+         "minutes": d["minutes"]}
+        for d in daily
+    ]
+    x = {"field": "day", "type": "ordinal", "title": None, "axis": {"labelAngle": -45}}
+    return {
+        "data": {"values": values},
+        "layer": [
+            {
+                "mark": {"type": "bar", "color": "#90CAF9"},
+                "encoding": {"x": x, "y": {"field": "minutes", "type": "quantitative", "title": "练习时长(分钟)"}},
+            },
+            {
+                "transform": [{"filter": "datum.accuracy != null"}],
+                "mark": {"type": "line", "color": "#E53935", "point": True},
+                "encoding": {"x": x, "y": {"field": "accuracy", "type": "quantitative", "title": "正确率(%)",
+                                           "scale": {"domain": [0, 100]}}},
+            },
+        ],
+        "resolve": {"scale": {"y": "independent"}},
+        "height": height,
+    }
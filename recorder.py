@@ -0,0 +1,34 @@
+# recorder.py - 浏览器麦克风录音组件
+#
+# Streamlit 1.30 没有录音控件，这里用一个不需要构建的自定义组件
+# （recorder_frontend/index.html，浏览器 MediaRecorder 录音）。录音结束后组件值为
+# base64 编码的音频；浏览器只在 https 或 localhost 页面里允许使用麦克风。
+import base64
+import os
+
+import streamlit.components.v1 as components
+
+_component = components.declare_component(
+    "recorder", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorder_frontend")
+)
+
+# 浏览器给出的 MIME（可能带 codecs 参数）对应的扩展名
+_EXTENSIONS = {
+    "audio/webm": ".webm",
+    "audio/ogg": ".ogg",
+    "audio/mp4": ".m4a",
+    "audio/mpeg": ".mp3",
+    "audio/wav": ".wav",
+}
+
+
+def record(key, max_seconds=30, start_label="🎙️ 开始录音", stop_label="⏹️ 结束录音"):
+    """显示录音按钮，录完后返回 (音频字节, 扩展名)，还没有录音时返回 None"""
+    value = _component(
+        key=key, default=None, max_seconds=max_seconds,
+        start_label=start_label, stop_label=stop_label
+    )
+    if not value:
+        return None
+    mime = value["mime"].split(";", 1)[0]
+    return base64.b64decode(value["data"]), _EXTENSIONS.get(mime, ".webm")
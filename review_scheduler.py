@@ -0,0 +1,217 @@
+# review_scheduler.py - 难句复习调度（SM-2 间隔重复）
+#
+# 每个练过或收藏过的句子是一张卡片，按 (学习者, 文件哈希, 起止ms) 标识；每个学习者
+# 跨文件共用一个复习队列，看不到也改不了别人的卡片。卡片只保存在 SQLite 里，不在内存里另存一份：多个进程共用同一个库时，
+# 每次更新都在写事务里重新读出卡片再写回，不会用过期的副本覆盖其他进程的复习记录。
+# 到期时间上有索引，取下一句到期句子是 O(log n)，几万句的复习也不会变慢。
+import difflib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+REVIEW_DB = os.environ.get(
+    "SHADOWING_REVIEW_DB",
+    os.path.join(os.path.expanduser("~"), ".shadowing", "review.db")
+)
+
+DAY = 24 * 60 * 60
+# 答错的句子在本次练习中稍后再出现
+RELEARN_DELAY = 10 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    user_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL,
+    audio_name TEXT,
+    reference TEXT,
+    ease REAL NOT NULL DEFAULT 2.5,
+    interval REAL NOT NULL DEFAULT 0,
+    repetitions INTEGER NOT NULL DEFAULT 0,
+    lapses INTEGER NOT NULL DEFAULT 0,
+    due REAL NOT NULL,
+    starred INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, item_id)
+);
+CREATE INDEX IF NOT EXISTS cards_by_user_file ON cards (user_id, cache_key);
+CREATE INDEX IF NOT EXISTS cards_by_user_due ON cards (user_id, due);
+"""
+
+# 没有区分学习者的旧库，卡片都归到本机用户名下
+LOCAL_USER = ""
+
+_FIELDS = ("user_id", "item_id", "cache_key", "start_ms", "end_ms", "audio_name", "reference",
+           "ease", "interval", "repetitions", "lapses", "due", "starred")
+
+
+def item_id(cache_key, start_ms, end_ms):
+    return f"{cache_key}:{start_ms}_{end_ms}"
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def score_dictation(reference, dictation):
+    """听写与原文按单词对齐后的正确率（0~1）"""
+    expected = _words(reference)
+    if not expected:
+        return 0.0
+    matcher = difflib.SequenceMatcher(a=expected, b=_words(dictation), autojunk=False)
+    matched = sum(block.size for block in matcher.get_matching_blocks())
+    return matched / max(len(expected), len(_words(dictation)))
+
+
+def word_misses(reference, dictation):
+    """原文的单词列表，以及其中没有听写出来的单词"""
+    expected = _words(reference)
+    matcher = difflib.SequenceMatcher(a=expected, b=_words(dictation), autojunk=False)
+    matched = set()
+    for block in matcher.get_matching_blocks():
+        matched.update(range(block.a, block.a + block.size))
+    return expected, [word for i, word in enumerate(expected) if i not in matched]
+
+
+def quality_from_score(score):
+    """把正确率映射为 SM-2 的 0~5 分"""
+    return max(0, min(5, round(score * 5)))
+
+
+class ReviewScheduler:
+    """SM-2 调度器：SQLite 持久化，库里的卡片是唯一的数据来源"""
+
+    def __init__(self, path=REVIEW_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 自己管理事务：读改写放在 BEGIN IMMEDIATE 里，其他进程的写入要等这次提交
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._transaction():
+            self._migrate()
+            for statement in _SCHEMA.split(";"):
+                if statement.strip():
+                    self._db.execute(statement)
+
+    def _migrate(self):
+        """旧版 cards 表没有 user_id 列，改成按学习者区分的新表"""
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(cards)")}
+        if not columns or "user_id" in columns:
+            return
+        old_fields = ", ".join(_FIELDS[1:])
+        self._db.execute("ALTER TABLE cards RENAME TO cards_v1")
+        self._db.execute("DROP INDEX IF EXISTS cards_by_file")
+        self._db.execute("DROP INDEX IF EXISTS cards_by_due")
+        for statement in _SCHEMA.split(";"):
+            if statement.strip():
+                self._db.execute(statement)
+        self._db.execute(
+            f"INSERT INTO cards (user_id, {old_fields}) SELECT ?, {old_fields} FROM cards_v1", (LOCAL_USER,)
+        )
+        self._db.execute("DROP TABLE cards_v1")
+
+    def count(self, user):
+        """某个学习者的卡片数"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cards WHERE user_id = ?", (user,)).fetchone()[0]
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _card(self, user, item, info, now):
+        """在写事务里读出最新的卡片，没有时按 info 新建"""
+        row = self._db.execute("SELECT * FROM cards WHERE user_id = ? AND item_id = ?", (user, item)).fetchone()
+        if row is None:
+            return {
+                "user_id": user,
+                "item_id": item,
+                "cache_key": info["cache_key"],
+                "start_ms": info["start_ms"],
+                "end_ms": info["end_ms"],
+                "audio_name": info.get("audio_name", ""),
+                "reference": info.get("reference"),
+                "ease": 2.5,
+                "interval": 0.0,
+                "repetitions": 0,
+                "lapses": 0,
+                "due": now,
+                "starred": 0,
+            }
+        card = dict(row)
+        if info and info.get("reference") and not card["reference"]:
+            card["reference"] = info["reference"]
+        return card
+
+    def _save(self, card):
+        self._db.execute(
+            f"INSERT OR REPLACE INTO cards ({', '.join(_FIELDS)}) VALUES ({', '.join('?' * len(_FIELDS))})",
+            [card[field] for field in _FIELDS]
+        )
+
+    def record(self, user, item, quality, info=None, now=None):
+        """记录学习者 user 的一次复习结果（quality 为 0~5），返回更新后的卡片"""
+        now = time.time() if now is None else now
+        with self._transaction():
+            card = self._card(user, item, info, now)
+            if quality < 3:
+                card["repetitions"] = 0
+                card["lapses"] += 1
+                card["interval"] = 0.0
+                card["due"] = now + RELEARN_DELAY
+            else:
+                card["repetitions"] += 1
+                if card["repetitions"] == 1:
+                    card["interval"] = 1.0
+                elif card["repetitions"] == 2:
+                    card["interval"] = 6.0
+                else:
+                    card["interval"] = round(card["interval"] * card["ease"], 1)
+                card["due"] = now + card["interval"] * DAY
+            card["ease"] = max(1.3, card["ease"] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+            self._save(card)
+        return card
+
+    def set_starred(self, user, item, starred, info=None, now=None):
+        """收藏的句子立即进入复习队列；取消收藏只去掉标记，不影响排期"""
+        now = time.time() if now is None else now
+        with self._transaction():
+            if not starred:
+                self._db.execute("UPDATE cards SET starred = 0 WHERE user_id = ? AND item_id = ?", (user, item))
+                return
+            card = self._card(user, item, info, now)
+            card["starred"] = 1
+            card["due"] = min(card["due"], now)
+            self._save(card)
+
+    def starred_spans(self, user, cache_key):
+        """学习者在某个文件里收藏过的句子 {(start_ms, end_ms), ...}"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT start_ms, end_ms FROM cards WHERE user_id = ? AND cache_key = ? AND starred = 1",
+                (user, cache_key)
+            ).fetchall()
+        return {(row["start_ms"], row["end_ms"]) for row in rows}
+
+    def next_due(self, user, now=None, skip=()):
+        """学习者最早到期的卡片（没有到期的返回 None），skip 中的句子跳过"""
+        now = time.time() if now is None else now
+        skip = list(skip)
+        query = "SELECT * FROM cards WHERE user_id = ? AND due <= ?"
+        if skip:
+            query += f" AND item_id NOT IN ({', '.join('?' * len(skip))})"
+        with self._lock:
+            row = self._db.execute(query + " ORDER BY due LIMIT 1", [user, now, *skip]).fetchone()
+        return dict(row) if row is not None else None
@@ -0,0 +1,306 @@
+# segmentation.py - 断句工具：基于帧能量包络的快速静音检测
+#
+# 上传后在 16kHz 分析音轨上只计算一次能量包络（每帧均方能量），之后调整断句参数时
+# 只需在这个紧凑数组上做游程检测，不必重新扫描整段音频。
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from audio_io import ANALYSIS_RATE
+
+# 包络帧长(ms)，断句边界的精度也是这个值
+FRAME_MS = 10
+
+
+def compute_envelope(track, sample_rate=ANALYSIS_RATE, frame_ms=FRAME_MS):
+    """计算分析音轨每帧的均方能量（相对满幅，0~1），返回 float32 数组"""
+    hop = max(1, sample_rate * frame_ms // 1000)
+    n_frames = -(-len(track) // hop)
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    padded = np.zeros(n_frames * hop, dtype=np.float32)
+    padded[:len(track)] = track
+    padded /= 32768
+    frames = padded.reshape(n_frames, hop)
+    envelope = np.einsum("ij,ij->i", frames, frames)
+
+    counts = np.full(n_frames, hop, dtype=np.float32)
+    counts[-1] = len(track) - (n_frames - 1) * hop
+    return (envelope / counts).astype(np.float32)
+
+
+def detect_spans(envelope, min_silence_len, silence_thresh, keep_silence=100,
+                 frame_ms=FRAME_MS, total_ms=None):
+    """在能量包络上检测句子，返回 [(开始ms, 结束ms), ...]
+
+    判定规则与 pydub.silence.split_on_silence 相同：长度为 min_silence_len
+    的窗口平均能量不超过 silence_thresh(dBFS) 即为静音，重叠的静音窗口合并，
+    句子两端各保留 keep_silence 毫秒静音。
+    """
+    n = len(envelope)
+    if total_ms is None:
+        total_ms = n * frame_ms
+    if n == 0:
+        return []
+
+    window = max(1, int(round(min_silence_len / frame_ms)))
+    if n < window:
+        silent_ranges = np.zeros((0, 2), dtype=np.int64)
+    else:
+        # 用前缀和一次算出所有窗口的平均能量
+        cumsum = np.concatenate(([0.0], np.cumsum(envelope, dtype=np.float64)))
+        window_power = (cumsum[window:] - cumsum[:-window]) / window
+        silent = window_power <= 10 ** (silence_thresh / 10)
+
+        # 游程检测：连续的静音窗口起点 -> 静音区间
+        edges = np.diff(np.concatenate(([0], silent.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1 + window
+
+        # 相互重叠或相接的静音区间合并
+        if len(starts):
+            breaks = np.flatnonzero(starts[1:] > ends[:-1]) + 1
+            starts = starts[np.concatenate(([0], breaks))]
+            ends = ends[np.concatenate((breaks - 1, [len(ends) - 1]))]
+        silent_ranges = np.stack((starts, ends), axis=1)
+
+    return _spans_between(silent_ranges, n, keep_silence, frame_ms, total_ms)
+
+
+def _spans_between(silent_ranges, n, keep_silence, frame_ms, total_ms):
+    """静音区间（帧号）的补集就是句子区间；两端保留静音后转换为毫秒"""
+    bounds = np.concatenate(([0], silent_ranges.ravel(), [n])) * frame_ms
+    bounds = np.minimum(bounds, total_ms)
+    spans = [
+        [int(start), int(end)]
+        for start, end in bounds.reshape(-1, 2)
+        if end > start
+    ]
+
+    # 两端保留静音，相邻句子重叠时从中间切开
+    for span in spans:
+        span[0] -= keep_silence
+        span[1] += keep_silence
+    for prev, nxt in zip(spans, spans[1:]):
+        if nxt[0] < prev[1]:
+            prev[1] = nxt[0] = (prev[1] + nxt[0]) // 2
+
+    return [(max(start, 0), min(end, total_ms)) for start, end in spans]
+
+
+# ---------------------------------------------------------------------------
+# 语音活动检测（VAD）
+#
+# 有背景音乐或房间噪声时，停顿处的能量并不低，固定的能量阈值切不开句子。
+# 这里对每个 10ms 帧算 24 个 mel 频带(100~4000Hz)的对数能量，派生出几项与
+# 绝对音量无关的特征，用一个逻辑回归小分类器给出“是语音”的概率：
+#   - 高出各频带本底（全文件 10% 分位）的分贝数：稳定的噪声被当作本底减掉
+#   - 相对全文件响度(95% 分位)的响度：语音通常是前景
+#   - 频带能量的起伏(约 4Hz 的音节节奏)和正向变化(音节起始)
+#   - 相邻 50ms 频谱形状的相关性：持续的乐音/噪声相关性高，语音低
+# 权重由 benchmarks.py 的 fit_vad 在合成语音 + 噪声/音乐背景上拟合（python benchmarks.py fit），
+# 准确率见 segment 基准。
+# 特征都是相对全文件的，整段几乎无声时比不出前景，所以低于约 -60dBFS 的帧直接判为非语音。
+# 频谱按块(4096 帧)批量计算，概率每个文件算一次缓存，调阈值时只做游程检测。
+
+_VAD_WINDOW = 400       # 25ms 分析窗
+_VAD_FFT = 512
+_VAD_BLOCK = 4096       # 每批计算的帧数，限制中间数组的内存占用
+_VAD_BANDS = (24, 100, 4000)
+
+# 特征顺序见 speech_features；python benchmarks.py fit 输出的拟合结果
+_VAD_WEIGHTS = np.array([-1.512, 2.694, -1.514, 0.139, -12.569, 5.795, 2.131], dtype=np.float32)
+_VAD_BIAS = 10.569
+
+# 帧响度(各频带能量之和)低于此值为无声；满幅正弦约 43，-60dBFS 约 -14
+_VAD_SILENCE_DB = -14
+
+
+def _mel_filterbank(n_bands, low_hz, high_hz, sample_rate=ANALYSIS_RATE, n_fft=_VAD_FFT):
+    mel = lambda hz: 2595 * np.log10(1 + hz / 700)
+    edges = 700 * (10 ** (np.linspace(mel(low_hz), mel(high_hz), n_bands + 2) / 2595) - 1)
+    bins = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    left, center, right = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    weights = np.minimum((bins - left) / (center - left), (right - bins) / (right - center))
+    return np.clip(weights, 0, None).T.astype(np.float32)
+
+
+def band_energies(track, sample_rate=ANALYSIS_RATE, frame_ms=FRAME_MS):
+    """每帧各 mel 频带的对数能量(dB)，帧与能量包络一一对应"""
+    hop = max(1, sample_rate * frame_ms // 1000)
+    n_frames = -(-len(track) // hop)
+    filterbank = _mel_filterbank(*_VAD_BANDS, sample_rate=sample_rate)
+    energies = np.empty((n_frames, filterbank.shape[1]), dtype=np.float32)
+    if n_frames == 0:
+        return energies
+
+    # 分析窗以帧中心对齐
+    padded = np.zeros(n_frames * hop + _VAD_WINDOW, dtype=np.float32)
+    padded[_VAD_WINDOW // 2:_VAD_WINDOW // 2 + len(track)] = track
+    padded /= 32768
+    window = np.hanning(_VAD_WINDOW).astype(np.float32)
+    offsets = np.arange(_VAD_WINDOW)
+    for begin in range(0, n_frames, _VAD_BLOCK):
+        count = min(_VAD_BLOCK, n_frames - begin)
+        frames = padded[(begin + np.arange(count))[:, None] * hop + offsets] * window
+        power = np.abs(np.fft.rfft(frames, _VAD_FFT)) ** 2
+        energies[begin:begin + count] = 10 * np.log10(power.astype(np.float32) @ filterbank + 1e-10)
+    return energies
+
+
+def _moving_average(values, width):
+    """沿第 0 维的居中滑动平均（两端按实际帧数平均）"""
+    half = width // 2
+    cumsum = np.concatenate((np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0, dtype=np.float64)))
+    index = np.arange(len(values))
+    low = np.maximum(index - half, 0)
+    high = np.minimum(index + half + 1, len(values))
+    counts = (high - low).reshape((-1,) + (1,) * (values.ndim - 1))
+    return ((cumsum[high] - cumsum[low]) / counts).astype(np.float32)
+
+
+def speech_features(energies):
+    """由频带能量计算每帧的 VAD 特征，返回 (帧数, 7)"""
+    if len(energies) == 0:
+        return np.zeros((0, len(_VAD_WEIGHTS)), dtype=np.float32)
+    floor = np.percentile(energies, 10, axis=0)
+    above_floor = np.clip(energies - floor, 0, 40).mean(axis=1)
+
+    loudness = 10 * np.log10((10 ** (energies / 10)).sum(axis=1) + 1e-10)
+    loudness = np.clip(loudness - np.percentile(loudness, 95), -60, 0)
+
+    # 去掉 400ms 内的缓慢变化后，200ms 内的起伏幅度
+    fluctuation = energies - _moving_average(energies, 41)
+    modulation = np.clip(np.sqrt(_moving_average(fluctuation ** 2, 21)), 0, 40).mean(axis=1)
+
+    rise = np.clip(np.diff(energies, axis=0, prepend=energies[:1]), 0, 20).mean(axis=1)
+    rise = _moving_average(rise, 11)
+
+    lag = 5
+    shape = energies - energies.mean(axis=1, keepdims=True)
+    similarity = np.ones(len(energies), dtype=np.float32)
+    if len(energies) > lag:
+        numerator = (shape[lag:] * shape[:-lag]).sum(axis=1)
+        denominator = np.sqrt((shape[lag:] ** 2).sum(axis=1) * (shape[:-lag] ** 2).sum(axis=1)) + 1e-6
+        similarity[lag:] = numerator / denominator
+    similarity = _moving_average(similarity, 21)
+
+    return np.stack((
+        above_floor / 10,
+        loudness / 10,
+        modulation / 10,
+        rise,
+        similarity,
+        _moving_average(above_floor, 31) / 10,
+        _moving_average(modulation, 31) / 10,
+    ), axis=1).astype(np.float32)
+
+
+def speech_probability(track, sample_rate=ANALYSIS_RATE, frame_ms=FRAME_MS):
+    """每帧是语音的概率(0~1)，float32 数组，帧与能量包络一一对应"""
+    energies = band_energies(track, sample_rate, frame_ms)
+    logits = speech_features(energies) @ _VAD_WEIGHTS + _VAD_BIAS
+    probability = (1 / (1 + np.exp(-logits))).astype(np.float32)
+    loudness = 10 * np.log10((10 ** (energies / 10)).sum(axis=1) + 1e-10)
+    probability[loudness < _VAD_SILENCE_DB] = 0
+    return probability
+
+
+def _runs(mask):
+    """布尔数组中连续 True 段的 (起点, 终点) 帧号"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_speech_spans(probability, min_silence_len, speech_thresh=0.5, keep_silence=100,
+                        min_speech_len=100, frame_ms=FRAME_MS, total_ms=None):
+    """在语音概率上检测句子，返回 [(开始ms, 结束ms), ...]
+
+    概率（50ms 平滑后）超过 speech_thresh 的帧为语音，短于 min_speech_len
+    的零星语音视为噪声；不短于 min_silence_len 的非语音段为句间停顿。
+    """
+    n = len(probability)
+    if total_ms is None:
+        total_ms = n * frame_ms
+    if n == 0:
+        return []
+
+    speech = _moving_average(probability, 5) > speech_thresh
+    starts, ends = _runs(speech)
+    for start, end in zip(starts, ends):
+        if (end - start) * frame_ms < min_speech_len:
+            speech[start:end] = False
+
+    starts, ends = _runs(~speech)
+    long_enough = (ends - starts) * frame_ms >= min_silence_len
+    silent_ranges = np.stack((starts[long_enough], ends[long_enough]), axis=1)
+    return _spans_between(silent_ranges, n, keep_silence, frame_ms, total_ms)
+
+
+# ---------------------------------------------------------------------------
+# 断句后端
+#
+# 每个后端把分析音轨转换成逐帧特征（每个文件算一次，由 pipeline 缓存），
+# 再按断句参数在特征上检测句子（调参数时即时重算）。断句参数是一个字典，
+# "segmenter" 指定后端（缺省为能量法，兼容旧的参数和会话包）。
+
+class Segmenter(ABC):
+    """断句后端接口"""
+    name = None
+    label = None
+    # 缓存里的特征文件名
+    features_name = None
+    # 决定断句结果的参数，依次拼进断句结果的缓存文件名
+    param_names = ()
+
+    @abstractmethod
+    def features(self, track):
+        """分析音轨 -> 逐帧特征数组"""
+
+    @abstractmethod
+    def detect(self, features, params, total_ms):
+        """在特征上按断句参数检测句子，返回 [(开始ms, 结束ms), ...]"""
+
+
+class EnergySegmenter(Segmenter):
+    """帧能量包络上的静音检测，与 pydub 的 split_on_silence 结果一致"""
+    name = "energy"
+    label = "能量（静音检测）"
+    features_name = "envelope.npy"
+    param_names = ("min_silence_len", "silence_thresh", "keep_silence")
+
+    def features(self, track):
+        return compute_envelope(track)
+
+    def detect(self, features, params, total_ms):
+        return detect_spans(
+            features, params["min_silence_len"], params["silence_thresh"],
+            params["keep_silence"], total_ms=total_ms
+        )
+
+
+class VadSegmenter(Segmenter):
+    """语音活动检测，适合有背景音乐或环境噪声的音频"""
+    name = "vad"
+    label = "语音活动检测（抗噪声/背景音乐）"
+    # 权重或概率的算法改动后换文件名，旧的概率不再被读到
+    features_name = "speech_prob_v3.npy"
+    param_names = ("min_silence_len", "speech_thresh", "keep_silence")
+
+    def features(self, track):
+        return speech_probability(track)
+
+    def detect(self, features, params, total_ms):
+        return detect_speech_spans(
+            features, params["min_silence_len"], params["speech_thresh"],
+            params["keep_silence"], total_ms=total_ms
+        )
+
+
+SEGMENTERS = {segmenter.name: segmenter for segmenter in (EnergySegmenter(), VadSegmenter())}
+DEFAULT_SEGMENTER = "energy"
+
+
+def get_segmenter(params):
+    return SEGMENTERS[params.get("segmenter", DEFAULT_SEGMENTER)]
@@ -0,0 +1,194 @@
+# session_bundle.py - 练习会话的导出/导入
+#
+# 会话包是一个 zip：
+#   manifest.json     格式版本、音频信息、句子起止(ms)、原文、听写内容、收藏
+#   clips/<序号>.<扩展名>  句子片段（可选，mp3/opus 已经压缩过，按 STORED 存放）
+# 写入时逐个片段流式拷贝，不会把所有片段同时读进内存；导入时直接恢复句子，
+# 不需要重新解码或断句。
+#
+# 会话包来自用户上传，manifest 里的内容都要校验后才能使用。包内的片段无法核对是否
+# 真的出自 cache_key 对应的文件，不能写进该文件的缓存条目，而是放在以会话包自身
+# 哈希为键的条目里。
+import hashlib
+import json
+import math
+import re
+import shutil
+import zipfile
+
+import artifact_cache
+import pipeline
+
+FORMAT = "shadowing-session"
+# 版本 2 起片段格式记录在 manifest 的 codec 里（版本 1 只有 mp3）
+VERSION = 2
+
+
+class BundleError(ValueError):
+    """会话包格式不正确或版本不支持"""
+
+
+_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def _bundle_hash(fileobj, chunk_size=1 << 20):
+    """会话包本身的 sha256，包内片段按这个键缓存"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(chunk_size), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def _check_manifest(manifest):
+    """校验 manifest 里导入要用到的字段，不合法时抛出 BundleError"""
+    key = manifest.get("cache_key")
+    if key is not None and not (isinstance(key, str) and _KEY_PATTERN.fullmatch(key)):
+        raise BundleError("会话文件中的音频哈希无效")
+    spans = manifest.get("spans")
+    if not isinstance(spans, list):
+        raise BundleError("会话文件缺少句子起止时间")
+    for span in spans:
+        if not (isinstance(span, list) and len(span) == 2
+                and all(type(ms) is int and ms >= 0 for ms in span) and span[0] < span[1]):
+            raise BundleError(f"句子起止时间无效: {span!r}")
+    for field in ("reference", "dictations"):
+        values = manifest.get(field)
+        if not isinstance(values, list) or len(values) != len(spans):
+            raise BundleError(f"会话文件的 {field} 与句子数不一致")
+    if not all(text is None or isinstance(text, str) for text in manifest["reference"]):
+        raise BundleError("会话文件的原文格式不正确")
+    if not all(isinstance(text, str) for text in manifest["dictations"]):
+        raise BundleError("会话文件的听写内容格式不正确")
+    starred = manifest.get("starred")
+    if not (isinstance(starred, list)
+            and all(type(i) is int and 0 <= i < len(spans) for i in starred)):
+        raise BundleError("会话文件的收藏列表不正确")
+    _check_params(manifest.get("params"))
+
+
+def _check_params(params):
+    """断句参数要能直接交给 pipeline：已知的断句方法，所需参数都是数值"""
+    if params is None:
+        return
+    if not isinstance(params, dict):
+        raise BundleError("会话文件的断句参数格式不正确")
+    segmenter = params.get("segmenter", pipeline.DEFAULT_SEGMENTER)
+    if not isinstance(segmenter, str) or segmenter not in pipeline.SEGMENTERS:
+        raise BundleError(f"不支持的断句方法 {segmenter}")
+    for name in pipeline.SEGMENTERS[segmenter].param_names:
+        value = params.get(name)
+        if type(value) not in (int, float) or not math.isfinite(value):
+            raise BundleError(f"会话文件的断句参数 {name} 无效")
+
+
+def write_bundle(fileobj, sentences, dictations, starred=(), audio_name="",
+                 cache_key=None, params=None, include_clips=False):
+    """把会话写入 fileobj（需可写，可以是 SpooledTemporaryFile 等）"""
+    codec = sentences[0].get("codec", pipeline.DEFAULT_CODEC) if sentences else pipeline.DEFAULT_CODEC
+    ext = pipeline.DELIVERY_CODECS[codec]["ext"]
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "audio_name": audio_name,
+        "cache_key": cache_key,
+        "params": params,
+        # 起止时间用整数毫秒，比保存完整句子字典紧凑得多
+        "spans": [
+            [round(s["start_time"] * 1000), round(s["end_time"] * 1000)]
+            for s in sentences
+        ],
+        "reference": [s.get("transcript") for s in sentences],
+        "dictations": list(dictations),
+        "starred": sorted(starred),
+        "clips": include_clips,
+        "codec": codec,
+    }
+
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, separators=(",", ":")))
+        if include_clips:
+            for i, sentence in enumerate(sentences):
+                info = zipfile.ZipInfo(f"clips/{i}.{ext}")
+                info.compress_type = zipfile.ZIP_STORED
+                with open(sentence["audio_path"], "rb") as src, zf.open(info, "w") as dst:
+                    shutil.copyfileobj(src, dst)
+    return fileobj
+
+
+def read_bundle(fileobj):
+    """读取会话包，返回恢复会话所需的字典
+
+    包内带片段时，片段写入 artifact_cache 中以会话包哈希为键的条目，句子可以直接播放；
+    cache_key 对应的文件已导出过同一片段时直接用缓存里的。
+    """
+    try:
+        zf = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise BundleError("不是有效的会话文件") from e
+
+    with zf:
+        try:
+            manifest = json.loads(zf.read("manifest.json"))
+        except (KeyError, ValueError, zipfile.BadZipFile) as e:
+            raise BundleError("会话文件缺少 manifest.json 或已损坏") from e
+        if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+            raise BundleError("不是精听助手导出的会话文件")
+        version = manifest.get("version", 0)
+        if type(version) is not int:
+            raise BundleError("会话文件版本无效")
+        if version > VERSION:
+            raise BundleError(f"会话文件版本 {version} 过新，请升级后再导入")
+        _check_manifest(manifest)
+
+        key = manifest.get("cache_key")
+        codec = manifest.get("codec", pipeline.DEFAULT_CODEC)
+        if not isinstance(codec, str) or codec not in pipeline.DELIVERY_CODECS:
+            raise BundleError(f"不支持的音频格式 {codec}")
+        ext = pipeline.DELIVERY_CODECS[codec]["ext"]
+        bundle_key = _bundle_hash(fileobj) if manifest.get("clips") else None
+        if bundle_key is not None:
+            missing = {f"clips/{i}.{ext}" for i in range(len(manifest["spans"]))} - set(zf.namelist())
+            if missing:
+                raise BundleError(f"会话文件缺少片段 {min(missing)}")
+        sentences = []
+        for i, ((start_ms, end_ms), reference) in enumerate(zip(manifest["spans"], manifest["reference"])):
+            clip = pipeline.clip_name(start_ms, end_ms, codec)
+            if key and artifact_cache.has(key, clip):
+                audio_path = artifact_cache.artifact_path(key, clip)
+            elif bundle_key is not None:
+                if not artifact_cache.has(bundle_key, clip):
+                    def extract(tmp, member=f"clips/{i}.{ext}"):
+                        with zf.open(member) as src, open(tmp, "wb") as dst:
+                            shutil.copyfileobj(src, dst)
+                    try:
+                        artifact_cache.atomic_write(bundle_key, clip, extract)
+                    except zipfile.BadZipFile as e:
+                        raise BundleError(f"会话文件中的片段 {i} 已损坏") from e
+                audio_path = artifact_cache.artifact_path(bundle_key, clip)
+            else:
+                audio_path = ""
+
+            sentence = {
+                "id": i,
+                "clip": clip,
+                "codec": codec,
+                "mime": pipeline.DELIVERY_CODECS[codec]["mime"],
+                "audio_path": audio_path,
+                "duration": (end_ms - start_ms) / 1000,
+                "start_time": start_ms / 1000,
+                "end_time": end_ms / 1000
+            }
+            if reference is not None:
+                sentence["transcript"] = reference
+            sentences.append(sentence)
+
+    return {
+        "audio_name": str(manifest.get("audio_name") or ""),
+        "cache_key": key,
+        "params": manifest.get("params"),
+        "sentences": sentences,
+        "dictations": manifest["dictations"],
+        "starred": set(manifest["starred"]),
+    }
@@ -0,0 +1,172 @@
+# session_store.py - 会话数据的外部存储（多进程/多机部署）
+#
+# Streamlit 的 session_state 只存在处理该会话的那个进程里，页面刷新或断线重连
+# 被负载均衡分到另一个进程时就丢了。设置 SHADOWING_SESSION_STORE 后，每个浏览器
+# 会话的轻量数据（文件哈希、断句参数、句子起止、听写内容、当前句子）按地址栏里的
+# 会话 id 存到外部，任何一个进程都能恢复。音频、片段、原文等重数据只按内容哈希
+# 引用，由共享的 artifact_cache 提供（多机部署时 SHADOWING_CACHE_DIR 放在共享存储上），
+# 换进程后不需要重新计算。
+#
+#   SHADOWING_SESSION_STORE=sqlite:////srv/shadowing/sessions.db   本机多进程
+#   SHADOWING_SESSION_STORE=redis://kv:6379/0                     多机（需要安装 redis）
+#   SHADOWING_SESSION_STORE=memory://                              进程内替身，开发调试用
+# 不设置时保持原来的单进程行为。
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+SESSION_STORE = os.environ.get("SHADOWING_SESSION_STORE", "")
+
+# 会话数据保留时长（秒），超过没有访问的会话自动清理
+SESSION_TTL = int(os.environ.get("SHADOWING_SESSION_TTL", 7 * 24 * 60 * 60))
+
+# 地址栏里的会话 id 参数名
+QUERY_PARAM = "sid"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_time ON sessions (updated);
+"""
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def resolve_session_id(requested):
+    """地址栏里带来的会话 id 格式正确时沿用，否则新建一个
+
+    会话 id 同时用来区分学习者的复习队列和练习统计目录，不能直接信任地址栏里的任意字符串。
+    """
+    if isinstance(requested, str) and re.fullmatch(r"[0-9a-f]{32}", requested):
+        return requested
+    return new_session_id()
+
+
+class SessionStore(ABC):
+    """会话存储接口：按会话 id 读写一个可 JSON 序列化的字典"""
+
+    @abstractmethod
+    def load(self, session_id):
+        """读取会话数据，没有或已过期时返回 None"""
+
+    @abstractmethod
+    def save(self, session_id, data):
+        """保存会话数据并刷新过期时间"""
+
+    @abstractmethod
+    def delete(self, session_id):
+        """删除会话数据"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """本机 SQLite，同一台机器上的多个 streamlit 进程共用"""
+
+    # 每写多少次顺带清理一次过期会话
+    PURGE_EVERY = 200
+
+    def __init__(self, path, ttl=SESSION_TTL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL 模式下读写互不阻塞，适合多个进程同时访问
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND updated > ?",
+                (session_id, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, data):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data, ensure_ascii=False, separators=(",", ":")), now)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+            self._db.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+
+class KVSessionStore(SessionStore):
+    """共享键值存储（如 redis），client 需提供 get(key)、set(key, value, ex=秒)、delete(key)"""
+
+    def __init__(self, client, prefix="shadowing:session:", ttl=SESSION_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def load(self, session_id):
+        value = self.client.get(self.prefix + session_id)
+        return json.loads(value) if value is not None else None
+
+    def save(self, session_id, data):
+        value = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        self.client.set(self.prefix + session_id, value.encode("utf-8"), ex=self.ttl)
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+class MemoryKV:
+    """进程内的键值存储替身，接口与 redis 客户端的 get/set/delete 一致"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+def open_store(url=SESSION_STORE):
+    """按地址创建会话存储，未配置时返回 None"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # 与 SQLAlchemy 相同：sqlite:///相对路径，sqlite:////绝对路径
+        return SQLiteSessionStore(url.split("://", 1)[1][1:])
+    if parsed.scheme == "memory":
+        return KVSessionStore(MemoryKV())
+    if parsed.scheme in ("redis", "rediss"):
+        # 可选依赖，只有配置了 redis 时才需要安装
+        import redis
+        return KVSessionStore(redis.Redis.from_url(url))
+    raise ValueError(f"不支持的会话存储地址: {url}")
@@ -0,0 +1,256 @@
+# shadowing.py - 跟读练习：把学习者的录音与原句对齐，比较节奏和流利度
+#
+# 录音按内容哈希存进 artifact_cache（source.<扩展名>，可由媒体服务回放），
+# 解码后转成与原句相同的 16kHz 分析音轨，两边各取 MFCC 类特征（mel 频带对数能量
+# 做 DCT，去掉反映音量的 c0，减去均值消除录音设备差异），再用 DTW 找出录音
+# 每一帧对应原句的哪一帧。由对齐路径得到：
+#   - 语速：去掉首尾静音后的时长比
+#   - 节奏偏差：按整体语速换算后，各处比原句提前/落后多少
+#   - 停顿：句中超过 250ms 的停顿，以及原句没有停顿的地方多出来的停顿
+#   - 拖慢/抢快的位置：局部语速偏离整体语速较多的原句时间段
+# 对齐在后台线程池里计算，结果按 (录音, 原句) 缓存，同一次录音重跑页面不会重复计算。
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import artifact_cache
+import media_service
+from audio_io import ANALYSIS_RATE, track_slice
+from segmentation import FRAME_MS, band_energies, compute_envelope
+
+WORKERS = int(os.environ.get("SHADOWING_ALIGN_WORKERS", 2))
+
+# 录音时长上限(秒)
+MAX_RECORDING_SECONDS = 30
+
+# 原句时长上限(秒)：DTW 的累计代价矩阵是 原句帧数 x 录音帧数，两边都要有上限，
+# 30 秒对 30 秒约 36MB
+MAX_SENTENCE_SECONDS = 30
+
+N_COEFFS = 13
+
+# 低于句中最响帧多少 dB 算静音
+SILENCE_DB = 35
+
+# 句中停顿的最短时长(ms)
+MIN_PAUSE_MS = 250
+
+# 局部语速的统计窗口(ms)，以及偏离整体语速多少倍算拖慢/抢快
+TEMPO_WINDOW_MS = 500
+TEMPO_TOLERANCE = 1.5
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="align")
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def save_attempt(data, ext):
+    """把录音存进缓存，返回 (录音的缓存键, 缓存内路径)"""
+    key = hashlib.sha256(data).hexdigest()
+    name = f"source{ext}"
+    if not artifact_cache.has(key, name):
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(data)
+        artifact_cache.atomic_write(key, name, write)
+    return key, artifact_cache.artifact_path(key, name)
+
+
+def mfcc(track, n_coeffs=N_COEFFS):
+    """每帧的 MFCC（去掉 c0，减去均值），返回 (帧数, n_coeffs - 1)"""
+    energies = band_energies(track)
+    n_bands = energies.shape[1]
+    k = np.arange(n_coeffs)[:, None]
+    dct = np.cos(np.pi / n_bands * (np.arange(n_bands) + 0.5) * k).astype(np.float32)
+    coeffs = energies @ dct[1:].T
+    return coeffs - coeffs.mean(axis=0)
+
+
+def voiced_range(track):
+    """去掉首尾静音后的 (起始帧, 结束帧)，整段都是静音时返回 None"""
+    envelope = compute_envelope(track)
+    if len(envelope) == 0:
+        return None
+    level = 10 * np.log10(envelope + 1e-10)
+    active = np.flatnonzero(level > level.max() - SILENCE_DB)
+    if len(active) == 0 or level.max() < -60:
+        return None
+    return int(active[0]), int(active[-1]) + 1
+
+
+def pauses(track, begin, end):
+    """[begin, end) 帧范围内超过 MIN_PAUSE_MS 的停顿，返回 [(开始帧, 结束帧), ...]"""
+    level = 10 * np.log10(compute_envelope(track)[begin:end] + 1e-10)
+    if len(level) == 0:
+        return []
+    silent = level < level.max() - SILENCE_DB
+    edges = np.diff(np.concatenate(([0], silent.view(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    long_enough = (ends - starts) * FRAME_MS >= MIN_PAUSE_MS
+    return [(begin + int(s), begin + int(e)) for s, e in zip(starts[long_enough], ends[long_enough])]
+
+
+def dtw(cost):
+    """动态时间规整，返回对齐路径 [(原句帧, 录音帧), ...]（升序）
+
+    按反对角线推进：同一条反对角线上的格子互不依赖，一次向量化算完，
+    Python 循环只有 n + m 次。
+    """
+    n, m = cost.shape
+    total = np.full((n + 1, m + 1), np.inf, dtype=np.float32)
+    total[0, 0] = 0
+    for diagonal in range(2, n + m + 1):
+        i = np.arange(max(1, diagonal - m), min(n, diagonal - 1) + 1)
+        j = diagonal - i
+        best = np.minimum(np.minimum(total[i - 1, j], total[i, j - 1]), total[i - 1, j - 1])
+        total[i, j] = cost[i - 1, j - 1] + best
+
+    # 回溯
+    i, j = n, m
+    path = [(i - 1, j - 1)]
+    while i > 1 or j > 1:
+        steps = (total[i - 1, j - 1], total[i - 1, j], total[i, j - 1])
+        step = int(np.argmin(steps))
+        if step == 0:
+            i, j = i - 1, j - 1
+        elif step == 1:
+            i -= 1
+        else:
+            j -= 1
+        path.append((i - 1, j - 1))
+    return np.array(path[::-1])
+
+
+def _distance(reference, attempt):
+    """两组特征逐帧的余弦距离矩阵"""
+    reference = reference / (np.linalg.norm(reference, axis=1, keepdims=True) + 1e-6)
+    attempt = attempt / (np.linalg.norm(attempt, axis=1, keepdims=True) + 1e-6)
+    # 浮点误差可能得到略小于 0 的距离，负的代价会让路径在静音段里绕远路
+    return np.maximum(1 - reference @ attempt.T, 0)
+
+
+def _spots(ref_times, local_tempo, predicate):
+    """局部语速满足条件的连续原句时间段 [(开始秒, 结束秒, 局部语速), ...]"""
+    spots = []
+    for index in np.flatnonzero(predicate):
+        start, end, tempo = ref_times[index], ref_times[index] + TEMPO_WINDOW_MS / 1000, float(local_tempo[index])
+        if spots and start <= spots[-1][1]:
+            # 相邻窗口合并，保留偏离最大的局部语速
+            previous = spots[-1][2]
+            spots[-1] = (spots[-1][0], end, tempo if abs(np.log(tempo)) > abs(np.log(previous)) else previous)
+        else:
+            spots.append((start, end, tempo))
+    return [(round(start, 2), round(end, 2), round(tempo, 2)) for start, end, tempo in spots]
+
+
+def compare(reference, attempt):
+    """对齐原句与录音（均为 16kHz int16 音轨），返回节奏/流利度报告"""
+    started = time.perf_counter()
+    ref_range = voiced_range(reference)
+    att_range = voiced_range(attempt)
+    if ref_range is None or att_range is None:
+        raise ValueError("录音里没有检测到声音")
+
+    ref_features = mfcc(reference)[ref_range[0]:ref_range[1]]
+    att_features = mfcc(attempt)[att_range[0]:att_range[1]]
+    cost = _distance(ref_features, att_features)
+    path = dtw(cost)
+
+    ref_frames = ref_range[1] - ref_range[0]
+    att_frames = att_range[1] - att_range[0]
+    tempo = att_frames / ref_frames
+
+    # 原句每一帧在录音里的平均位置，与按整体语速换算的位置之差
+    counts = np.bincount(path[:, 0], minlength=ref_frames)
+    mapped = np.bincount(path[:, 0], weights=path[:, 1], minlength=ref_frames) / np.maximum(counts, 1)
+    deviation = (mapped - np.arange(ref_frames) * tempo) * FRAME_MS
+
+    # 局部语速：每个窗口内录音用了多少帧 / 原句帧数，再除以整体语速
+    window = max(1, TEMPO_WINDOW_MS // FRAME_MS)
+    starts = np.arange(0, max(1, ref_frames - window), window // 2)
+    ends = np.minimum(starts + window, ref_frames - 1)
+    local_tempo = (mapped[ends] - mapped[starts]) / np.maximum(ends - starts, 1) / tempo
+    local_tempo = np.maximum(local_tempo, 0.05)
+    # 相对句子片段开头的时间
+    ref_times = (ref_range[0] + starts) * FRAME_MS / 1000
+
+    ref_pauses = pauses(reference, *ref_range)
+    att_pauses = pauses(attempt, *att_range)
+    # 录音里的停顿对应到原句的位置，原句那里没有停顿就算多出来的
+    ref_pause_frames = np.zeros(ref_frames, dtype=bool)
+    for start, end in ref_pauses:
+        ref_pause_frames[start - ref_range[0]:end - ref_range[0]] = True
+    att_to_ref = np.zeros(att_frames, dtype=np.int64)
+    att_to_ref[path[:, 1]] = path[:, 0]
+    extra = [
+        (start, end) for start, end in att_pauses
+        if not ref_pause_frames[att_to_ref[start - att_range[0]:end - att_range[0]]].any()
+    ]
+
+    similarity = float(np.clip(1 - cost[path[:, 0], path[:, 1]].mean(), 0, 1))
+    return {
+        "reference_s": round(ref_frames * FRAME_MS / 1000, 2),
+        "attempt_s": round(att_frames * FRAME_MS / 1000, 2),
+        "tempo": round(float(tempo), 2),
+        "start_delay_s": round(att_range[0] * FRAME_MS / 1000, 2),
+        "timing_error_ms": round(float(np.abs(deviation).mean())),
+        "max_lag_ms": round(float(deviation.max())),
+        "max_lead_ms": round(float(-deviation.min())),
+        "reference_pauses": len(ref_pauses),
+        "attempt_pauses": len(att_pauses),
+        "extra_pauses": len(extra),
+        "longest_pause_s": round(max((end - start for start, end in att_pauses), default=0) * FRAME_MS / 1000, 2),
+        "slow_spots": _spots(ref_times, local_tempo, local_tempo > TEMPO_TOLERANCE),
+        "fast_spots": _spots(ref_times, local_tempo, local_tempo < 1 / TEMPO_TOLERANCE),
+        "similarity": round(similarity * 100),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000),
+    }
+
+
+def _align(attempt_key, attempt_path, load_reference, start_ms, end_ms):
+    if end_ms - start_ms > MAX_SENTENCE_SECONDS * 1000:
+        raise ValueError(f"原句超过 {MAX_SENTENCE_SECONDS} 秒，请先把它切短再跟读")
+    # 先读文件头里的时长，过长的录音不进解码队列；浏览器录的 webm 常常不带时长，
+    # 这时解码后再按采样数检查
+    duration = media_service.probe_duration(attempt_path)
+    if duration is not None and duration > MAX_RECORDING_SECONDS:
+        raise ValueError(f"录音超过 {MAX_RECORDING_SECONDS} 秒")
+    attempt, _ = media_service.decode_analysis(attempt_path)
+    if len(attempt) > MAX_RECORDING_SECONDS * ANALYSIS_RATE:
+        raise ValueError(f"录音超过 {MAX_RECORDING_SECONDS} 秒")
+    return compare(track_slice(load_reference(), start_ms, end_ms), attempt)
+
+
+def submit(attempt_key, attempt_path, reference_key, load_reference, start_ms, end_ms):
+    """在后台对齐一次录音，返回 Future，结果为 compare() 的报告
+
+    load_reference() 返回原句所在文件的分析音轨。同一次录音对同一句只计算一次，
+    算过的直接从缓存读出。
+    """
+    name = f"shadow_{reference_key[:16]}_{start_ms}_{end_ms}.json"
+    ident = (attempt_key, name)
+    # 解码排进提交者自己的 ffmpeg 队列，一个人连续录音不会挤占其他人
+    session = media_service.current_session()
+
+    def align():
+        with media_service.session_scope(session):
+            return _align(attempt_key, attempt_path, load_reference, start_ms, end_ms)
+
+    with _pending_lock:
+        future = _pending.get(ident)
+        if future is not None:
+            return future
+        future = _executor.submit(artifact_cache.get_json, attempt_key, name, align)
+        _pending[ident] = future
+    # 已经完成时回调会立即在当前线程执行，不能持有锁
+    future.add_done_callback(lambda _: _forget(ident))
+    return future
+
+
+def _forget(ident):
+    with _pending_lock:
+        _pending.pop(ident, None)
@@ -0,0 +1,116 @@
+# shadowing_ui.py - 跟读练习页
+#
+# app.py 和 no_whisper.py 共用：播放当前句子，浏览器录音或上传录音，在后台对齐后
+# 显示语速、节奏偏差、停顿和相似度。页面状态（句子、当前句、缓存键等）取自
+# st.session_state，两个页面的字段名一致。
+import mimetypes
+import os
+from concurrent.futures import TimeoutError
+
+import streamlit as st
+
+import media_server
+import pipeline
+import recorder
+import shadowing
+import uploads
+from review_scheduler import item_id
+
+
+def _submit(attempt_key, attempt_path, start_ms, end_ms):
+    # 对齐在后台线程里进行，不能在那里读 session_state
+    cache_key = st.session_state.cache_key
+    # 导入的会话可能与当前上传的不是同一个文件，原句只从该会话自己的原文件取
+    if st.session_state.source_key == cache_key:
+        source_path = st.session_state.source_path
+    else:
+        source_path = pipeline.find_source(cache_key) if cache_key else None
+    return shadowing.submit(
+        attempt_key, attempt_path, cache_key,
+        lambda: pipeline.load_track(source_path, cache_key),
+        start_ms, end_ms
+    )
+
+
+def _show_report(report, attempt_path):
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("语速（用时比）", f"{report['tempo']:.2f}x", f"{report['attempt_s'] - report['reference_s']:+.1f}s", delta_color="inverse")
+    col2.metric("节奏偏差", f"{report['timing_error_ms']} ms", help="按你的整体语速换算后，各处平均比原句提前或落后多少")
+    col3.metric("句中停顿", report['attempt_pauses'], f"{report['attempt_pauses'] - report['reference_pauses']:+d}", delta_color="inverse")
+    col4.metric("相似度", report['similarity'], help="对齐后逐帧频谱的相似程度（0~100），只作参考")
+
+    tips = []
+    if report['extra_pauses']:
+        tips.append(f"原句没有停顿的地方多停了 {report['extra_pauses']} 次，最长 {report['longest_pause_s']:.1f} 秒")
+    for start, end, tempo in report['slow_spots']:
+        tips.append(f"🐢 {start:.1f}–{end:.1f}s 处拖慢（比你的整体语速慢 {tempo:.1f} 倍）")
+    for start, end, tempo in report['fast_spots']:
+        tips.append(f"🐇 {start:.1f}–{end:.1f}s 处抢快（比你的整体语速快 {1 / tempo:.1f} 倍）")
+    if tips:
+        st.markdown("\n".join(f"- {tip}" for tip in tips))
+    else:
+        st.success("节奏和原句很接近 👍")
+    st.caption(f"原句 {report['reference_s']:.1f}s · 跟读 {report['attempt_s']:.1f}s · 开口延迟 {report['start_delay_s']:.1f}s · 对齐耗时 {report['elapsed_ms']} ms")
+
+    # 回放自己的录音
+    st.audio(media_server.url(attempt_path), format=mimetypes.guess_type(attempt_path)[0] or "audio/webm")
+
+
+def render_shadowing_tab(stats):
+    """跟读练习页；stats 为当前学习者的 PracticeStats，每次录音记一次跟读练习"""
+    if not st.session_state.sentences:
+        st.info("请先上传音频并进行断句，然后开始跟读练习")
+        return
+
+    st.header("🎤 跟读练习")
+    index = st.session_state.current_sentence
+    current = st.session_state.sentences[index]
+    start_ms = round(current['start_time'] * 1000)
+    end_ms = round(current['end_time'] * 1000)
+    st.caption(f"句子 {index + 1} · 先听原句，再录下自己的跟读，对比语速、停顿和节奏")
+    if os.path.exists(current['audio_path']):
+        st.audio(media_server.url(current['audio_path']), format=current.get('mime', "audio/mp3"))
+
+    # 浏览器录音；用不了麦克风时可以上传手机录音
+    attempt = None
+    recording = recorder.record(key=f"shadow_{st.session_state.cache_key}_{start_ms}", max_seconds=shadowing.MAX_RECORDING_SECONDS)
+    recording_file = st.file_uploader("或上传录音", type=["webm", "ogg", "m4a", "mp3", "wav"], key=f"shadow_file_{st.session_state.cache_key}_{start_ms}")
+    try:
+        if recording_file is not None:
+            attempt = uploads.spool(recording_file)
+        elif recording is not None:
+            attempt = shadowing.save_attempt(*recording)
+    except uploads.UploadRejected as e:
+        st.error(str(e))
+    if attempt is None:
+        return
+
+    attempt_key, attempt_path = attempt
+    future = _submit(attempt_key, attempt_path, start_ms, end_ms)
+    report = None
+    with st.spinner("正在对齐录音..."):
+        try:
+            report = future.result(timeout=10)
+        except TimeoutError:
+            st.info("对齐还在后台进行，稍后点击刷新查看结果")
+            st.button("🔄 刷新结果")
+        except Exception as e:
+            st.error(f"对齐失败: {str(e)}（原句需要原音频或分析缓存，可重新上传音频后再试）")
+    if not report:
+        return
+
+    if (attempt_key, start_ms) not in st.session_state.scored_attempts:
+        # 每次录音只计一次跟读练习
+        st.session_state.scored_attempts.add((attempt_key, start_ms))
+        info = {
+            "cache_key": st.session_state.cache_key,
+            "start_ms": start_ms,
+            "end_ms": end_ms,
+            "audio_name": st.session_state.audio_name,
+            "reference": current.get('transcript')
+        }
+        stats.record(
+            "submit", st.session_state.stats_session, item_id(st.session_state.cache_key, start_ms, end_ms), info,
+            mode="shadowing", tempo=report['tempo'], similarity=report['similarity']
+        )
+    _show_report(report, attempt_path)
@@ -0,0 +1,77 @@
+# stats_ui.py - 练习统计页
+#
+# app.py 和 no_whisper.py 共用：按学习者（地址栏里的会话 id）取练习统计实例、记录播放，
+# 以及练习统计页的总览、走势图和薄弱环节。
+import streamlit as st
+
+import practice_stats
+
+
+@st.cache_resource(max_entries=256)
+def get_practice_stats(user):
+    # 每个学习者（会话 id）一个统计目录；同一学习者的各个会话共用一个实例（内部加锁）
+    return practice_stats.PracticeStats(practice_stats.user_directory(user))
+
+
+def log_play(item, info):
+    """换到一个新句子时记一次播放，页面重跑不重复记"""
+    if st.session_state.last_played != item:
+        st.session_state.last_played = item
+        get_practice_stats(st.session_state.session_id).record("play", st.session_state.stats_session, item, info)
+
+
+def _weakest_sentences(stats):
+    weakest = stats.weakest_sentences(10)
+    if not weakest:
+        st.caption("有原文的句子提交听写后会在这里显示正确率")
+        return
+    st.dataframe([
+        {
+            "音频": s['audio_name'],
+            "位置": f"{s['start_ms'] / 1000:.1f}s" if s['start_ms'] is not None else "",
+            "原文": s['reference'] or "",
+            "练习": s['attempts'],
+            "最近正确率": f"{s['average']:.0%}",
+            "走势": " → ".join(f"{score:.0%}" for score in s['scores'][-4:]),
+            "用时": f"{s['time_s'] / 60:.1f} 分钟",
+        }
+        for s in weakest
+    ], use_container_width=True, hide_index=True)
+
+
+def _weakest_words(stats):
+    words = stats.weakest_words(15)
+    if not words:
+        st.caption("同一个单词至少听写过两次后才会统计")
+        return
+    st.dataframe([
+        {"单词": word, "漏听": f"{missed}/{seen}"} for word, missed, seen in words
+    ], use_container_width=True, hide_index=True)
+
+
+def render_stats_tab():
+    """当前学习者的练习统计页"""
+    # 只读增量汇总，不扫描事件日志
+    stats = get_practice_stats(st.session_state.session_id)
+    overview = stats.overview()
+    if not (overview["attempts"] or overview["plays"]):
+        st.info("还没有练习记录，开始听写或跟读后这里会显示练习时长、正确率走势和薄弱环节")
+        return
+
+    st.header("📊 练习统计")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("练习时长", f"{overview['time_s'] / 3600:.1f} 小时")
+    col2.metric("提交次数", overview['attempts'])
+    col3.metric("平均正确率", "—" if overview['accuracy'] is None else f"{overview['accuracy']:.0%}")
+    col4.metric("练过的句子", overview['sentences'], f"{overview['days']} 天", delta_color="off")
+
+    st.subheader("最近 30 天")
+    st.vega_lite_chart(practice_stats.trend_chart(stats.daily(30)), use_container_width=True)
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        st.subheader("最薄弱的句子")
+        _weakest_sentences(stats)
+    with col2:
+        st.subheader("常漏听的单词")
+        _weakest_words(stats)
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# 各模块都放在仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import artifact_cache  # noqa: E402
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """每个测试用独立的 artifact_cache 目录"""
+    directory = tmp_path / "cache"
+    monkeypatch.setattr(artifact_cache, "CACHE_DIR", str(directory))
+    monkeypatch.setattr(artifact_cache, "_touched", {})
+    return directory
@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+import pytest
+
+import artifact_cache
+
+KEY = "cd" * 32
+
+
+def test_concurrent_gets_create_once(cache_dir):
+    calls = []
+    started = threading.Barrier(8)
+
+    def create():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return {"value": 1}
+
+    results = []
+
+    def get():
+        started.wait()
+        results.append(artifact_cache.get_json(KEY, "once.json", create))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{"value": 1}] * 8
+    assert artifact_cache._flights == {}
+
+
+def test_flight_released_after_create_raises(cache_dir):
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        artifact_cache.get_json(KEY, "fails.json", fail)
+    assert artifact_cache._flights == {}
+    assert artifact_cache.get_json(KEY, "fails.json", lambda: [1, 2]) == [1, 2]
+
+
+def _entry(key, nbytes, used):
+    artifact_cache.atomic_write(key, "data.bin", lambda tmp: open(tmp, "wb").write(b"x" * nbytes))
+    os.utime(artifact_cache.entry_dir(key), (used, used))
+
+
+def test_evict_oldest_entries_first(cache_dir, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "DISK_LIMIT", 0)
+    now = time.time()
+    keys = [f"{i:02x}" * 32 for i in range(5)]
+    for age, key in zip((50, 40, 30, 20, 10), keys):
+        _entry(key, 1000, now - age * 3600)
+
+    freed = artifact_cache.evict(limit=3500, now=now)
+    assert freed == 2000
+    assert [artifact_cache.has(key, "data.bin") for key in keys] == [False, False, True, True, True]
+
+
+def test_evict_keeps_recently_used_entries(cache_dir, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "DISK_LIMIT", 0)
+    now = time.time()
+    old, recent = "ab" * 32, "ef" * 32
+    _entry(old, 1000, now - 5 * 3600)
+    _entry(recent, 1000, now - 5 * 3600)
+    artifact_cache.touch(recent, now=now - 60)
+
+    artifact_cache.evict(limit=500, now=now)
+    assert not artifact_cache.has(old, "data.bin")
+    assert artifact_cache.has(recent, "data.bin")
+
+
+def test_writes_trigger_eviction(cache_dir, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "DISK_LIMIT", 2000)
+    monkeypatch.setattr(artifact_cache, "EVICT_MIN_AGE", 0)
+    monkeypatch.setattr(artifact_cache, "_written", 0)
+    old = "ab" * 32
+    _entry(old, 1500, time.time() - 3600)
+    _entry("ef" * 32, 1500, time.time())
+    assert not os.path.exists(artifact_cache.entry_dir(old))
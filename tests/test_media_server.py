@@ -0,0 +1,89 @@
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from unittest import mock
+
+from tornado.testing import AsyncHTTPTestCase
+
+import artifact_cache
+import media_server
+
+KEY = "ab" * 32
+CLIP = b"0123456789" * 100
+
+
+class MediaServerTest(AsyncHTTPTestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(artifact_cache, "CACHE_DIR", self._directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._directory.cleanup)
+        for name, data in (("clip_0_1000.mp3", CLIP), ("envelope.npy", b"private")):
+            artifact_cache.atomic_write(KEY, name, lambda tmp, data=data: open(tmp, "wb").write(data))
+        super().setUp()
+
+    def get_app(self):
+        return media_server.make_app()
+
+    def _get(self, name, **headers):
+        return self.fetch(f"/media/{KEY[:2]}/{KEY}/{name}", headers=headers)
+
+    def test_serves_clip_with_immutable_cache_headers(self):
+        response = self._get("clip_0_1000.mp3")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, CLIP)
+        self.assertEqual(response.headers["Content-Type"], "audio/mpeg")
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertIn(f"max-age={media_server.CACHE_SECONDS}", response.headers["Cache-Control"])
+        self.assertTrue(response.headers["Etag"])
+
+    def test_etag_revalidation_returns_304(self):
+        etag = self._get("clip_0_1000.mp3").headers["Etag"]
+        response = self._get("clip_0_1000.mp3", **{"If-None-Match": etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, b"")
+
+    def test_range_request(self):
+        response = self._get("clip_0_1000.mp3", Range="bytes=10-19")
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, CLIP[10:20])
+
+    def test_only_audio_artifacts_are_served(self):
+        self.assertEqual(self._get("envelope.npy").code, 404)
+        self.assertEqual(self._get("..%2Fenvelope.npy").code, 404)
+        self.assertEqual(self.fetch("/media/ab/not-a-key/clip_0_1000.mp3").code, 404)
+
+    def test_cors_only_for_configured_origins(self):
+        with mock.patch.object(media_server, "ALLOWED_ORIGINS", {"https://app.example.com"}):
+            allowed = self._get("clip_0_1000.mp3", Origin="https://app.example.com")
+            other = self._get("clip_0_1000.mp3", Origin="https://evil.example.com")
+        self.assertEqual(allowed.headers["Access-Control-Allow-Origin"], "https://app.example.com")
+        self.assertNotIn("Access-Control-Allow-Origin", other.headers)
+
+
+def test_takes_over_the_port_when_it_is_freed(monkeypatch):
+    monkeypatch.setattr(media_server, "BIND_RETRY_SECONDS", 0.05)
+    holder = socket.socket()
+    holder.bind(("127.0.0.1", 0))
+    holder.listen()
+    port = holder.getsockname()[1]
+    started = threading.Event()
+    threading.Thread(target=media_server._serve, args=(port, "127.0.0.1", started), daemon=True).start()
+    assert started.wait(5)
+
+    # 占着端口的进程退出后，重试的一方开始提供服务
+    holder.close()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/media/ab/missing/clip_0_1.mp3", timeout=1)
+        except urllib.error.HTTPError as e:
+            assert e.code == 404
+            break
+        except OSError:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
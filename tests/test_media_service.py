@@ -0,0 +1,45 @@
+import threading
+
+import media_service
+from media_service import MediaService
+
+
+def _blocked_service():
+    """单个 worker 的服务，先用一个任务占住 worker，之后提交的任务都在排队"""
+    service = MediaService(max_workers=1)
+    release = threading.Event()
+    service.submit(release.wait, session="blocker")
+    return service, release
+
+
+def test_sessions_take_turns():
+    service, release = _blocked_service()
+    order = []
+    futures = [service.submit(order.append, f"a{i}", session="a") for i in range(3)]
+    futures += [service.submit(order.append, f"b{i}", session="b") for i in range(2)]
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["a0", "b0", "a1", "b1", "a2"]
+
+
+def test_background_thread_submits_for_its_session():
+    service, release = _blocked_service()
+    order = []
+    futures = [service.submit(order.append, f"a{i}", session="a") for i in range(2)]
+
+    # 后台线程没有 Streamlit 会话，以提交者的会话名义排队，而不是混进统一的 "local" 队列
+    def background():
+        with media_service.session_scope("b"):
+            assert media_service.current_session() == "b"
+            futures.append(service.submit(order.append, "b0"))
+
+    thread = threading.Thread(target=background)
+    thread.start()
+    thread.join()
+    futures.append(service.submit(order.append, "local0"))
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["a0", "b0", "local0", "a1"]
+    assert media_service.current_session() == "local"
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import practice_stats
+from practice_stats import PracticeStats
+
+INFO = {"audio_name": "a.mp3", "start_ms": 0, "end_ms": 1000, "reference": "hello world"}
+
+
+def _practise(stats, rounds, now=0.0):
+    for i in range(rounds):
+        stats.record("play", "s", "k:0_1000", INFO, now=now + i * 10)
+        stats.record("submit", "s", "k:0_1000", INFO, now=now + i * 10 + 5)
+        stats.record("score", "s", "k:0_1000", INFO, now=now + i * 10 + 5,
+                     score=0.5, words=["hello", "world"], missed=["world"])
+
+
+def test_aggregates(tmp_path):
+    stats = PracticeStats(str(tmp_path))
+    _practise(stats, 3)
+    overview = stats.overview()
+    assert (overview["plays"], overview["attempts"], overview["sentences"]) == (3, 3, 1)
+    assert overview["accuracy"] == 0.5
+    assert overview["time_s"] == 25  # 相邻事件的间隔：5 + 5 + 5 + 5 + 5
+    assert stats.weakest_words() == [("world", 3, 3)]
+    assert stats.weakest_sentences()[0]["scores"] == [0.5, 0.5, 0.5]
+
+
+def test_checkpoint_and_tail_replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(practice_stats, "CHECKPOINT_BYTES", 1)
+    stats = PracticeStats(str(tmp_path))
+    _practise(stats, 2)
+    # 追加的日志超过汇总本身的大小时自动写汇总
+    with open(tmp_path / "stats.json", encoding="utf-8") as f:
+        assert json.load(f)["offset"] > 0
+    stats.flush()
+    with open(tmp_path / "stats.json", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    assert checkpoint["offset"] == (tmp_path / "events.jsonl").stat().st_size
+    assert checkpoint["totals"]["attempts"] == 2
+
+    # 汇总之后另一个进程追加的事件，打开时从偏移处补读
+    monkeypatch.setattr(practice_stats, "CHECKPOINT_BYTES", 1 << 30)
+    other = PracticeStats(str(tmp_path))
+    _practise(other, 1, now=100)
+    with open(tmp_path / "events.jsonl", "ab") as f:
+        f.write(b'{"ts": 200, "type": "play", "sess')  # 写了一半的行留到下次
+    reopened = PracticeStats(str(tmp_path))
+    assert reopened.overview()["attempts"] == 3
+    assert stats.overview()["attempts"] == 3
+
+
+def test_truncated_log_resets_summary(tmp_path):
+    stats = PracticeStats(str(tmp_path))
+    _practise(stats, 2)
+    stats.flush()
+    (tmp_path / "events.jsonl").write_bytes(b"")
+    assert PracticeStats(str(tmp_path)).overview()["attempts"] == 0
+
+
+def test_rejects_unknown_event(tmp_path):
+    with pytest.raises(ValueError):
+        PracticeStats(str(tmp_path)).record("cheer", "s")
+
+
+@pytest.mark.parametrize("user", ["", "../other", "/tmp/x", "ABC"])
+def test_user_directory_rejects_paths(user):
+    with pytest.raises(ValueError):
+        practice_stats.user_directory(user)
+
+
+def test_user_directory(tmp_path):
+    assert practice_stats.user_directory("ab12", str(tmp_path)) == str(tmp_path / "ab12")
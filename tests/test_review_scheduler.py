@@ -0,0 +1,65 @@
+import pytest
+
+from review_scheduler import DAY, RELEARN_DELAY, ReviewScheduler, item_id, quality_from_score, score_dictation
+
+INFO = {"cache_key": "k", "start_ms": 0, "end_ms": 1000, "audio_name": "a.mp3", "reference": "hello world"}
+ITEM = item_id("k", 0, 1000)
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return ReviewScheduler(str(tmp_path / "review.db"))
+
+
+def test_sm2_intervals(scheduler):
+    card = scheduler.record("u", ITEM, 5, INFO, now=0)
+    assert (card["repetitions"], card["interval"], card["due"]) == (1, 1.0, DAY)
+    card = scheduler.record("u", ITEM, 5, INFO, now=DAY)
+    assert (card["repetitions"], card["interval"]) == (2, 6.0)
+    ease = card["ease"]
+    card = scheduler.record("u", ITEM, 4, INFO, now=7 * DAY)
+    assert card["interval"] == round(6.0 * ease, 1)
+    assert card["due"] == 7 * DAY + card["interval"] * DAY
+
+
+def test_failure_relearns_soon(scheduler):
+    scheduler.record("u", ITEM, 5, INFO, now=0)
+    card = scheduler.record("u", ITEM, 1, INFO, now=100)
+    assert (card["repetitions"], card["lapses"], card["interval"]) == (0, 1, 0.0)
+    assert card["due"] == 100 + RELEARN_DELAY
+    assert card["ease"] >= 1.3
+
+
+def test_next_due_order_and_skip(scheduler):
+    for start, due in ((0, 30), (1000, 10), (2000, 20)):
+        info = dict(INFO, start_ms=start, end_ms=start + 500)
+        scheduler.set_starred("u", item_id("k", start, start + 500), True, info, now=due)
+    assert scheduler.next_due("u", now=5) is None
+    assert scheduler.next_due("u", now=100)["start_ms"] == 1000
+    skip = {item_id("k", 1000, 1500)}
+    assert scheduler.next_due("u", now=100, skip=skip)["start_ms"] == 2000
+    assert scheduler.next_due("u", now=15, skip=skip) is None
+
+
+def test_cards_are_per_user(scheduler):
+    scheduler.set_starred("alice", ITEM, True, INFO, now=0)
+    assert scheduler.next_due("bob", now=10) is None
+    assert scheduler.starred_spans("bob", "k") == set()
+    scheduler.record("bob", ITEM, 1, INFO, now=5)
+    assert scheduler.next_due("alice", now=10)["lapses"] == 0
+    assert scheduler.starred_spans("alice", "k") == {(0, 1000)}
+
+
+def test_workers_do_not_overwrite_each_other(tmp_path):
+    path = str(tmp_path / "review.db")
+    first, second = ReviewScheduler(path), ReviewScheduler(path)
+    first.record("u", ITEM, 5, INFO, now=0)
+    second.record("u", ITEM, 5, INFO, now=DAY)
+    assert first.record("u", ITEM, 5, INFO, now=7 * DAY)["repetitions"] == 3
+
+
+def test_dictation_scoring():
+    assert score_dictation("Hello, world!", "hello world") == 1.0
+    assert score_dictation("hello world", "hello word") == 0.5
+    assert quality_from_score(0.5) == 2
+    assert quality_from_score(1.0) == 5
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+
+from audio_io import ANALYSIS_RATE
+from segmentation import FRAME_MS, compute_envelope, detect_spans, detect_speech_spans, speech_probability
+
+
+def _speech_and_pauses(seed, n=12):
+    """响亮的噪声段和几乎无声的停顿交替，时长随机"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for _ in range(n):
+        parts.append(rng.normal(0, 0.3, int(ANALYSIS_RATE * rng.uniform(0.3, 2.0))))
+        parts.append(rng.normal(0, 0.001, int(ANALYSIS_RATE * rng.uniform(0.1, 1.2))))
+    return (np.concatenate(parts) * 32767).clip(-32768, 32767).astype(np.int16)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("min_silence_len, silence_thresh", [(300, -40), (500, -40), (700, -30)])
+def test_matches_pydub(seed, min_silence_len, silence_thresh):
+    track = _speech_and_pauses(seed)
+    segment = AudioSegment(data=track.tobytes(), sample_width=2, frame_rate=ANALYSIS_RATE, channels=1)
+    expected = detect_nonsilent(segment, min_silence_len, silence_thresh)
+
+    spans = detect_spans(compute_envelope(track), min_silence_len, silence_thresh,
+                         keep_silence=0, total_ms=len(segment))
+
+    # pydub 按 1ms 步长滑动窗口，这里按 10ms 帧，边界最多差一帧
+    assert len(spans) == len(expected)
+    for (start, end), (expected_start, expected_end) in zip(spans, expected):
+        assert abs(start - expected_start) <= FRAME_MS
+        assert abs(end - expected_end) <= FRAME_MS
+
+
+def test_keep_silence_splits_overlap_midway():
+    track = _speech_and_pauses(0)
+    spans = detect_spans(compute_envelope(track), 300, -40, keep_silence=1000)
+    assert spans[0][0] == 0
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert end == start
+
+
+def test_all_silent_and_empty():
+    assert detect_spans(compute_envelope(np.zeros(ANALYSIS_RATE, dtype=np.int16)), 300, -40) == []
+    assert detect_spans(compute_envelope(np.zeros(0, dtype=np.int16)), 300, -40) == []
+
+
+def _sentence(rng, seconds):
+    """类似语音的一句话：基频起伏、谐波强度随机的音节加少量气声，音节间隔 20~120ms"""
+    samples = []
+    while sum(map(len, samples)) < seconds * ANALYSIS_RATE:
+        length = int(ANALYSIS_RATE * rng.uniform(0.12, 0.35))
+        t = np.arange(length) / ANALYSIS_RATE
+        pitch = rng.uniform(100, 240) * (1 + 0.1 * np.sin(2 * np.pi * 3 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / ANALYSIS_RATE
+        voiced = sum(np.sin(k * phase) * rng.uniform(0.3, 1.0) / k for k in range(1, 20))
+        breath = 0.15 * rng.standard_normal(length)
+        samples.append(0.25 * rng.uniform(0.5, 1.0) * np.hanning(length) * (voiced + breath))
+        samples.append(np.zeros(int(ANALYSIS_RATE * rng.uniform(0.02, 0.12))))
+    return np.concatenate(samples[:-1])
+
+
+def _lecture(seed, snr_db=None, n=5):
+    """n 句话，句间停顿 0.8~1.2 秒；snr_db 不为 None 时按语音段功率混入房间噪声（高通后的褐噪声）
+
+    返回 (音轨, 真实句子 [(开始ms, 结束ms), ...])
+    """
+    rng = np.random.default_rng(seed)
+    parts, spans, position = [], [], 0
+    for _ in range(n):
+        pause = np.zeros(int(ANALYSIS_RATE * rng.uniform(0.8, 1.2)))
+        sentence = _sentence(rng, rng.uniform(1.5, 3.0))
+        start = position + len(pause)
+        position = start + len(sentence)
+        parts += [pause, sentence]
+        spans.append((start * 1000 // ANALYSIS_RATE, position * 1000 // ANALYSIS_RATE))
+    track = np.concatenate(parts + [np.zeros(ANALYSIS_RATE)])
+    if snr_db is not None:
+        noise = np.cumsum(rng.standard_normal(len(track)))
+        noise -= np.convolve(noise, np.ones(64) / 64, "same")
+        speech_power = np.mean(track[track != 0] ** 2)
+        track = track + noise * np.sqrt(speech_power / np.mean(noise ** 2) / 10 ** (snr_db / 10))
+    return np.clip(track * 32767, -32768, 32767).astype(np.int16), spans
+
+
+# 种子与 benchmarks.py 拟合权重、跑基准时用的不同；权重改动后这里的句子数或边界会变
+@pytest.mark.parametrize("seed", [10, 11, 12, 13])
+@pytest.mark.parametrize("snr_db", [None, 20, 15, 10])
+def test_speech_spans_follow_sentences(seed, snr_db):
+    track, expected = _lecture(seed, snr_db)
+    total_ms = len(track) * 1000 // ANALYSIS_RATE
+    spans = detect_speech_spans(speech_probability(track), 500, keep_silence=0, total_ms=total_ms)
+
+    # 句间停顿里的噪声不算语音，音节间隔不断句；边界容差与 segment 基准相同
+    assert len(spans) == len(expected)
+    for (start, end), (expected_start, expected_end) in zip(spans, expected):
+        assert abs(start - expected_start) <= 150
+        assert abs(end - expected_end) <= 150
+
+
+def test_speech_probability_high_in_sentences_low_in_pauses():
+    track, expected = _lecture(10, snr_db=15)
+    probability = speech_probability(track)
+    assert len(probability) == len(compute_envelope(track))
+
+    inside = np.zeros(len(probability), dtype=bool)
+    for start, end in expected:
+        inside[start // FRAME_MS:end // FRAME_MS] = True
+    # 离边界 200ms 以外的帧
+    margin = 200 // FRAME_MS
+    core = np.convolve(inside, np.ones(2 * margin + 1), "same") == 2 * margin + 1
+    gap = np.convolve(~inside, np.ones(2 * margin + 1), "same") == 2 * margin + 1
+    assert np.median(probability[core]) > 0.8
+    assert np.median(probability[gap]) < 0.2
+
+
+def test_speech_spans_all_silent_and_empty():
+    assert detect_speech_spans(speech_probability(np.zeros(ANALYSIS_RATE, dtype=np.int16)), 500) == []
+    assert detect_speech_spans(np.zeros(0, dtype=np.float32), 500) == []
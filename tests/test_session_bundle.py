@@ -0,0 +1,145 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+import artifact_cache
+import pipeline
+import session_bundle
+
+KEY = "ab" * 32
+
+
+def _sentences(spans, key=KEY):
+    sentences = []
+    for i, (start_ms, end_ms) in enumerate(spans):
+        clip = pipeline.clip_name(start_ms, end_ms)
+        path = artifact_cache.atomic_write(key, clip, lambda tmp, i=i: open(tmp, "wb").write(b"clip%d" % i))
+        sentences.append({
+            "id": i, "clip": clip, "codec": "mp3", "audio_path": path,
+            "start_time": start_ms / 1000, "end_time": end_ms / 1000, "transcript": f"sentence {i}",
+        })
+    return sentences
+
+
+def _bundle(manifest, clips=()):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("manifest.json", json.dumps(manifest))
+        for name, data in clips:
+            zf.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def _manifest(**fields):
+    manifest = {
+        "format": session_bundle.FORMAT, "version": session_bundle.VERSION, "audio_name": "a.mp3",
+        "cache_key": KEY, "params": None, "spans": [[0, 1000]], "reference": [None],
+        "dictations": [""], "starred": [], "clips": False, "codec": "mp3",
+    }
+    manifest.update(fields)
+    return manifest
+
+
+def test_round_trip(cache_dir):
+    sentences = _sentences([(0, 1500), (2000, 3250)])
+    bundle = session_bundle.write_bundle(
+        io.BytesIO(), sentences, ["first", ""], starred={1}, audio_name="a.mp3",
+        cache_key=KEY, params=pipeline.DEFAULT_PARAMS
+    )
+    bundle.seek(0)
+    restored = session_bundle.read_bundle(bundle)
+    assert restored["cache_key"] == KEY
+    assert restored["audio_name"] == "a.mp3"
+    assert restored["dictations"] == ["first", ""]
+    assert restored["starred"] == {1}
+    assert [(s["start_time"], s["end_time"]) for s in restored["sentences"]] == [(0, 1.5), (2, 3.25)]
+    assert [s["transcript"] for s in restored["sentences"]] == ["sentence 0", "sentence 1"]
+    assert restored["sentences"][0]["audio_path"] == sentences[0]["audio_path"]
+
+
+def test_clips_are_not_written_under_the_claimed_key(cache_dir):
+    sentences = _sentences([(0, 1000)], key="cd" * 32)
+    bundle = session_bundle.write_bundle(io.BytesIO(), sentences, [""], cache_key=KEY, include_clips=True)
+    restored = session_bundle.read_bundle(bundle)
+    path = restored["sentences"][0]["audio_path"]
+    assert not artifact_cache.has(KEY, pipeline.clip_name(0, 1000))
+    assert os.path.dirname(path) != artifact_cache.entry_dir(KEY)
+    with open(path, "rb") as f:
+        assert f.read() == b"clip0"
+
+
+@pytest.mark.parametrize("fields", [
+    {"cache_key": "/tmp/outside"},
+    {"cache_key": "../" + "a" * 61},
+    {"cache_key": "AB" * 32},
+    {"spans": [[-1, 1000]]},
+    {"spans": [[0, "1000"]]},
+    {"spans": [[0.5, 1000]]},
+    {"spans": [[1000, 0]]},
+    {"spans": "0-1000"},
+    {"reference": []},
+    {"dictations": [None]},
+    {"starred": [3]},
+    {"codec": ["mp3"]},
+    {"version": "2"},
+    {"params": "energy"},
+    {"params": {"segmenter": "whisper", "min_silence_len": 500, "silence_thresh": -40, "keep_silence": 100}},
+    {"params": {"segmenter": "vad", "min_silence_len": 500, "silence_thresh": -40, "keep_silence": 100}},
+    {"params": {"min_silence_len": 500, "silence_thresh": "-40", "keep_silence": 100}},
+    {"params": {"min_silence_len": True, "silence_thresh": -40, "keep_silence": 100}},
+])
+def test_rejects_malformed_manifest(cache_dir, fields):
+    with pytest.raises(session_bundle.BundleError):
+        session_bundle.read_bundle(_bundle(_manifest(**fields)))
+
+
+@pytest.mark.parametrize("field", ["spans", "reference", "dictations", "starred"])
+def test_rejects_missing_fields(cache_dir, field):
+    manifest = _manifest()
+    del manifest[field]
+    with pytest.raises(session_bundle.BundleError):
+        session_bundle.read_bundle(_bundle(manifest))
+
+
+def test_rejects_missing_clip(cache_dir):
+    with pytest.raises(session_bundle.BundleError):
+        session_bundle.read_bundle(_bundle(_manifest(clips=True)))
+    assert not os.path.exists(cache_dir)
+
+
+def test_rejects_non_zip():
+    with pytest.raises(session_bundle.BundleError):
+        session_bundle.read_bundle(io.BytesIO(b"not a zip"))
+
+
+@pytest.mark.parametrize("params", [
+    None,
+    pipeline.DEFAULT_PARAMS,
+    {"segmenter": "vad", "min_silence_len": 500, "speech_thresh": 0.5, "keep_silence": 100},
+])
+def test_accepts_known_params(cache_dir, params):
+    restored = session_bundle.read_bundle(_bundle(_manifest(params=params)))
+    assert restored["params"] == params
+    if params is not None:
+        pipeline.sentences_name(restored["params"])
+
+
+@pytest.mark.parametrize("include_clips", [False, True])
+def test_benchmark_session_round_trip(cache_dir, monkeypatch, include_clips):
+    # benchmarks 导入时把缓存目录指向临时目录，测试结束后还原环境变量
+    monkeypatch.setenv("SHADOWING_CACHE_DIR", str(cache_dir))
+    import benchmarks
+    key, sentences, dictations, starred = benchmarks._fake_session(20)
+    bundle = session_bundle.write_bundle(
+        io.BytesIO(), sentences, dictations, starred, audio_name="bench.mp3", cache_key=key,
+        params=pipeline.DEFAULT_PARAMS, include_clips=include_clips
+    )
+    restored = session_bundle.read_bundle(io.BytesIO(bundle.getvalue()))
+    assert restored["cache_key"] == key
+    assert restored["dictations"] == dictations
+    assert restored["starred"] == starred
+    assert [s["start_time"] for s in restored["sentences"]] == [s["start_time"] for s in sentences]
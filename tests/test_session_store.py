@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+import session_store
+from session_store import SessionStore
+
+SID = "0123456789abcdef" * 2
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_store.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return session_store.open_store(f"sqlite:///{tmp_path}/sessions.db")
+    return session_store.open_store("memory://")
+
+
+def test_round_trip(store, clock):
+    data = {"cache_key": "ab" * 32, "spans": [[0, 1000]], "transcripts": ["听写"], "current_sentence": 0}
+    store.save(SID, data)
+    assert store.load(SID) == data
+    assert store.load("f" * 32) is None
+
+
+def test_overwrite_and_delete(store, clock):
+    store.save(SID, {"current_sentence": 0})
+    store.save(SID, {"current_sentence": 3})
+    assert store.load(SID) == {"current_sentence": 3}
+    store.delete(SID)
+    assert store.load(SID) is None
+
+
+def test_expiry_refreshed_by_save(store, clock):
+    store.save(SID, {"current_sentence": 1})
+    clock.now += session_store.SESSION_TTL - 10
+    assert store.load(SID) == {"current_sentence": 1}
+    store.save(SID, {"current_sentence": 2})
+    clock.now += session_store.SESSION_TTL - 10
+    assert store.load(SID) == {"current_sentence": 2}
+    clock.now += 20
+    assert store.load(SID) is None
+
+
+def test_sqlite_store_shared_between_connections(tmp_path, clock):
+    url = f"sqlite:///{tmp_path}/sessions.db"
+    session_store.open_store(url).save(SID, {"current_sentence": 5})
+    assert session_store.open_store(url).load(SID) == {"current_sentence": 5}
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+    class Incomplete(SessionStore):
+        def load(self, session_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_open_store():
+    assert session_store.open_store("") is None
+    with pytest.raises(ValueError):
+        session_store.open_store("ftp://example.com/sessions")
+
+
+@pytest.mark.parametrize("requested", [None, "", "../../etc", "A" * 32, SID + "0"])
+def test_resolve_session_id_replaces_invalid_ids(requested):
+    resolved = session_store.resolve_session_id(requested)
+    assert resolved != requested
+    assert session_store.resolve_session_id(resolved) == resolved
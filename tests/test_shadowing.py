@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import media_service
+import shadowing
+from audio_io import ANALYSIS_RATE
+from segmentation import FRAME_MS
+
+
+def _speech(seconds, seed):
+    """类似语音的合成音轨：基频起伏的谐波“音节”，音节间隔都短于停顿的判定长度"""
+    rng = np.random.default_rng(seed)
+    samples = np.zeros(int(seconds * ANALYSIS_RATE), dtype=np.float32)
+    position = int(0.2 * ANALYSIS_RATE)
+    while position < len(samples) - int(0.4 * ANALYSIS_RATE):
+        length = int(ANALYSIS_RATE * rng.uniform(0.12, 0.3))
+        t = np.arange(length) / ANALYSIS_RATE
+        pitch = rng.uniform(100, 240) * (1 + 0.1 * np.sin(2 * np.pi * 3 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / ANALYSIS_RATE
+        samples[position:position + length] = 0.25 * np.hanning(length) * sum(np.sin(k * phase) / k for k in range(1, 8))
+        position += length + int(ANALYSIS_RATE * rng.uniform(0.02, 0.08))
+    return (samples * 32767).astype(np.int16)
+
+
+def _silence(seconds):
+    return np.zeros(int(seconds * ANALYSIS_RATE), dtype=np.int16)
+
+
+# 两段话中间有一次 0.4 秒的停顿
+REFERENCE = np.concatenate((_speech(2, 0), _silence(0.4), _speech(2, 1)))
+
+
+def test_compare_with_itself():
+    report = shadowing.compare(REFERENCE, REFERENCE)
+    assert report["tempo"] == 1.0
+    assert report["timing_error_ms"] <= FRAME_MS
+    assert report["reference_pauses"] == report["attempt_pauses"] == 1
+    assert report["extra_pauses"] == 0
+    assert report["slow_spots"] == report["fast_spots"] == []
+    assert report["similarity"] >= 99
+
+
+def test_compare_time_stretched():
+    positions = np.arange(int(len(REFERENCE) * 1.25)) / 1.25
+    attempt = np.interp(positions, np.arange(len(REFERENCE)), REFERENCE.astype(np.float32)).astype(np.int16)
+    report = shadowing.compare(REFERENCE, np.concatenate((_silence(0.5), attempt)))
+    assert report["tempo"] == pytest.approx(1.25, abs=0.03)
+    # 均匀放慢，按整体语速换算后各处基本不提前也不落后
+    assert report["timing_error_ms"] < 100
+    assert report["extra_pauses"] == 0
+    assert report["start_delay_s"] == pytest.approx(0.5 + 0.25, abs=0.1)
+
+
+def test_compare_inserted_pause():
+    middle = int(1.0 * ANALYSIS_RATE)
+    attempt = np.concatenate((REFERENCE[:middle], _silence(1.0), REFERENCE[middle:]))
+    report = shadowing.compare(REFERENCE, attempt)
+    assert report["attempt_pauses"] == report["reference_pauses"] + 1
+    assert report["extra_pauses"] == 1
+    assert report["longest_pause_s"] == pytest.approx(1.0, abs=0.1)
+    # 停顿前比整体语速提前、停顿后落后，两头相差约等于停顿长度
+    assert report["max_lag_ms"] + report["max_lead_ms"] == pytest.approx(1000, abs=100)
+    assert any(start <= 1.0 <= end for start, end, _ in report["slow_spots"])
+
+
+def test_long_sentence_rejected_before_decoding(monkeypatch):
+    monkeypatch.setattr(media_service, "probe_duration", lambda path: pytest.fail("原句过长时不应探测录音"))
+    with pytest.raises(ValueError):
+        shadowing._align("k", "attempt.webm", _reference, 0, (shadowing.MAX_SENTENCE_SECONDS + 1) * 1000)
+
+
+def _reference():
+    raise AssertionError("过长的录音不应载入原句")
+
+
+def test_long_recording_rejected_before_decoding(monkeypatch):
+    monkeypatch.setattr(media_service, "probe_duration", lambda path: shadowing.MAX_RECORDING_SECONDS + 5.0)
+    monkeypatch.setattr(media_service, "decode_analysis", lambda path: pytest.fail("过长的录音不应解码"))
+    with pytest.raises(ValueError):
+        shadowing._align("k", "attempt.webm", _reference, 0, 1000)
+
+
+def test_recording_without_duration_checked_after_decoding(monkeypatch):
+    track = np.zeros((shadowing.MAX_RECORDING_SECONDS + 1) * ANALYSIS_RATE, dtype=np.int16)
+    monkeypatch.setattr(media_service, "probe_duration", lambda path: None)
+    monkeypatch.setattr(media_service, "decode_analysis", lambda path: (track, {}))
+    with pytest.raises(ValueError):
+        shadowing._align("k", "attempt.webm", _reference, 0, 1000)
+
+
+def test_alignment_decodes_in_the_submitter_session(cache_dir, monkeypatch):
+    sessions = []
+    monkeypatch.setattr(shadowing, "_align", lambda *args: sessions.append(media_service.current_session()) or {})
+    with media_service.session_scope("learner"):
+        future = shadowing.submit("ef" * 32, "attempt.webm", "ab" * 32, _reference, 0, 1000)
+    assert future.result(timeout=5) == {}
+    assert sessions == ["learner"]
@@ -0,0 +1,83 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+import media_service
+import pipeline
+import uploads
+
+
+class Upload(io.BytesIO):
+    """模拟 UploadedFile：带文件名，可选带 size，记录读了多少字节"""
+
+    def __init__(self, data, name="talk.mp3", size=None):
+        super().__init__(data)
+        self.name = name
+        if size is not None:
+            self.size = size
+        self.bytes_read = 0
+
+    def read(self, n=-1):
+        block = super().read(n)
+        self.bytes_read += len(block)
+        return block
+
+
+def _leftovers(cache_dir):
+    return [name for name in os.listdir(cache_dir) if name.startswith(".spool-")] if os.path.exists(cache_dir) else []
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    durations = []
+    monkeypatch.setattr(media_service, "probe_duration", lambda path: durations.append(path) or 60.0)
+    return durations
+
+
+def test_valid_upload_returns_content_key(cache_dir, probe):
+    data = os.urandom(300_000)
+    key, path = uploads.spool(Upload(data), chunk_size=64 * 1024)
+    assert key == hashlib.sha256(data).hexdigest()
+    assert os.path.basename(path) == "source.mp3"
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert _leftovers(cache_dir) == []
+
+
+def test_same_upload_reuses_cached_source(cache_dir, probe):
+    data = os.urandom(1000)
+    first = uploads.spool(Upload(data))
+    assert uploads.spool(Upload(data, name="copy.mp3")) == first
+    assert len(probe) == 1
+
+
+def test_declared_size_over_limit_rejected_without_reading(cache_dir, probe, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_MB", 1)
+    upload = Upload(b"x" * 10, size=2 * 1024 * 1024)
+    with pytest.raises(uploads.UploadRejected):
+        uploads.spool(upload)
+    assert upload.bytes_read == 0
+    assert _leftovers(cache_dir) == []
+
+
+def test_oversized_stream_rejected_before_fully_written(cache_dir, probe, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_MB", 1)
+    chunk_size = 64 * 1024
+    upload = Upload(b"x" * (8 * 1024 * 1024))
+    with pytest.raises(uploads.UploadRejected):
+        uploads.spool(upload, chunk_size=chunk_size)
+    # 超过上限的那一块读到就停，不会把 8MB 都读完
+    assert upload.bytes_read <= 1024 * 1024 + chunk_size
+    assert _leftovers(cache_dir) == []
+    assert probe == []
+
+
+def test_too_long_audio_rejected_and_removed(cache_dir, monkeypatch):
+    monkeypatch.setattr(media_service, "probe_duration", lambda path: uploads.MAX_DURATION_MIN * 60 + 1)
+    data = os.urandom(1000)
+    with pytest.raises(uploads.UploadRejected):
+        uploads.spool(Upload(data))
+    assert _leftovers(cache_dir) == []
+    assert pipeline.find_source(hashlib.sha256(data).hexdigest()) is None
@@ -0,0 +1,52 @@
+import json
+import threading
+from unittest import mock
+
+from tornado.testing import AsyncHTTPTestCase
+
+import media_server
+import warmup
+
+
+class ReadinessTest(AsyncHTTPTestCase):
+    def setUp(self):
+        super().setUp()
+        self.release = threading.Event()
+        # 每个测试用一份新的预热状态；媒体预热阶段等到测试放行才结束
+        for name, value in (
+            ("_thread", None),
+            ("_status", {"ready": False, "stages": {}, "errors": [], "probe_ms": []}),
+            ("_import_modules", lambda models: None),
+            ("_warm_media", lambda: self.release.wait(5)),
+        ):
+            patcher = mock.patch.object(warmup, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def get_app(self):
+        return media_server.make_app()
+
+    def _readyz(self):
+        response = self.fetch("/readyz")
+        self.assertEqual(response.headers["Cache-Control"], "no-store")
+        return response.code, json.loads(response.body)
+
+    def test_ready_without_warmup(self):
+        code, status = self._readyz()
+        self.assertEqual(code, 200)
+        self.assertTrue(status["ready"])
+
+    def test_503_until_warmup_finishes(self):
+        thread = warmup.start(models=[], courses=[])
+        code, status = self._readyz()
+        self.assertEqual(code, 503)
+        self.assertFalse(status["ready"])
+
+        self.release.set()
+        thread.join(5)
+        code, status = self._readyz()
+        self.assertEqual(code, 200)
+        self.assertTrue(status["ready"])
+        self.assertEqual(set(status["stages"]), {"imports", "media", "models", "courses"})
+        self.assertEqual(status["errors"], [])
@@ -0,0 +1,70 @@
+# uploads.py - 上传文件落盘
+#
+# 原来的做法是 UploadedFile.getvalue() 复制出整个文件的 bytes，写进临时文件，
+# 再把临时文件读一遍算哈希、复制一遍进缓存。这里改成一次流式处理：
+#   - 先按上传大小检查上限，超出直接拒绝，不写盘
+#   - 分块（默认 1MB）写入缓存目录下的临时文件，同时计算 sha256
+#   - 用 ffmpeg 只读文件头估计时长，过长的文件在解码前拒绝
+#   - 通过检查后直接改名为 source.<扩展名>，之后各环节只拿缓存内的路径
+# 同一文件已经在缓存里时跳过检查，临时文件直接删除。
+import hashlib
+import os
+import tempfile
+
+import artifact_cache
+import media_service
+import pipeline
+
+# 上传大小上限(MB)，与 Streamlit 默认的 server.maxUploadSize 一致
+MAX_UPLOAD_MB = int(os.environ.get("SHADOWING_MAX_UPLOAD_MB", 200))
+
+# 音频时长上限(分钟)
+MAX_DURATION_MIN = float(os.environ.get("SHADOWING_MAX_DURATION_MIN", 120))
+
+CHUNK_SIZE = 1 << 20
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def spool(uploaded, chunk_size=CHUNK_SIZE):
+    """把上传文件分块写入缓存并计算哈希，返回 (缓存键, 缓存内原文件路径)
+
+    uploaded 是任何可 seek/read 的文件对象（如 UploadedFile），需有 name 属性。
+    超出大小或时长上限时抛出 UploadRejected。
+    """
+    limit = MAX_UPLOAD_MB * 1024 * 1024
+    size = getattr(uploaded, "size", None)
+    if size is not None and size > limit:
+        raise UploadRejected(f"文件大小 {size / 1024 / 1024:.0f} MB，超过 {MAX_UPLOAD_MB} MB 上限")
+
+    suffix = os.path.splitext(uploaded.name)[1].lower() or ".mp3"
+    os.makedirs(artifact_cache.CACHE_DIR, exist_ok=True)
+    # 放在缓存目录里，通过检查后可以直接改名，不再复制
+    fd, spool_path = tempfile.mkstemp(dir=artifact_cache.CACHE_DIR, prefix=".spool-", suffix=suffix)
+    try:
+        digest = hashlib.sha256()
+        written = 0
+        uploaded.seek(0)
+        with os.fdopen(fd, "wb") as f:
+            for block in iter(lambda: uploaded.read(chunk_size), b""):
+                written += len(block)
+                if written > limit:
+                    raise UploadRejected(f"文件超过 {MAX_UPLOAD_MB} MB 上限")
+                digest.update(block)
+                f.write(block)
+        uploaded.seek(0)
+
+        key = digest.hexdigest()
+        source = pipeline.find_source(key)
+        if source is not None:
+            return key, source
+
+        duration = media_service.probe_duration(spool_path)
+        if duration is not None and duration > MAX_DURATION_MIN * 60:
+            raise UploadRejected(f"音频时长 {duration / 60:.1f} 分钟，超过 {MAX_DURATION_MIN:g} 分钟上限")
+        return key, pipeline.store_source(key, spool_path, move=True)
+    finally:
+        if os.path.exists(spool_path):
+            os.unlink(spool_path)
@@ -4,6 +4,10 @@ import os
 import json
 import io
 import base64
+import uploads
+import media_server
+import pipeline
+import waveform
 
 # 页面配置
 st.set_page_config(
@@ -44,8 +48,13 @@ def init_session():
         'sentences': [],  # 每句的内容和开始时间
         'current_sentence': 0,
         'transcripts': [],
+        'completed': 0,  # 已听写的句子数，随听写内容增量更新
         'playback_speed': 1.0,
-        'audio_bytes': None
+        'audio_url': None,  # 整段音频在媒体服务上的地址，页面里不再嵌入音频内容
+        'audio_mime': None,
+        'peaks': None,  # 波形峰值金字塔
+        'peaks_key': None,
+        'audio_duration': None
     }
     for key, value in defaults.items():
         if key not in st.session_state:
@@ -53,6 +62,12 @@ def init_session():
 
 init_session()
 
+def set_transcript(index, text):
+    # 单句听写变化时只调整完成数，不必每次重跑都数一遍
+    was_done = bool(st.session_state.transcripts[index].strip())
+    st.session_state.transcripts[index] = text
+    st.session_state.completed += bool(text.strip()) - was_done
+
 # 侧边栏
 with st.sidebar:
     st.header("⚙️ 设置")
@@ -106,12 +121,33 @@ with tab1:
             # 保存音频数据
             st.session_state.audio_file = uploaded_file
             st.session_state.audio_name = uploaded_file.name
-            st.session_state.audio_bytes = uploaded_file.getvalue()
             
             st.success(f"✅ {uploaded_file.name}")
             
+            # 每个文件只计算一次波形金字塔，之后缩放/切换句子都直接读取
+            if st.session_state.peaks_key != uploaded_file.file_id:
+                st.session_state.peaks = None
+                st.session_state.audio_duration = None
+                st.session_state.audio_url = None
+                try:
+                    # 分块写入共享缓存并计算哈希，超出大小/时长上限的文件在解码前拒绝
+                    key, source = uploads.spool(uploaded_file)
+                    info, _ = pipeline.analyze(source, key)
+                    st.session_state.peaks = pipeline.load_peaks(source, key)
+                    st.session_state.audio_duration = info["duration_ms"] / 1000
+                    full_path, st.session_state.audio_mime = pipeline.delivery_file(key, source)
+                    st.session_state.audio_url = media_server.url(full_path)
+                except uploads.UploadRejected as e:
+                    st.error(str(e))
+                except Exception as e:
+                    st.warning(f"无法生成波形，请手动输入时间: {str(e)}")
+                st.session_state.peaks_key = uploaded_file.file_id
+            
             # 播放完整音频
-            st.audio(st.session_state.audio_bytes, format=f"audio/{uploaded_file.type.split('/')[-1]}")
+            if st.session_state.audio_url:
+                st.audio(st.session_state.audio_url, format=st.session_state.audio_mime)
+            else:
+                st.audio(uploaded_file, format=f"audio/{uploaded_file.type.split('/')[-1]}")
             
             # 手动分割设置
             st.header("2. 手动分割")
@@ -120,13 +156,14 @@ with tab1:
                 if 'sentences' not in st.session_state or not st.session_state.sentences:
                     st.session_state.sentences = []
                     st.session_state.transcripts = []
+                    st.session_state.completed = 0
                 
                 # 添加新句子
                 new_sentence = {
                     "id": len(st.session_state.sentences),
                     "name": f"句子 {len(st.session_state.sentences) + 1}",
-                    "start_time": 0,
-                    "end_time": 0
+                    "start_time": 0.0,
+                    "end_time": 0.0
                 }
                 st.session_state.sentences.append(new_sentence)
                 st.session_state.transcripts.append("")
@@ -177,28 +214,75 @@ with tab1:
             </div>
             """, unsafe_allow_html=True)
             
-            # 时间设置
-            col_time1, col_time2 = st.columns(2)
-            with col_time1:
-                start_time = st.number_input(
-                    "开始时间(秒)",
-                    min_value=0.0,
-                    max_value=1000.0,
-                    value=float(sentence.get('start_time', 0)),
-                    step=0.5,
-                    key=f"start_{current_idx}"
-                )
+            duration_s = st.session_state.audio_duration or 1000.0
+            spans = [(s.get('start_time', 0), s.get('end_time', 0)) for s in st.session_state.sentences]
             
-            with col_time2:
-                end_time = st.number_input(
-                    "结束时间(秒)",
+            if st.session_state.peaks is not None:
+                # 整段波形：绿色为已分割的句子，橙色为当前句子
+                st.vega_lite_chart(
+                    waveform.chart(st.session_state.peaks, 0, duration_s, spans=spans, current=current_idx),
+                    use_container_width=True
+                )
+                
+                # 缩放到当前句子附近，在波形上拖动选择起止时间
+                # 滑块的两端必须同为 float，整数的起止时间（如旧会话里的 0）先转换；
+                # 换成更短的音频后保留下来的句子可能超出结尾，限制在音频时长内
+                sentence_start = min(float(sentence.get('start_time', 0)), duration_s)
+                default_end = min(float(sentence.get('end_time', 0)) or sentence_start + 10, duration_s)
+                zoom = st.slider(
+                    "查看范围(秒)",
                     min_value=0.0,
-                    max_value=1000.0,
-                    value=float(sentence.get('end_time', 10)),
-                    step=0.5,
-                    key=f"end_{current_idx}"
+                    max_value=duration_s,
+                    value=(max(0.0, sentence_start - 5), min(duration_s, default_end + 5)),
+                    step=0.1,
+                    key=f"zoom_{current_idx}"
+                )
+                if zoom[1] - zoom[0] < 0.1:
+                    zoom = (zoom[0], min(duration_s, zoom[0] + 0.1))
+                
+                start_time, end_time = st.slider(
+                    "句子起止(秒)",
+                    min_value=zoom[0],
+                    max_value=zoom[1],
+                    value=(
+                        min(max(sentence_start, zoom[0]), zoom[1]),
+                        min(max(default_end, zoom[0]), zoom[1])
+                    ),
+                    step=0.05,
+                    key=f"range_{current_idx}_{zoom[0]}_{zoom[1]}"
+                )
+                
+                st.vega_lite_chart(
+                    waveform.chart(
+                        st.session_state.peaks, zoom[0], zoom[1],
+                        spans=spans, current=current_idx, selection=(start_time, end_time)
+                    ),
+                    use_container_width=True
                 )
             
+            else:
+                # 时间设置
+                col_time1, col_time2 = st.columns(2)
+                with col_time1:
+                    start_time = st.number_input(
+                        "开始时间(秒)",
+                        min_value=0.0,
+                        max_value=duration_s,
+                        value=float(sentence.get('start_time', 0)),
+                        step=0.5,
+                        key=f"start_{current_idx}"
+                    )
+                
+                with col_time2:
+                    end_time = st.number_input(
+                        "结束时间(秒)",
+                        min_value=0.0,
+                        max_value=duration_s,
+                        value=float(sentence.get('end_time', 10)),
+                        step=0.5,
+                        key=f"end_{current_idx}"
+                    )
+            
             # 更新句子时间
             if start_time != sentence.get('start_time', 0) or end_time != sentence.get('end_time', 10):
                 sentence['start_time'] = start_time
@@ -223,7 +307,8 @@ with tab1:
             # 删除按钮
             if st.button("🗑️ 删除此句", type="secondary"):
                 st.session_state.sentences.pop(current_idx)
-                st.session_state.transcripts.pop(current_idx)
+                if st.session_state.transcripts.pop(current_idx).strip():
+                    st.session_state.completed -= 1
                 # 重新编号
                 for i, s in enumerate(st.session_state.sentences):
                     s['id'] = i
@@ -280,7 +365,10 @@ with tab2:
         st.write(f"**请将音频播放器定位到：{sentence.get('start_time', 0):.1f}秒**")
         
         # 播放完整音频（用户手动控制时间）
-        st.audio(st.session_state.audio_bytes, format=f"audio/{st.session_state.audio_file.type.split('/')[-1]}")
+        if st.session_state.audio_url:
+            st.audio(st.session_state.audio_url, format=st.session_state.audio_mime)
+        else:
+            st.audio(st.session_state.audio_file, format=f"audio/{st.session_state.audio_file.type.split('/')[-1]}")
         
         # 听写区域
         st.subheader("✍️ 听写内容")
@@ -294,7 +382,7 @@ with tab2:
         
         # 保存听写内容
         if transcript != st.session_state.transcripts[current_idx]:
-            st.session_state.transcripts[current_idx] = transcript
+            set_transcript(current_idx, transcript)
         
         # 练习控制
         col_control1, col_control2, col_control3 = st.columns(3)
@@ -314,7 +402,7 @@ with tab2:
         
         with col_control3:
             if st.button("📋 查看进度"):
-                completed = sum(1 for t in st.session_state.transcripts if t.strip())
+                completed = st.session_state.completed
                 total = len(st.session_state.transcripts)
                 st.info(f"完成进度: {completed}/{total} ({completed/total*100:.0f}%)")
         
@@ -346,7 +434,7 @@ with tab2:
         
         # 进度统计
         st.divider()
-        completed = sum(1 for t in st.session_state.transcripts if t.strip())
+        completed = st.session_state.completed
         total = len(st.session_state.transcripts)
         
         col_prog1, col_prog2 = st.columns([3, 1])
@@ -365,7 +453,7 @@ with tab2:
 st.divider()
 st.markdown("""
 <div style="text-align: center; color: #666; padding: 2rem;">
-    <p>🎧 英语听力练习工具 | 简易版 | 零依赖，快速启动</p>
-    <p>💡 提示：本工具完全在浏览器中运行，不保存任何数据到服务器</p>
+    <p>🎧 英语听力练习工具 | 简易版 | 不需要语音识别模型，依赖 numpy 和 ffmpeg</p>
+    <p>💡 提示：上传的音频会按内容缓存在服务器上，用于断句和播放；请勿上传不希望保存的录音</p>
 </div>
 """, unsafe_allow_html=True)
@@ -0,0 +1,230 @@
+# warmup.py - 启动预热与就绪信号
+#
+# 部署后的第一个用户要替所有冷路径买单：导入各模块（开启识别时还有 whisper/torch）、
+# 第一次启动 ffmpeg、加载模型、解码并断句课程音频。用本脚本启动服务时，这些在服务
+# 启动阶段就做完：
+#   python warmup.py app.py [streamlit run 的其他参数]
+# 预热在后台线程里进行，streamlit 在同一进程里启动，导入的模块、加载的模型和
+# artifact_cache 的进程内缓存都与页面共用。预热完成前媒体服务的 /readyz 返回 503，
+# 健康检查指向它即可在预热完成、首次操作的耗时稳定之后再转发流量。
+#
+#   SHADOWING_WARMUP_MODELS=base                        启动时加载的 Whisper 模型，逗号分隔
+#   SHADOWING_WARMUP_COURSES=/srv/course1:/srv/a.mp3    预先处理的课程目录或文件，按系统路径分隔符分隔
+#
+# python warmup.py --once 只预热一遍并打印各阶段耗时，不启动服务。
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+import artifact_cache
+import batch_ingest
+import media_server
+import media_service
+import pipeline
+import waveform
+from asr import get_model
+
+WARMUP_MODELS = [name for name in os.environ.get("SHADOWING_WARMUP_MODELS", "").split(",") if name.strip()]
+WARMUP_COURSES = [path for path in os.environ.get("SHADOWING_WARMUP_COURSES", "").split(os.pathsep) if path]
+
+# 页面用到的模块，启动时先导入
+PRELOAD_MODULES = (
+    "pipeline", "segmentation", "shadowing", "shadowing_ui", "stats_ui", "waveform", "uploads", "session_bundle",
+    "session_store", "review_scheduler", "practice_stats", "recorder",
+)
+
+# 首次操作的耗时最多测几轮；相邻两轮相差不到 25% 算稳定
+PROBE_ROUNDS = 10
+PROBE_TOLERANCE = 0.25
+
+_LOGGER = logging.getLogger(__name__)
+
+_status = {"ready": False, "stages": {}, "errors": [], "probe_ms": []}
+_lock = threading.Lock()
+_thread = None
+
+
+def status():
+    """预热状态：是否就绪、各阶段耗时(秒)、出错信息、首次操作的各轮耗时(ms)
+
+    没有经本模块启动预热（直接 streamlit run）时视为就绪。
+    """
+    with _lock:
+        return {
+            "ready": _status["ready"] or _thread is None,
+            "stages": dict(_status["stages"]),
+            "errors": list(_status["errors"]),
+            "probe_ms": list(_status["probe_ms"]),
+        }
+
+
+def _error(stage, error):
+    _LOGGER.warning("预热 %s 失败: %s", stage, error)
+    with _lock:
+        _status["errors"].append(f"{stage}: {error}")
+
+
+def _stage(name, func, *args):
+    started = time.perf_counter()
+    try:
+        func(*args)
+    except Exception as e:
+        _error(name, e)
+    with _lock:
+        _status["stages"][name] = round(time.perf_counter() - started, 2)
+
+
+def _import_modules(models):
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    if models:
+        importlib.import_module("whisper")
+
+
+def _warm_media():
+    """合成一秒的音频，走一遍 ffmpeg 探测、解码队列和各特征计算"""
+    import segmentation
+    import shadowing
+    directory = tempfile.mkdtemp(prefix="shadowing_warmup_")
+    path = os.path.join(directory, "tone.wav")
+    try:
+        t = np.arange(44100) / 44100
+        samples = (np.sin(2 * np.pi * 220 * t) * 8000 * (t < 0.6)).astype(np.int16)
+        with wave.open(path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(44100)
+            f.writeframes(samples.tobytes())
+        media_service.probe_duration(path)
+        track, _ = media_service.decode_analysis(path)
+        segmentation.compute_envelope(track)
+        segmentation.speech_probability(track)
+        shadowing.compare(track, track)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+        os.rmdir(directory)
+
+
+def _load_models(models):
+    for name in models:
+        get_model(name)
+
+
+def warm_course(path, params=pipeline.DEFAULT_PARAMS, codec=pipeline.DEFAULT_CODEC):
+    """按网页端默认参数把一个课程文件处理一遍，返回 (缓存键, 缓存内原文件路径)
+
+    原文件也放进缓存，学生上传同一文件时直接命中，不再探测时长、复制文件。
+    """
+    key = artifact_cache.file_hash(path)
+    source, _ = pipeline.delivery_file(key, path)
+    batch_ingest.process_file(source, params, codec)
+    if codec != pipeline.DEFAULT_CODEC:
+        pipeline.delivery_file(key, source, codec)
+    pipeline.load_peaks(source, key)
+    return key, source
+
+
+def _course_files(courses):
+    for course in courses:
+        if os.path.isdir(course):
+            yield from batch_ingest.find_audio_files(course)
+        else:
+            yield course
+
+
+def _warm_courses(courses, warmed):
+    for path in _course_files(courses):
+        try:
+            warmed.append(warm_course(path))
+        except Exception as e:
+            _error(f"course {path}", e)
+
+
+def first_interaction(key, source, params=pipeline.DEFAULT_PARAMS, codec=pipeline.DEFAULT_CODEC):
+    """上传一个已预处理文件后页面要做的事：读分析结果、预览断句、载入句子、画波形"""
+    info, features = pipeline.analyze(source, key, params.get("segmenter", pipeline.DEFAULT_SEGMENTER))
+    spans = pipeline.find_spans(info, features, params)
+    pipeline.load_sentences(key, params, codec)
+    waveform.chart(
+        pipeline.load_peaks(source, key), 0, info["duration_ms"] / 1000,
+        spans=[(start / 1000, end / 1000) for start, end in spans]
+    )
+
+
+def _probe(warmed):
+    """反复走首次操作，直到耗时稳定"""
+    for _ in range(PROBE_ROUNDS):
+        started = time.perf_counter()
+        for key, source in warmed:
+            first_interaction(key, source)
+        elapsed = round((time.perf_counter() - started) * 1000, 1)
+        with _lock:
+            _status["probe_ms"].append(elapsed)
+            timings = list(_status["probe_ms"])
+        if len(timings) >= 2 and abs(timings[-1] - timings[-2]) <= PROBE_TOLERANCE * timings[-2]:
+            break
+
+
+def run(models=WARMUP_MODELS, courses=WARMUP_COURSES):
+    """依次执行导入之后的各预热阶段，完成后标记就绪；单个阶段出错只记录，不阻止就绪"""
+    warmed = []
+    # 预热的 ffmpeg 任务单独一个队列，与学习者轮流执行
+    with media_service.session_scope("warmup"):
+        _stage("media", _warm_media)
+        _stage("models", _load_models, models)
+        _stage("courses", _warm_courses, courses, warmed)
+        if warmed:
+            _stage("probe", _probe, warmed)
+    with _lock:
+        _status["ready"] = True
+    _LOGGER.info("预热完成: %s", _status["stages"])
+
+
+def start(models=WARMUP_MODELS, courses=WARMUP_COURSES):
+    """在调用线程里导入模块，其余预热放到后台线程；进程内只启动一次
+
+    导入不放进后台线程：与 streamlit 启动同时在两个线程里导入同一批模块会互相等模块锁。
+    """
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return _thread
+        _thread = threading.Thread(target=run, args=(models, courses), name="warmup", daemon=True)
+    _stage("imports", _import_modules, models)
+    _thread.start()
+    return _thread
+
+
+def main(argv):
+    if argv[:1] == ["--once"]:
+        start().join()
+        print(json.dumps(status(), ensure_ascii=False, indent=2))
+        return 1 if status()["errors"] else 0
+    if not argv:
+        print("用法：python warmup.py app.py [streamlit run 的其他参数]  或  python warmup.py --once")
+        return 1
+
+    from streamlit.web import cli
+    start()
+    # 预热开始后再起媒体服务，/readyz 不会在预热完成前返回就绪
+    media_server.start()
+    sys.argv = ["streamlit", "run", *argv]
+    return cli.main()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # 健康检查频繁访问 /readyz，成功的请求不记日志
+    logging.getLogger("tornado.access").setLevel(logging.WARNING)
+    # 经模块名调用，媒体服务 /readyz 读到的是同一份预热状态
+    import warmup
+    sys.exit(warmup.main(sys.argv[1:]))
@@ -0,0 +1,118 @@
+# waveform.py - 多分辨率波形（最小/最大峰值金字塔）
+#
+# 第 0 层每 BASE_BLOCK 个采样取一对 (min, max)，往上每层把 FACTOR 个块合并成一个。
+# 画某个时间范围时只读取刚好够用的那一层，再压缩到屏幕宽度，
+# 所以无论文件多长，每次绘制的计算量只和图宽有关。
+import numpy as np
+
+from audio_io import ANALYSIS_RATE
+
+BASE_BLOCK = 64  # 16kHz 下为 4ms
+FACTOR = 4
+# 最顶层的块数不超过这个值就停止
+TOP_SIZE = 1024
+
+
+def build_pyramid(track, base_block=BASE_BLOCK, factor=FACTOR):
+    """由分析音轨构建峰值金字塔，返回 [(n, 2) int16 数组, ...]，第 0 层最精细"""
+    n_blocks = -(-len(track) // base_block)
+    padded = np.zeros(n_blocks * base_block, dtype=np.int16)
+    padded[:len(track)] = track
+    blocks = padded.reshape(n_blocks, base_block)
+    levels = [np.stack((blocks.min(axis=1), blocks.max(axis=1)), axis=1)]
+
+    while len(levels[-1]) > TOP_SIZE:
+        prev = levels[-1]
+        n = -(-len(prev) // factor)
+        # 用最后一块补齐，不影响 min/max
+        padded = np.concatenate((prev, np.repeat(prev[-1:], n * factor - len(prev), axis=0)))
+        grouped = padded.reshape(n, factor, 2)
+        levels.append(np.stack((grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1)), axis=1))
+    return levels
+
+
+def block_seconds(level, sample_rate=ANALYSIS_RATE):
+    return BASE_BLOCK * FACTOR ** level / sample_rate
+
+
+def view(levels, start_s, end_s, width=800):
+    """取 [start_s, end_s) 范围内压缩到 width 列的波形，返回 (时间, 最小值, 最大值)"""
+    span = max(end_s - start_s, 1e-6)
+    # 选块数仍不少于 width 的最粗一层
+    level = 0
+    while level + 1 < len(levels) and span / block_seconds(level + 1) >= width:
+        level += 1
+
+    peaks = levels[level]
+    seconds = block_seconds(level)
+    first = max(0, int(start_s / seconds))
+    last = min(len(peaks), int(np.ceil(end_s / seconds)))
+    segment = peaks[first:last]
+    if len(segment) == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return empty, empty, empty
+
+    edges = np.linspace(0, len(segment), min(width, len(segment)) + 1).astype(np.int64)[:-1]
+    mins = np.minimum.reduceat(segment[:, 0], edges) / 32768
+    maxs = np.maximum.reduceat(segment[:, 1], edges) / 32768
+    times = (first + edges) * seconds
+    return times, mins, maxs
+
+
+def chart(levels, start_s, end_s, spans=(), current=None, selection=None, width=800, height=120):
+    """波形图（交给 st.vega_lite_chart 的 vega-lite 描述），标出句子边界、当前句子和正在编辑的范围
+
+    不经 altair：streamlit 转换 altair 图表时会临时替换 altair 全局的 data transformer，
+    多个会话同时绘图会互相串数据。
+    """
+    times, mins, maxs = view(levels, start_s, end_s, width)
+    x_title = "时间(秒)"
+    layers = []
+
+    visible = [
+        (i, s, e) for i, (s, e) in enumerate(spans)
+        if e >= start_s and s <= end_s
+    ]
+    if visible:
+        regions = {"values": [
+            {"start": max(s, start_s), "end": min(e, end_s), "current": i == current}
+            for i, s, e in visible
+        ]}
+        layers.append({
+            "data": regions,
+            "mark": {"type": "rect", "opacity": 0.15},
+            "encoding": {
+                "x": {"field": "start", "type": "quantitative", "title": x_title},
+                "x2": {"field": "end"},
+                "color": {"condition": {"test": "datum.current", "value": "#FB8C00"}, "value": "#43A047"},
+            },
+        })
+        layers.append({
+            "data": regions,
+            "mark": {"type": "rule", "color": "#43A047"},
+            "encoding": {"x": {"field": "start", "type": "quantitative", "title": x_title}},
+        })
+
+    layers.append({
+        "data": {"values": [
+            {"time": t, "min": lo, "max": hi}
+            for t, lo, hi in zip(times.tolist(), mins.tolist(), maxs.tolist())
+        ]},
+        "mark": {"type": "area", "color": "#1E88E5", "opacity": 0.8},
+        "encoding": {
+            "x": {"field": "time", "type": "quantitative", "title": x_title,
+                  "scale": {"domain": [start_s, end_s], "nice": False}},
+            "y": {"field": "min", "type": "quantitative", "title": None,
+                  "scale": {"domain": [-1, 1]}, "axis": None},
+            "y2": {"field": "max"},
+        },
+    })
+
+    if selection is not None:
+        layers.append({
+            "data": {"values": [{"time": t} for t in selection]},
+            "mark": {"type": "rule", "color": "#E53935", "strokeWidth": 2},
+            "encoding": {"x": {"field": "time", "type": "quantitative", "title": x_title}},
+        })
+
+    return {"layer": layers, "height": height}